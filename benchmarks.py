@@ -0,0 +1,375 @@
+"""
+Benchmarks comparing the optimized code paths against the functions they replace.
+
+Each candidate runs in its own spawned process so the reported peak RSS belongs to
+that candidate only.
+"""
+import importlib
+import multiprocessing
+import resource
+import time
+from config import *
+
+
+def _peak_rss_mb():
+    # ru_maxrss is reported in KB on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _frame_memory_mb(result):
+    if isinstance(result, pd.DataFrame):
+        return result.memory_usage(deep=True).sum() / 1024 ** 2
+    if isinstance(result, dict):
+        return sum(_frame_memory_mb(value) for value in result.values())
+    return 0.0
+
+
+def _timed_call(module_name, func_name, args, kwargs):
+    func = getattr(importlib.import_module(module_name), func_name)
+    rss_before = _peak_rss_mb()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    return {
+        "seconds": elapsed,
+        "peak_rss_mb": _peak_rss_mb(),
+        "rss_growth_mb": _peak_rss_mb() - rss_before,
+        "result_mb": _frame_memory_mb(result),
+    }
+
+
+def _run_isolated(module_name, func_name, *args, **kwargs):
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        return pool.apply(_timed_call, (module_name, func_name, args, kwargs))
+
+
+def _print_report(title, rows):
+    report = pd.DataFrame(rows)
+    print(f"\n{'='*60}")
+    print(title)
+    print(f"{'='*60}")
+    print(report.to_string(index=False, float_format=lambda x: f"{x:,.2f}"))
+    return report
+
+
+def benchmark_static_loaders(base_dir, backends=("pyarrow", "duckdb")):
+    """
+    Compare load time and memory of load_GTF_static_data_v2 against the typed
+    load_GTF_static_data_v3 for each backend.
+
+    Parameters
+    ----------
+    base_dir : directory holding the extracted GTFS txt files
+
+    backends : backends of load_GTF_static_data_v3 to include
+
+    Returns
+    -------
+    pd.DataFrame with seconds, peak_rss_mb, rss_growth_mb and result_mb per loader
+    """
+    rows = [{"loader": "load_GTF_static_data_v2",
+             **_run_isolated("data_loader", "load_GTF_static_data_v2", base_dir)}]
+    for backend in backends:
+        rows.append({"loader": f"load_GTF_static_data_v3 ({backend})",
+                     **_run_isolated("data_loader", "load_GTF_static_data_v3", base_dir, backend=backend)})
+    return _print_report("GTFS static loader benchmark", rows)
+
+
+def _time_in_process(func, *args, repeat=3, **kwargs):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_trip_id_parsing(stop_times_df, repeat=3):
+    """
+    Compare extract_stop_times_features (parse_trip_ids on unique trip_ids) against
+    the per-row str.split / str.extract extract_stop_times_features_v1.
+
+    Parameters
+    ----------
+    stop_times_df : stop_times DataFrame with a 'trip_id' column
+
+    repeat : runs per candidate, the best time is reported
+
+    Returns
+    -------
+    pd.DataFrame with the best time of each implementation
+    """
+    from feature_engineering_v2 import extract_stop_times_features, extract_stop_times_features_v1
+
+    rows = [
+        {"implementation": "per-row str.split / str.extract",
+         "seconds": _time_in_process(extract_stop_times_features_v1, stop_times_df, repeat=repeat)},
+        {"implementation": "parse_trip_ids (unique trip_ids)",
+         "seconds": _time_in_process(extract_stop_times_features, stop_times_df, repeat=repeat)},
+    ]
+    print(f"rows: {len(stop_times_df):,} | unique trip_ids: {stop_times_df['trip_id'].nunique():,}")
+    return _print_report("trip_id parsing benchmark", rows)
+
+
+def benchmark_route_long_name_features(routes_df, n_rows=1_000_000, repeat=1):
+    """
+    Compare feature_engineering_for_route_long_name (unique names + vectorized
+    str.contains) against the row-wise feature_engineering_for_route_long_name_v1 on a
+    frame of n_rows rows sampled from routes_df, as after joining routes to stop rows.
+
+    Parameters
+    ----------
+    routes_df : routes DataFrame with a 'route_long_name' column
+
+    n_rows : size of the simulated joined frame (by default 1,000,000)
+
+    repeat : runs per candidate, the best time is reported
+
+    Returns
+    -------
+    pd.DataFrame with the best time of each implementation
+    """
+    from feature_engineering_v2 import FeatureEngineeringRouteDf
+
+    engine = FeatureEngineeringRouteDf()
+    joined = routes_df[['route_long_name']].sample(n=n_rows, replace=True, random_state=42)
+
+    rows = [
+        {"implementation": "row-wise .apply (v1)",
+         "seconds": _time_in_process(engine.feature_engineering_for_route_long_name_v1, joined, repeat=repeat)},
+        {"implementation": "unique names + str.contains",
+         "seconds": _time_in_process(engine.feature_engineering_for_route_long_name, joined, repeat=repeat)},
+    ]
+    print(f"rows: {len(joined):,} | unique route_long_name: {joined['route_long_name'].nunique():,}")
+    return _print_report("route_long_name feature benchmark", rows)
+
+
+def _convert_snapshots_v1(paths):
+    from data_loader import convert_GTF_realtime_data_to_df_v1
+    return pd.concat([convert_GTF_realtime_data_to_df_v1(path) for path in paths], ignore_index=True)
+
+
+def benchmark_realtime_decoder(snapshot_dir, worker_counts=None, repeat=1):
+    """
+    Decoding throughput (snapshots/sec and records/sec) of the per-record dict
+    convert_GTF_realtime_data_to_df_v1 against the columnar realtime_decoder, for a
+    directory of saved tripUpdates .pb snapshots.
+
+    Parameters
+    ----------
+    snapshot_dir : directory of .pb snapshots (or the SnapshotWriter output directory)
+
+    worker_counts : process counts to run the columnar decoder with (by default 1 and
+                    the number of CPUs)
+
+    repeat : runs per candidate, the best time is reported
+
+    Returns
+    -------
+    pd.DataFrame with seconds, snapshots_per_sec and records_per_sec per decoder
+    """
+    from realtime_decoder import decode_trip_update_files, snapshot_files
+
+    paths = snapshot_files(snapshot_dir)
+    worker_counts = worker_counts or sorted({1, os.cpu_count() or 1})
+    n_records = decode_trip_update_files(paths).num_rows
+
+    candidates = [("dict per record (v1)", lambda: _convert_snapshots_v1(paths))]
+    for workers in worker_counts:
+        candidates.append((f"columnar decoder ({workers} proc)",
+                           lambda workers=workers: decode_trip_update_files(paths, max_workers=workers)))
+
+    rows = []
+    for name, func in candidates:
+        seconds = _time_in_process(func, repeat=repeat)
+        rows.append({"decoder": name, "seconds": seconds,
+                     "snapshots_per_sec": len(paths) / seconds, "records_per_sec": n_records / seconds})
+    print(f"snapshots: {len(paths):,} | records: {n_records:,}")
+    return _print_report("GTFS-rt decoder benchmark", rows)
+
+
+def benchmark_compute_crowd(df, repeat=1):
+    """
+    Compare crowd.compute_crowd (rolling median over sorted group segments) against
+    compute_crowd_v1 (groupby.transform with a rolling lambda per route/stop).
+
+    Parameters
+    ----------
+    df : frame with 'route_id', 'stop_id' and 'arrival_time_real'
+
+    repeat : runs per candidate, the best time is reported
+
+    Returns
+    -------
+    pd.DataFrame with the best time of each implementation
+    """
+    import crowd
+
+    rows = [
+        {"implementation": "groupby.transform rolling lambda (v1)",
+         "seconds": _time_in_process(crowd.compute_crowd_v1, df, repeat=repeat)},
+        {"implementation": "sorted-segment rolling median",
+         "seconds": _time_in_process(crowd.compute_crowd, df, repeat=repeat)},
+    ]
+    print(f"rows: {len(df):,} | route/stop groups: {len(df[['route_id', 'stop_id']].drop_duplicates()):,}")
+    return _print_report("compute_crowd benchmark", rows)
+
+
+
+# largest relative difference accepted against the geodesic output of the original
+# calculate_ets: vincenty (the default) solves the WGS-84 ellipsoid like geopy, the
+# opt-in haversine sphere is off it by up to ~0.5% (north-south segments)
+ETS_TOLERANCES = {"haversine": 0.006, "vincenty": 1e-6}
+
+
+def benchmark_calculate_ets(df, methods=("haversine", "vincenty"), repeat=1):
+    """
+    Compare calculate_ets for each distance method against the original per-trip
+    geopy geodesic implementation (calculate_ets_v1), on time and on output: the largest relative
+    difference of distance_km and speed_kmh must stay within ETS_TOLERANCES
+    (0.6% for haversine, 1e-6 for vincenty).
+
+    Parameters
+    ----------
+    df : fixture frame with 'trip_id', 'stop_sequence', 'arrival_time_real',
+         'departure_time_real', 'stop_lat' and 'stop_lon' (e.g. a sample of a feed's
+         stop_times joined to its stops)
+
+    methods : calculate_ets methods to compare
+
+    repeat : runs per candidate, the best time is reported
+
+    Returns
+    -------
+    pd.DataFrame with the best time, max_rel_error and within_tolerance per implementation
+    """
+    from feature_engineering_v1 import calculate_ets, calculate_ets_v1
+
+    reference = calculate_ets_v1(df)
+    rows = [{"implementation": "per-trip geopy geodesic (v1)",
+             "seconds": _time_in_process(calculate_ets_v1, df, repeat=repeat),
+             "max_rel_error": 0.0, "within_tolerance": True}]
+    for method in methods:
+        result = calculate_ets(df, method=method)
+        errors = []
+        for column in ['distance_km', 'speed_kmh']:
+            expected = reference[column].to_numpy(dtype=np.float64)
+            actual = result[column].to_numpy(dtype=np.float64)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                errors.append(np.nanmax(np.where(expected != 0, np.abs(actual / expected - 1), np.abs(actual)), initial=0.0))
+        max_error = max(errors)
+        within = bool(max_error <= ETS_TOLERANCES[method]
+                      and np.array_equal(result['travel_time_seconds'], reference['travel_time_seconds']))
+        rows.append({"implementation": f"calculate_ets ({method})",
+                     "seconds": _time_in_process(calculate_ets, df, method=method, repeat=repeat),
+                     "max_rel_error": max_error, "within_tolerance": within})
+        print(f"{'✅' if within else '⚠️'} {method}: max relative difference {max_error:.2e} "
+              f"(tolerance {ETS_TOLERANCES[method]:.0e})")
+    print(f"rows: {len(df):,} | trips: {df['trip_id'].nunique():,}")
+    return _print_report("calculate_ets benchmark", rows)
+
+
+def _current_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _reset_peak_rss():
+    # linux only: writing 5 to clear_refs resets the VmHWM peak of the process
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def _vm_peak_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return _peak_rss_mb()
+
+
+def run_static_pipeline(tables, inplace=False):
+    """
+    The notebook's static pipeline on loaded GTFS tables: the clean_* functions and
+    the route / stop / stop_times / trip features, chained as in the notebook, with
+    or without utils.pipeline_mode. Each raw table is popped from tables, so it can
+    be released once it is cleaned.
+
+    Returns
+    -------
+    dict {table_name: featured DataFrame}
+    """
+    import preprocessing
+    import feature_engineering_v2
+    from utils import pipeline_mode
+
+    with pipeline_mode(inplace=inplace):
+        routes_df = preprocessing.clean_routes_data(tables.pop("routes"))
+        stops_df = preprocessing.clean_stops_data(tables.pop("stops"))
+        stop_times_df = preprocessing.clean_stop_times_data(tables.pop("stop_times"))
+        trips_df = preprocessing.clean_trips_data(tables.pop("trips"))
+
+        return {
+            "routes": feature_engineering_v2.FeatureEngineeringRouteDf().apply_all_feature_engineering(routes_df),
+            "stops": feature_engineering_v2.extract_stops_features(stops_df),
+            "stop_times": feature_engineering_v2.extract_stop_times_features(stop_times_df),
+            "trips": feature_engineering_v2.extract_trip_features(trips_df),
+        }
+
+
+def _static_pipeline_memory(base_dir, inplace, loader):
+    import contextlib
+    import ctypes
+    import io
+    import data_loader
+
+    tables = getattr(data_loader, loader)(base_dir)
+    tables = {name: tables[name] for name in ["routes", "stops", "stop_times", "trips"]}
+    # hand the loader's freed buffers back to the OS, then report only the pipeline's peak
+    ctypes.CDLL("libc.so.6").malloc_trim(0)
+    loaded_mb = _current_rss_mb()
+    _reset_peak_rss()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run_static_pipeline(tables, inplace=inplace)
+    return {
+        "seconds": time.perf_counter() - start,
+        "loaded_rss_mb": loaded_mb,
+        "peak_rss_mb": _vm_peak_rss_mb(),
+        "rss_growth_mb": _vm_peak_rss_mb() - loaded_mb,
+        "result_mb": _frame_memory_mb(result),
+    }
+
+
+def benchmark_pipeline_memory(base_dir, loader="load_GTF_static_data_v2"):
+    """
+    Peak RSS of the full static pipeline (run_static_pipeline) with the defensive
+    copies of every function, against utils.pipeline_mode. Each mode runs in its
+    own spawned process; the feed is loaded first and the peak is reset after
+    loading (linux /proc), so the reported peak is the pipeline's.
+
+    Parameters
+    ----------
+    base_dir : directory holding the extracted GTFS txt files
+
+    loader : data_loader function loading the tables (by default load_GTF_static_data_v2)
+
+    Returns
+    -------
+    pd.DataFrame with seconds, loaded_rss_mb, peak_rss_mb, rss_growth_mb and result_mb per mode
+    """
+    ctx = multiprocessing.get_context("spawn")
+    rows = []
+    for mode, inplace in [("copy per function", False), ("pipeline_mode (in place)", True)]:
+        with ctx.Pool(1) as pool:
+            rows.append({"mode": mode, **pool.apply(_static_pipeline_memory, (base_dir, inplace, loader))})
+    report = _print_report("Static pipeline memory benchmark", rows)
+    saved = report["peak_rss_mb"].iloc[0] - report["peak_rss_mb"].iloc[1]
+    growth_saved = report["rss_growth_mb"].iloc[0] - report["rss_growth_mb"].iloc[1]
+    print(f"Peak RSS reduction: {saved:,.2f} MB ({100 * saved / report['peak_rss_mb'].iloc[0]:.1f}%), "
+          f"pipeline growth {growth_saved:,.2f} MB ({100 * growth_saved / report['rss_growth_mb'].iloc[0]:.1f}%)")
+    return report
@@ -0,0 +1,416 @@
+from config import *
+
+
+# crowd_score bin edges: <= 0.7 low (0), <= 1.4 medium (1), above high (2)
+CROWD_BINS = [-np.inf, 0.7, 1.4, np.inf]
+CROWD_LABELS = [0, 1, 2]
+
+
+def group_starts(df, keys):
+    """
+    For a frame sorted by keys, the position where each row's group starts, and
+    whether every row has all its keys (rows with a missing key belong to no group,
+    as in groupby).
+    """
+    n = len(df)
+    is_start = np.zeros(n, dtype=bool)
+    if n:
+        is_start[0] = True
+    key_valid = np.ones(n, dtype=bool)
+    for key in keys:
+        values = df[key]
+        key_valid &= values.notna().to_numpy()
+        values = values.cat.codes.to_numpy() if isinstance(values.dtype, pd.CategoricalDtype) else values.to_numpy()
+        is_start[1:] |= values[1:] != values[:-1]
+    starts = np.maximum.accumulate(np.where(is_start, np.arange(n), 0))
+    return starts, key_valid
+
+
+def rolling_median_segments(values, starts, window=20, min_periods=5, chunk_size=250_000):
+    """
+    Rolling median over contiguous sorted group segments, equal to
+    groupby(...).transform(lambda x: x.rolling(window, min_periods).median()).
+
+    Every row's window is a row of a sliding_window_view; entries before the row's
+    group start and NaNs are masked to +inf, so after sorting each window the median
+    is read from the first `count` entries. Runs chunk by chunk to bound memory.
+
+    Parameters
+    ----------
+    values : float array, sorted by group (and by time inside each group)
+
+    starts : position of each row's group start (see group_starts)
+
+    window, min_periods : as in pd.Series.rolling
+
+    Returns
+    -------
+    np.ndarray of float64 (NaN where fewer than min_periods values are available)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    result = np.full(n, np.nan)
+    if n == 0:
+        return result
+
+    padded = np.concatenate([np.full(window - 1, np.nan), values])
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window)
+    offsets = np.arange(window) - (window - 1)
+
+    for begin in range(0, n, chunk_size):
+        end = min(begin + chunk_size, n)
+        block = windows[begin:end].copy()
+        positions = np.arange(begin, end)[:, None] + offsets
+        block[(positions < starts[begin:end, None]) | np.isnan(block)] = np.inf
+        block.sort(axis=1)
+
+        count = np.isfinite(block).sum(axis=1)
+        enough = count >= min_periods
+        rows = np.flatnonzero(enough)
+        low = block[rows, (count[rows] - 1) // 2]
+        high = block[rows, count[rows] // 2]
+        result[begin + rows] = (low + high) / 2
+    return result
+
+
+def _fill_with_median(values):
+    missing = np.isnan(values)
+    if missing.any() and not missing.all():
+        values = np.where(missing, np.median(values[~missing]), values)
+    return values
+
+
+def compute_crowd(df, time_column="arrival_time_real", group_keys=("route_id", "stop_id"),
+                  window=20, min_periods=5):
+    """
+    Headway-based crowd labels, vectorized.
+
+    Same output as the notebook's compute_crowd (kept as compute_crowd_v1): rows are
+    sorted by route, stop and arrival; actual_headway_sec is the time since the
+    previous arrival at the same route/stop (first arrival: global median);
+    scheduled_headway_sec is the rolling median of the last `window` headways (at
+    least `min_periods`, otherwise the global median); crowd_score is their ratio and
+    crowd its 3-class label (CROWD_BINS). The rolling median runs over sorted group
+    segments with rolling_median_segments instead of one Python lambda per group.
+
+    Parameters
+    ----------
+    df : realtime rows merged with static data
+
+    time_column : arrival time column (by default "arrival_time_real"), timestamps
+                  or epoch seconds
+
+    group_keys : columns defining a headway series (by default route_id, stop_id)
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    group_keys = list(group_keys)
+    df = df.copy()
+    # numeric arrival times are epoch seconds (realtime_decoder / TripUpdateCollector)
+    unit = "s" if pd.api.types.is_numeric_dtype(df[time_column]) else None
+    df[time_column] = pd.to_datetime(df[time_column], unit=unit)
+    df = df.sort_values(group_keys + [time_column])
+
+    starts, key_valid = group_starts(df, group_keys)
+    times = df[time_column].to_numpy(dtype="datetime64[ns]")
+    seconds = np.where(np.isnat(times), np.nan, times.astype(np.int64) / 1e9)
+
+    headway = np.full(len(df), np.nan)
+    headway[1:] = seconds[1:] - seconds[:-1]
+    headway[(starts == np.arange(len(df))) | ~key_valid] = np.nan
+    headway = _fill_with_median(headway)
+
+    # rows with a missing key are in no group: no rolling value, only the global fill
+    scheduled = rolling_median_segments(np.where(key_valid, headway, np.nan), starts, window, min_periods)
+    scheduled[~key_valid] = np.nan
+    scheduled = _fill_with_median(scheduled)
+
+    df["actual_headway_sec"] = headway
+    df["scheduled_headway_sec"] = scheduled
+    df["crowd_score"] = headway / scheduled
+    df["crowd"] = np.digitize(df["crowd_score"].to_numpy(), CROWD_BINS[1:-1], right=True)
+    return df
+
+
+def compute_crowd_v1(df):
+    df = df.copy()
+
+    # Ensure timestamps are datetime
+    df['arrival_time_real'] = pd.to_datetime(df['arrival_time_real'])
+
+    # Sort properly
+    df = df.sort_values(['route_id', 'stop_id', 'arrival_time_real'])
+
+    # Compute actual headway per route-stop
+    df['actual_headway_sec'] = df.groupby(['route_id', 'stop_id'])['arrival_time_real']\
+                                 .diff().dt.total_seconds()
+
+    # Replace NaN for first bus of the day
+    df['actual_headway_sec'] = df['actual_headway_sec'].fillna(df['actual_headway_sec'].median())
+
+    # Compute "scheduled" headway as rolling median based on historical behavior
+    df['scheduled_headway_sec'] = df.groupby(['route_id', 'stop_id'])['actual_headway_sec']\
+                                    .transform(lambda x: x.rolling(20, min_periods=5).median())
+
+    # Fill any NaNs with global median
+    df['scheduled_headway_sec'] = df['scheduled_headway_sec']\
+                                  .fillna(df['scheduled_headway_sec'].median())
+
+    # Compute congestion score
+    df['crowd_score'] = df['actual_headway_sec'] / df['scheduled_headway_sec']
+
+    # Convert to categorical crowding classes
+    df['crowd'] = pd.cut(
+        df['crowd_score'],
+        bins=CROWD_BINS,
+        labels=CROWD_LABELS  # 0=low, 1=med, 2=high
+    ).astype(int)
+
+    return df
+
+
+def _epoch_seconds(value):
+    # numeric arrival times are epoch seconds (realtime_decoder), others timestamps
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    return pd.Timestamp(value).value / 1e9
+
+
+def _epoch_seconds_array(values):
+    """Epoch seconds (float, NaN when missing) of a Series of timestamps or epoch seconds."""
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=np.float64, na_value=np.nan)
+    times = pd.to_datetime(values)
+    if times.dt.tz is not None:
+        times = times.dt.tz_convert("UTC").dt.tz_localize(None)
+    times = times.to_numpy(dtype="datetime64[ns]")
+    seconds = times.astype(np.int64) / 1e9
+    seconds[np.isnat(times)] = np.nan
+    return seconds
+
+
+class OnlineCrowdEstimator():
+    """
+    Incremental crowd labels per (route_id, stop_id) for live predictions.
+
+    Every (route, stop) gets a slot in compact arrays: the last arrival (epoch
+    seconds), a ring buffer of its last `window` headways and the same headways kept
+    sorted. An arrival computes its headway, replaces the oldest headway of the sorted
+    window (np.searchsorted, O(log window) plus a short shift) and reads the median
+    straight from the middle, so crowd_score and crowd are available immediately.
+    Scores follow compute_crowd: headway / rolling median, binned with CROWD_BINS.
+
+    Live feeds re-emit the prediction of the same trip on every poll, so each slot
+    also keeps the trip_id of its last arrival: when that trip comes back, its
+    arrival is replaced and its headway recomputed instead of being counted as a
+    new arrival. Other arrivals not later than the slot's last arrival (repeated or
+    out-of-order predictions) leave the state unchanged and get no label.
+
+    Arrival times may be timestamps or epoch seconds (the Int64 arrival_time of
+    realtime_decoder).
+
+    Parameters
+    ----------
+    window, min_periods : rolling median window, as in compute_crowd (20 / 5)
+
+    fallback_headway_sec : headway used for a first arrival and as scheduled headway
+                           while a slot has fewer than min_periods headways, e.g.
+                           the offline median; None leaves those rows unlabeled
+
+    capacity : initial number of slots (arrays double when full)
+    """
+
+    def __init__(self, window=20, min_periods=5, fallback_headway_sec=None, capacity=1024):
+        self.window = window
+        self.min_periods = min_periods
+        self.fallback_headway_sec = np.nan if fallback_headway_sec is None else float(fallback_headway_sec)
+        self.slots = {}
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.last_arrival = np.full(capacity, np.nan)
+        self.previous_arrival = np.full(capacity, np.nan)
+        self.last_trip = np.full(capacity, "", dtype=object)
+        self.last_pushed = np.zeros(capacity, dtype=bool)
+        self.ring = np.full((capacity, self.window), np.nan)
+        self.ring_pos = np.zeros(capacity, dtype=np.int32)
+        self.count = np.zeros(capacity, dtype=np.int32)
+        self.sorted_window = np.full((capacity, self.window), np.inf)
+
+    def _state_arrays(self):
+        return (self.last_arrival, self.previous_arrival, self.last_trip, self.last_pushed,
+                self.ring, self.ring_pos, self.count, self.sorted_window)
+
+    def _grow(self):
+        old = self._state_arrays()
+        n = len(old[0])
+        self._allocate(2 * n)
+        for new_array, old_array in zip(self._state_arrays(), old):
+            new_array[:n] = old_array
+
+    def _slot(self, route_id, stop_id):
+        key = (str(route_id), str(stop_id))
+        slot = self.slots.get(key)
+        if slot is None:
+            slot = self.slots[key] = len(self.slots)
+            if slot >= len(self.last_arrival):
+                self._grow()
+        return slot
+
+    def _push(self, slot, headway):
+        window = self.sorted_window[slot]
+        count = self.count[slot]
+        if count == self.window:
+            oldest = self.ring[slot, self.ring_pos[slot]]
+            # drop the oldest headway from the sorted window
+            i = np.searchsorted(window, oldest)
+            window[i:-1] = window[i + 1:]
+            window[-1] = np.inf
+            count -= 1
+        i = np.searchsorted(window[:count], headway)
+        window[i + 1:count + 1] = window[i:count]
+        window[i] = headway
+        self.count[slot] = count + 1
+
+        self.ring[slot, self.ring_pos[slot]] = headway
+        self.ring_pos[slot] = (self.ring_pos[slot] + 1) % self.window
+
+    def _replace_last(self, slot, headway):
+        # the newest headway of the slot is corrected in place (same trip, new prediction)
+        window = self.sorted_window[slot]
+        count = self.count[slot]
+        newest = (self.ring_pos[slot] - 1) % self.window
+        i = np.searchsorted(window[:count], self.ring[slot, newest])
+        window[i:count - 1] = window[i + 1:count]
+        i = np.searchsorted(window[:count - 1], headway)
+        window[i + 1:count] = window[i:count - 1]
+        window[i] = headway
+        self.ring[slot, newest] = headway
+
+    def _median(self, slot):
+        count = self.count[slot]
+        if count < self.min_periods:
+            return self.fallback_headway_sec
+        window = self.sorted_window[slot]
+        return (window[(count - 1) // 2] + window[count // 2]) / 2
+
+    def update(self, route_id, stop_id, arrival_time, trip_id=None):
+        """
+        Register one arrival and label it.
+
+        Parameters
+        ----------
+        route_id, stop_id : slot of the arrival
+
+        arrival_time : timestamp, or epoch seconds when numeric
+
+        trip_id : optional trip of the prediction; a new prediction for the slot's
+                  last trip replaces that trip's arrival
+
+        Returns
+        -------
+        (actual_headway_sec, scheduled_headway_sec, crowd_score, crowd); NaN values and
+        crowd -1 when the arrival cannot be labeled
+        """
+        slot = self._slot(route_id, stop_id)
+        arrival = _epoch_seconds(arrival_time)
+        trip = "" if trip_id is None or pd.isna(trip_id) else str(trip_id)
+        last = self.last_arrival[slot]
+
+        if trip and trip == self.last_trip[slot]:
+            previous = self.previous_arrival[slot]
+            if arrival == last or (not np.isnan(previous) and arrival <= previous):
+                return np.nan, np.nan, np.nan, -1
+            self.last_arrival[slot] = arrival
+            if np.isnan(previous):
+                headway = self.fallback_headway_sec
+            else:
+                headway = arrival - previous
+                if self.last_pushed[slot]:
+                    self._replace_last(slot, headway)
+                else:
+                    self._push(slot, headway)
+                    self.last_pushed[slot] = True
+        else:
+            if not np.isnan(last) and arrival <= last:
+                return np.nan, np.nan, np.nan, -1
+            self.previous_arrival[slot] = last
+            self.last_arrival[slot] = arrival
+            self.last_trip[slot] = trip
+
+            headway = self.fallback_headway_sec if np.isnan(last) else arrival - last
+            self.last_pushed[slot] = not np.isnan(headway)
+            if self.last_pushed[slot]:
+                self._push(slot, headway)
+        scheduled = self._median(slot)
+
+        score = headway / scheduled if scheduled else np.nan
+        if np.isnan(score):
+            return headway, scheduled, np.nan, -1
+        return headway, scheduled, score, int(np.digitize(score, CROWD_BINS[1:-1], right=True))
+
+    def update_batch(self, df, time_column="arrival_time"):
+        """
+        update() every row of a realtime batch in arrival order, with the trip_id
+        column when df has one. time_column may hold timestamps or epoch seconds
+        (the Int64 arrival_time of realtime_decoder.trip_updates_to_df).
+
+        Returns
+        -------
+        pd.DataFrame with actual_headway_sec, scheduled_headway_sec, crowd_score and
+        crowd, aligned with df's index
+        """
+        times = _epoch_seconds_array(df[time_column])
+        order = np.argsort(times, kind="stable")
+        results = np.empty((len(df), 4))
+        routes, stops = df["route_id"].to_numpy(), df["stop_id"].to_numpy()
+        trips = df["trip_id"].to_numpy() if "trip_id" in df.columns else np.full(len(df), None)
+        for i in order:
+            if np.isnan(times[i]):
+                results[i] = (np.nan, np.nan, np.nan, -1)
+            else:
+                results[i] = self.update(routes[i], stops[i], times[i], trips[i])
+        out = pd.DataFrame(
+            results[:, :3], index=df.index,
+            columns=["actual_headway_sec", "scheduled_headway_sec", "crowd_score"],
+        )
+        out["crowd"] = results[:, 3].astype(np.int8)
+        return out
+
+    def save(self, path):
+        """Checkpoint the state to one .npz file (written to a temporary name first)."""
+        n = len(self.slots)
+        keys = np.array(list(self.slots), dtype=str).reshape(n, 2)
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path, keys=keys, config=np.array([self.window, self.min_periods]),
+            fallback_headway_sec=self.fallback_headway_sec,
+            last_arrival=self.last_arrival[:n], previous_arrival=self.previous_arrival[:n],
+            last_trip=self.last_trip[:n].astype(str), last_pushed=self.last_pushed[:n],
+            ring=self.ring[:n], ring_pos=self.ring_pos[:n],
+            count=self.count[:n], sorted_window=self.sorted_window[:n],
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            window, min_periods = data["config"].tolist()
+            fallback = float(data["fallback_headway_sec"])
+            estimator = cls(window, min_periods, None if np.isnan(fallback) else fallback,
+                            capacity=max(len(data["keys"]), 1))
+            n = len(data["keys"])
+            estimator.slots = {(route, stop): i for i, (route, stop) in enumerate(data["keys"].tolist())}
+            estimator.last_arrival[:n] = data["last_arrival"]
+            # checkpoints written before trips were tracked start without trip identity
+            if "last_trip" in data.files:
+                estimator.previous_arrival[:n] = data["previous_arrival"]
+                estimator.last_trip[:n] = data["last_trip"]
+                estimator.last_pushed[:n] = data["last_pushed"]
+            estimator.ring[:n] = data["ring"]
+            estimator.ring_pos[:n] = data["ring_pos"]
+            estimator.count[:n] = data["count"]
+            estimator.sorted_window[:n] = data["sorted_window"]
+        return estimator
@@ -1,7 +1,58 @@
 import os
 import requests
 import wget
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 from config import *
+
+
+# Declared GTFS static schema used by the typed loader.
+# "id"   -> dictionary encoded string (categorical in pandas)
+# "time" -> HH:MM:SS parsed to int32 seconds since the start of the service day
+# anything else is a plain arrow type
+GTFS_STATIC_SCHEMA = {
+    "stops": {
+        "stop_id": "id",
+        "stop_name": pa.string(),
+        "stop_lat": pa.float64(),
+        "stop_lon": pa.float64(),
+        "location_type": pa.float32(),
+        "parent_station": "id",
+    },
+    "routes": {
+        "route_id": "id",
+        "agency_id": "id",
+        "route_short_name": pa.string(),
+        "route_long_name": pa.string(),
+        "route_desc": pa.string(),
+        "route_type": pa.int16(),
+        "route_color": pa.string(),
+    },
+    "stop_times": {
+        "trip_id": "id",
+        "arrival_time": "time",
+        "departure_time": "time",
+        "stop_id": "id",
+        "stop_sequence": pa.int32(),
+        "shape_dist_traveled": pa.float32(),
+    },
+    "trips": {
+        "route_id": "id",
+        "service_id": "id",
+        "trip_id": "id",
+        "trip_headsign": pa.string(),
+        "direction_id": pa.int8(),
+        "shape_id": "id",
+    },
+}
+
+GTFS_ID_TYPE = pa.dictionary(pa.int32(), pa.string())
+
+# a well-formed GTFS time; anything else (blank, "25:xx", "12:30") is read as null
+GTFS_TIME_PATTERN = r"^\d{1,4}:\d{1,2}:\d{1,2}$"
+
+
 def download_GTF_data_v2(base_dir):   
         # -----------------------------
         # Helper function
@@ -136,7 +187,232 @@ def load_GTF_static_data_v2(base_dir: str, traffic_data=False, weather_data=Fals
         "weather": weather_df,
     }
 
-def convert_GTF_realtime_data_to_df(base_dir):
+
+def _read_csv_header(path):
+    with open(path, "r", encoding="utf-8-sig") as f:
+        return [col.strip().strip('"') for col in f.readline().rstrip("\r\n").split(",")]
+
+
+def gtfs_time_to_seconds(times):
+    """
+    Parse GTFS HH:MM:SS strings (hours may go past 24) into int32 seconds since the
+    start of the service day. Nulls stay null, and blank or malformed values become
+    null instead of failing the whole load.
+
+    Parameters
+    ----------
+    times : pyarrow array or chunked array of strings
+
+    Returns
+    -------
+    pyarrow int32 array
+    """
+    trimmed = pc.utf8_trim_whitespace(times)
+    trimmed = pc.if_else(pc.match_substring_regex(trimmed, GTFS_TIME_PATTERN), trimmed,
+                         pa.scalar(None, pa.string()))
+    parts = pc.split_pattern(trimmed, ":")
+    hours = pc.cast(pc.list_element(parts, 0), pa.int32())
+    minutes = pc.cast(pc.list_element(parts, 1), pa.int32())
+    seconds = pc.cast(pc.list_element(parts, 2), pa.int32())
+    total = pc.add(pc.add(pc.multiply(hours, 3600), pc.multiply(minutes, 60)), seconds)
+    return pc.cast(total, pa.int32())
+
+
+def _gtfs_columns(table_name, header, columns=None):
+    schema = GTFS_STATIC_SCHEMA[table_name]
+    wanted = columns if columns is not None else list(schema)
+    return [col for col in wanted if col in header], schema
+
+
+def gtfs_csv_convert_options(path, table_name, columns=None, id_type=GTFS_ID_TYPE):
+    """
+    pyarrow ConvertOptions reading one GTFS table with GTFS_STATIC_SCHEMA.
+
+    Returns
+    -------
+    (pyarrow.csv.ConvertOptions, list of time columns still to parse with parse_gtfs_time_columns)
+    """
+    wanted, schema = _gtfs_columns(table_name, _read_csv_header(path), columns)
+
+    column_types = {}
+    for col in wanted:
+        kind = schema.get(col, pa.string())
+        if isinstance(kind, str):
+            column_types[col] = id_type if kind == "id" else pa.string()
+        else:
+            column_types[col] = kind
+
+    convert_options = pacsv.ConvertOptions(
+        column_types=column_types,
+        include_columns=wanted,
+        strings_can_be_null=True,
+    )
+    return convert_options, [col for col in wanted if schema.get(col) == "time"]
+
+
+def parse_gtfs_time_columns(table, time_columns):
+    """Replace the given HH:MM:SS string columns of a pyarrow Table with int32 seconds."""
+    for col in time_columns:
+        table = table.set_column(
+            table.schema.get_field_index(col), col, gtfs_time_to_seconds(table[col])
+        )
+    return table
+
+
+def _load_gtfs_table_pyarrow(path, table_name, columns=None):
+    convert_options, time_columns = gtfs_csv_convert_options(path, table_name, columns)
+    table = pacsv.read_csv(path, convert_options=convert_options)
+    return parse_gtfs_time_columns(table, time_columns)
+
+
+_DUCKDB_TYPES = {
+    pa.float64(): "DOUBLE",
+    pa.float32(): "FLOAT",
+    pa.int32(): "INTEGER",
+    pa.int16(): "SMALLINT",
+    pa.int8(): "TINYINT",
+    pa.string(): "VARCHAR",
+}
+
+
+def _load_gtfs_table_duckdb(path, table_name, columns=None):
+    wanted, schema = _gtfs_columns(table_name, _read_csv_header(path), columns)
+
+    select = []
+    for col in wanted:
+        kind = schema.get(col, pa.string())
+        quoted = f'"{col}"'
+        if kind == "time":
+            select.append(
+                # TRY_CAST: blank or malformed times become NULL, as with the pyarrow backend
+                f"CASE WHEN regexp_full_match(trim({quoted}), '{GTFS_TIME_PATTERN[1:-1]}') THEN"
+                f" CAST(TRY_CAST(split_part(trim({quoted}), ':', 1) AS INTEGER) * 3600"
+                f" + TRY_CAST(split_part(trim({quoted}), ':', 2) AS INTEGER) * 60"
+                f" + TRY_CAST(split_part(trim({quoted}), ':', 3) AS INTEGER) AS INTEGER) END AS {quoted}"
+            )
+        elif isinstance(kind, str):
+            select.append(quoted)
+        else:
+            select.append(f"TRY_CAST({quoted} AS {_DUCKDB_TYPES[kind]}) AS {quoted}")
+
+    escaped_path = path.replace("'", "''")
+    con = duckdb.connect()
+    try:
+        table = con.execute(
+            f"SELECT {', '.join(select)} FROM read_csv('{escaped_path}', header=true, all_varchar=true)"
+        ).fetch_arrow_table()
+    finally:
+        con.close()
+
+    for col in wanted:
+        if schema.get(col) == "id":
+            table = table.set_column(
+                table.schema.get_field_index(col), col,
+                pc.cast(pc.dictionary_encode(table[col]), GTFS_ID_TYPE)
+            )
+    return table
+
+
+GTFS_PANDAS_TYPES = {
+    pa.int32(): pd.Int32Dtype(),
+    pa.int16(): pd.Int16Dtype(),
+    pa.int8(): pd.Int8Dtype(),
+}
+
+
+def load_GTF_static_data_v3(base_dir: str, traffic_data=False, weather_data=False,
+                            backend="pyarrow", columns=None, as_arrow=False):
+    """
+    Typed, columnar version of load_GTF_static_data_v2.
+
+    Reads stops, routes, stop_times and trips with the declared GTFS_STATIC_SCHEMA
+    instead of letting pandas infer every column:
+    - *_id columns are dictionary encoded (pandas categorical)
+    - stop_sequence is int32
+    - arrival_time / departure_time are int32 seconds since the start of the service day
+      (null when blank or malformed)
+    - only the schema columns (or the ones you ask for) are read
+
+    Parameters
+    ----------
+    base_dir : directory holding the extracted GTFS txt files
+
+    traffic_data : if traffic data exists  (by default false)
+
+    weather_data : if weather data exists  (by default false)
+
+    backend : 'pyarrow' (default) or 'duckdb'
+
+    columns : optional dict {table_name: [columns]} to read fewer columns than the schema
+
+    as_arrow : return pyarrow Tables instead of pandas DataFrames (by default false)
+
+    Returns
+    -------
+    dict with the same keys as load_GTF_static_data_v2
+    """
+    loaders = {
+        "pyarrow": _load_gtfs_table_pyarrow,
+        "duckdb": _load_gtfs_table_duckdb,
+    }
+    if backend not in loaders:
+        raise ValueError(f"Unknown backend: {backend}")
+    columns = columns or {}
+
+    taxi_df = None
+    weather_df = None
+    if traffic_data:
+      traffic_dir = os.path.join(base_dir, "traffic")
+      taxi_df = pd.read_parquet(os.path.join(traffic_dir, "nyc_taxi_2024_01.parquet"))
+    if weather_data :
+      weather_dir = os.path.join(base_dir, "weather")
+      weather_df = pd.read_csv(os.path.join(weather_dir, "weather.csv"), parse_dates=["date"])
+
+    data = {}
+    for table_name in ["stops", "routes", "stop_times", "trips"]:
+        table = loaders[backend](
+            os.path.join(base_dir, f"{table_name}.txt"), table_name, columns.get(table_name)
+        )
+        data[table_name] = table if as_arrow else table.to_pandas(types_mapper=GTFS_PANDAS_TYPES.get)
+
+    data["taxi"] = taxi_df
+    data["weather"] = weather_df
+    return data
+
+def convert_GTF_realtime_data_to_df(base_dir, max_workers=1):
+    """
+    Decode GTFS-rt tripUpdates snapshots to a DataFrame.
+
+    Uses realtime_decoder: stop_time_updates are written straight into typed column
+    buffers with interned ids instead of one dict per record.
+
+    Parameters
+    ----------
+    base_dir : a single .pb snapshot, or a directory of them (also the SnapshotWriter
+               layout, where the tripUpdates sub-directory is read)
+
+    max_workers : processes used to decode a directory (by default 1)
+
+    Returns
+    -------
+    pd.DataFrame with trip_id, route_id, stop_id (categorical), arrival_time,
+    departure_time (Int64 epoch seconds), arrival_delay and departure_delay (Int32);
+    a directory also gets the snapshot timestamp
+    """
+    from realtime_decoder import decode_trip_update_files, snapshot_files, trip_updates_to_df
+
+    if os.path.isdir(base_dir):
+        paths = snapshot_files(base_dir)
+        table = decode_trip_update_files(paths, include_timestamp=True, max_workers=max_workers)
+        print(f"✅ Decoded {len(paths):,} snapshots | {table.num_rows:,} records")
+    else:
+        table = decode_trip_update_files([base_dir], include_timestamp=False)
+    return trip_updates_to_df(table)
+
+
+def convert_GTF_realtime_data_to_df_v1(base_dir):
+    from google.transit import gtfs_realtime_pb2
+
     feed = gtfs_realtime_pb2.FeedMessage()
     with open(base_dir, 'rb') as f : 
         feed.ParseFromString(f.read())
@@ -269,7 +545,9 @@ def collect_realtime_gtfs_data(
     api_key: str, 
     duration_minutes: int = 10, 
     interval_seconds: int = 30, 
-    output_filename: str = "mta_realtime_data.csv"
+    output_filename: str = "mta_realtime_data.csv",
+    store_dir: str = None,
+    delta_only: bool = False
 ):
     """
     Collect real-time GTFS data from the MTA API for a specified duration.
@@ -284,71 +562,58 @@ def collect_realtime_gtfs_data(
         Time between API calls in seconds (default: 30)
     output_filename : str, optional
         Name of the output CSV file (default: "mta_realtime_data.csv")
+    store_dir : str, optional
+        Directory of a snapshot_store.SnapshotStore. When given, every polled batch
+        is flushed to the time-partitioned parquet store as it arrives (memory stays
+        flat and a crash loses at most one batch) and no CSV is written.
+    delta_only : bool, optional
+        With store_dir, keep the latest prediction of every (trip_id, stop_id) in
+        memory and store only new or changed predictions
+        (snapshot_store.DeltaSnapshotStore; default: False). Rebuild the last known
+        or a point-in-time table with snapshot_store.read_latest_predictions.
     
     Returns:
     --------
     pandas.DataFrame
-        DataFrame containing all collected real-time trip updates
+        DataFrame containing all collected real-time trip updates, in the
+        realtime_decoder schema (arrival_time / departure_time as Int64 epoch
+        seconds, see realtime_poller.TripUpdateCollector)
+        (the SnapshotStore instead when store_dir is given; query it with
+        snapshot_store.read_snapshots)
+
+    Notes:
+    ------
+    Polling runs on the asyncio poller (realtime_poller) with a pooled keep-alive
+    session and jittered backoff on errors. Inside a running event loop (e.g. a
+    notebook) await realtime_poller.collect_realtime_feeds_async directly.
     """
-    REALTIME_URL = f"https://gtfsrt.prod.obanyc.com/tripUpdates?key={api_key}"
-    
-    all_records = []
-    start_time = time.time()
-    collection_end_time = start_time + (duration_minutes * 60)
-    
+    # realtime-only dependencies (aiohttp, protobuf) are imported here, not by the static loaders
+    from realtime_poller import TripUpdateCollector, run_realtime_poller
+    from snapshot_store import SnapshotStore, DeltaSnapshotStore
+
+    feeds = {"tripUpdates": f"https://gtfsrt.prod.obanyc.com/tripUpdates?key={api_key}"}
+    store = None
+    if store_dir:
+        store = DeltaSnapshotStore(store_dir) if delta_only else SnapshotStore(store_dir)
+    collector = TripUpdateCollector(store=store)
+
     print(f"🚀 Starting real-time data collection for {duration_minutes} minutes...")
     print(f"📡 Fetching data every {interval_seconds} seconds")
-    print(f"💾 Output file: {output_filename}")
-    
-    while time.time() < collection_end_time:
-        try:
-            feed = FeedMessage()
-            response = requests.get(REALTIME_URL)
-            response.raise_for_status()
-            feed.ParseFromString(response.content)
-
-            batch_records = []
-            current_timestamp = datetime.datetime.now()
-            
-            for entity in feed.entity:
-                if not entity.trip_update:
-                    continue
-                    
-                trip_id = entity.trip_update.trip.trip_id
-                route_id = entity.trip_update.trip.route_id
-                
-                for stu in entity.trip_update.stop_time_update:
-                    record = {
-                        "timestamp": current_timestamp,
-                        "trip_id": trip_id,
-                        "route_id": route_id,
-                        "stop_id": stu.stop_id,
-                        "arrival_time": datetime.datetime.fromtimestamp(stu.arrival.time) if stu.arrival.HasField('time') else None,
-                        "departure_time": datetime.datetime.fromtimestamp(stu.departure.time) if stu.departure.HasField('time') else None,
-                        "arrival_delay": stu.arrival.delay if stu.arrival.HasField('delay') else None,
-                        "departure_delay": stu.departure.delay if stu.departure.HasField('delay') else None
-                    }
-                    batch_records.append(record)
+    print(f"💾 Output: {store_dir or output_filename}")
 
-            if batch_records:
-                all_records.extend(batch_records)
-                elapsed_time = time.time() - start_time
-                print(f"✅ Fetched {len(batch_records):,} records | Total: {len(all_records):,} | Elapsed: {elapsed_time/60:.1f} min")
-            else:
-                print(f"⚠️  No records in current batch")
-                
-            remaining_time = interval_seconds - (time.time() % interval_seconds)
-            time.sleep(remaining_time)
+    try:
+        run_realtime_poller(feeds, collector, duration_minutes=duration_minutes, interval_seconds=interval_seconds)
+    finally:
+        if store is not None:
+            store.close()
 
-        except requests.exceptions.RequestException as e:
-            print(f"🔴 Network error: {e}")
-            time.sleep(60)
-        except Exception as e:
-            print(f"🔴 Unexpected error: {e}")
-            time.sleep(60)
+    if store is not None:
+        print(f"\n🎉 Collection complete!")
+        print(f"💾 Saved {store.rows_written:,} records to {store_dir}")
+        return store
 
-    if all_records:
-        rt_df = pd.DataFrame(all_records)
+    rt_df = collector.to_df()
+    if not rt_df.empty:
         rt_df.to_csv(output_filename, index=False)
         print(f"\n🎉 Collection complete!")
         print(f"💾 Saved {len(rt_df):,} records to {output_filename}")
@@ -442,7 +707,9 @@ def collect_multi_day_data(
     duration_minutes_per_day=60,
     interval_seconds=30,
     output_dir="gtfs_data",
-    combine_all=True
+    combine_all=True,
+    use_store=False,
+    delta_only=False
 ):
     """
     Collect GTFS data from multiple days across multiple months and years.
@@ -465,6 +732,12 @@ def collect_multi_day_data(
         Directory to save output files (default: "gtfs_data")
     combine_all : bool, optional
         Whether to combine all data into one file (default: True)
+    use_store : bool, optional
+        Flush every batch to one snapshot_store.SnapshotStore under
+        <output_dir>/snapshots instead of per-day CSVs (default: False).
+        combine_all then reads the store back instead of concatenating CSVs.
+    delta_only : bool, optional
+        With use_store, store only new or changed predictions (default: False).
     
     Returns:
     --------
@@ -520,6 +793,7 @@ def collect_multi_day_data(
         return None
     
     all_dataframes = []
+    store_dir = os.path.join(output_dir, "snapshots")
     
     for i, date in enumerate(past_dates, 1):
         print(f"\n{'='*60}")
@@ -528,6 +802,16 @@ def collect_multi_day_data(
         
         filename = f"mta_data_{date.strftime('%Y%m%d')}.csv"
         filepath = os.path.join(output_dir, filename)
+
+        if use_store:
+            collect_realtime_gtfs_data(
+                api_key=api_key,
+                duration_minutes=duration_minutes_per_day,
+                interval_seconds=interval_seconds,
+                store_dir=store_dir,
+                delta_only=delta_only
+            )
+            continue
         
         df = collect_realtime_gtfs_data(
             api_key=api_key,
@@ -540,6 +824,20 @@ def collect_multi_day_data(
             df['collection_date'] = date
             all_dataframes.append(df)
     
+    if use_store:
+        if not combine_all:
+            return None
+        from snapshot_store import read_snapshots
+        combined_df = read_snapshots(store_dir)
+        if combined_df.empty:
+            return None
+        combined_df['collection_date'] = pd.to_datetime(combined_df['timestamp']).dt.date
+        print(f"\n{'='*60}")
+        print(f"📊 Total records in {store_dir}: {len(combined_df):,}")
+        print(f"📅 Date range: {combined_df['collection_date'].min()} to {combined_df['collection_date'].max()}")
+        print(f"{'='*60}")
+        return combined_df
+
     # Combine all data if requested
     if combine_all and all_dataframes:
         print(f"\n{'='*60}")
@@ -0,0 +1,429 @@
+import asyncio
+import json
+import sqlite3
+import aiohttp
+from aiohttp import web
+from config import *
+from realtime_poller import backoff_delay
+
+
+OPENWEATHER_URL = "https://api.openweathermap.org/data/2.5/weather"
+TOMTOM_FLOW_URL = "https://api.tomtom.com/traffic/services/4/flowSegmentData/absolute/10/json"
+
+WEATHER_COLUMNS = ["temperature", "humidity", "wind_speed", "weather_condition"]
+TRAFFIC_COLUMNS = ["current_travel_time", "free_flow_travel_time", "congestion_level"]
+ENRICHMENT_COLUMNS = WEATHER_COLUMNS + TRAFFIC_COLUMNS
+ENRICHMENT_KEY_COLUMNS = ["_lat", "_lon", "_bucket"]
+
+
+def parse_weather(payload):
+    """OpenWeatherMap current weather response -> weather columns."""
+    return {
+        "temperature": payload.get("main", {}).get("temp"),
+        "humidity": payload.get("main", {}).get("humidity"),
+        "wind_speed": payload.get("wind", {}).get("speed"),
+        "weather_condition": (payload.get("weather") or [{}])[0].get("main"),
+    }
+
+
+def parse_traffic(payload):
+    """TomTom flowSegmentData response -> traffic columns."""
+    flow = payload.get("flowSegmentData", {})
+    return {
+        "current_travel_time": flow.get("currentTravelTime"),
+        "free_flow_travel_time": flow.get("freeFlowTravelTime"),
+        "congestion_level": (
+            round(flow["currentTravelTime"] / flow["freeFlowTravelTime"], 2)
+            if flow.get("freeFlowTravelTime") else None
+        ),
+    }
+
+
+class EnrichmentCache():
+    """
+    Persistent SQLite cache of parsed API responses keyed by (source, lat, lon, time bucket).
+
+    Entries older than ttl_seconds are treated as missing and removed by evict_expired.
+    """
+
+    def __init__(self, path="enrichment_cache.sqlite", ttl_seconds=6 * 3600):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.con = sqlite3.connect(path)
+        self.con.execute("""
+            CREATE TABLE IF NOT EXISTS enrichment (
+                source TEXT, lat REAL, lon REAL, bucket INTEGER,
+                fetched_at REAL, payload TEXT,
+                PRIMARY KEY (source, lat, lon, bucket)
+            )
+        """)
+        self.con.commit()
+
+    def get_many(self, source, keys):
+        """{(lat, lon, bucket): parsed dict} for the keys with a fresh entry."""
+        if not keys:
+            return {}
+        self.con.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (lat REAL, lon REAL, bucket INTEGER)")
+        self.con.execute("DELETE FROM wanted")
+        self.con.executemany("INSERT INTO wanted VALUES (?, ?, ?)", keys)
+        rows = self.con.execute("""
+            SELECT e.lat, e.lon, e.bucket, e.payload
+            FROM enrichment e JOIN wanted w USING (lat, lon, bucket)
+            WHERE e.source = ? AND e.fetched_at >= ?
+        """, (source, time.time() - self.ttl_seconds)).fetchall()
+        return {(lat, lon, bucket): json.loads(payload) for lat, lon, bucket, payload in rows}
+
+    def put_many(self, source, values):
+        """Store {(lat, lon, bucket): parsed dict}."""
+        now = time.time()
+        self.con.executemany(
+            "INSERT OR REPLACE INTO enrichment VALUES (?, ?, ?, ?, ?, ?)",
+            [(source, lat, lon, bucket, now, json.dumps(value)) for (lat, lon, bucket), value in values.items()],
+        )
+        self.con.commit()
+
+    def evict_expired(self):
+        """Delete expired entries; returns how many were removed."""
+        cursor = self.con.execute("DELETE FROM enrichment WHERE fetched_at < ?", (time.time() - self.ttl_seconds,))
+        self.con.commit()
+        return cursor.rowcount
+
+    def close(self):
+        self.con.close()
+
+
+class RateLimiter():
+    """Spaces request starts at least 1 / requests_per_second apart."""
+
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class WeatherTrafficEnricher():
+    """
+    Adds weather (OpenWeatherMap) and traffic (TomTom flow) columns to a frame with
+    stop_lat / stop_lon / timestamp, replacing add_weather_traffic_features_safe.
+
+    Rows are reduced up front to unique (lat, lon, time bucket) keys, coordinates
+    rounded to `precision` decimals as before. Keys found fresh in the SQLite cache
+    are not fetched again; the others are fetched concurrently over one aiohttp
+    session, with at most max_concurrency requests in flight, request starts rate
+    limited and failed requests retried with backoff. Failures are not cached. The
+    results are attached with a single merge on the key columns.
+
+    Parameters
+    ----------
+    weather_api_key, traffic_api_key : API keys
+
+    cache_path : SQLite cache file (by default "enrichment_cache.sqlite")
+
+    ttl_seconds : cache entry lifetime (by default 6 hours)
+
+    time_bucket : pandas frequency rows are bucketed to (by default "1h")
+
+    precision : decimals coordinates are rounded to (by default 3, ~100 m)
+
+    max_concurrency : requests in flight at once (by default 10)
+
+    requests_per_second : request rate limit per API (by default 10)
+
+    weather_url, traffic_url : endpoints, e.g. a MockEnrichmentServer's
+    """
+
+    def __init__(self, weather_api_key, traffic_api_key, cache_path="enrichment_cache.sqlite",
+                 ttl_seconds=6 * 3600, time_bucket="1h", precision=3, max_concurrency=10,
+                 requests_per_second=10, retries=2, timeout_seconds=20,
+                 weather_url=OPENWEATHER_URL, traffic_url=TOMTOM_FLOW_URL):
+        self.weather_api_key = weather_api_key
+        self.traffic_api_key = traffic_api_key
+        self.cache = EnrichmentCache(cache_path, ttl_seconds)
+        self.time_bucket = time_bucket
+        self.precision = precision
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.retries = retries
+        self.timeout_seconds = timeout_seconds
+        self.weather_url = weather_url
+        self.traffic_url = traffic_url
+        self.stats = {"keys": 0, "cache_hits": 0, "requests": 0, "failures": 0}
+
+    def _request(self, source, lat, lon):
+        if source == "weather":
+            params = {"lat": lat, "lon": lon, "appid": self.weather_api_key, "units": "metric"}
+            return self.weather_url, params, parse_weather
+        params = {"point": f"{lat},{lon}", "key": self.traffic_api_key}
+        return self.traffic_url, params, parse_traffic
+
+    async def _fetch(self, session, semaphore, limiter, source, key):
+        url, params, parse = self._request(source, key[0], key[1])
+        for attempt in range(self.retries + 1):
+            await limiter.wait()
+            try:
+                async with semaphore:
+                    self.stats["requests"] += 1
+                    async with session.get(url, params=params) as response:
+                        response.raise_for_status()
+                        return key, parse(await response.json(content_type=None))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt == self.retries:
+                    self.stats["failures"] += 1
+                    print(f"⚠️ {source} fetch failed for {key[:2]}: {type(e).__name__}: {e}")
+                    return key, None
+                await asyncio.sleep(backoff_delay(attempt + 1, base_seconds=0.5, max_seconds=10))
+
+    async def fetch_async(self, keys):
+        """
+        Fetch weather and traffic for the keys missing from the cache.
+
+        The requests of both sources go into a single gather, each source behind its
+        own RateLimiter, so the two APIs are queried at the same time.
+
+        Returns
+        -------
+        dict {source: {(lat, lon, bucket): parsed dict}}, cached and fetched together
+        """
+        sources = ["weather", "traffic"]
+        cached = {}
+        for source in sources:
+            cached[source] = self.cache.get_many(source, keys)
+            self.stats["cache_hits"] += len(cached[source])
+
+        timeout = aiohttp.ClientTimeout(total=self.timeout_seconds)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            tasks, task_sources = [], []
+            for source in sources:
+                limiter = RateLimiter(self.requests_per_second)
+                for key in keys:
+                    if key not in cached[source]:
+                        tasks.append(self._fetch(session, semaphore, limiter, source, key))
+                        task_sources.append(source)
+            fetched_all = await asyncio.gather(*tasks)
+
+        results = {}
+        for source in sources:
+            fetched = {key: value for (key, value), task_source in zip(fetched_all, task_sources)
+                       if task_source == source and value is not None}
+            self.cache.put_many(source, fetched)
+            results[source] = {**cached[source], **fetched}
+        return results
+
+    def _keys(self, df):
+        buckets = pd.to_datetime(df["timestamp"]).dt.floor(self.time_bucket)
+        return pd.DataFrame({
+            "_lat": df["stop_lat"].round(self.precision).to_numpy(),
+            "_lon": df["stop_lon"].round(self.precision).to_numpy(),
+            # epoch seconds of the bucket, NaN for a missing timestamp
+            "_bucket": ((buckets - pd.Timestamp(0)) // pd.Timedelta(seconds=1)).to_numpy(dtype=float),
+        })
+
+    @staticmethod
+    def _values_frame(values, columns):
+        return pd.DataFrame(
+            [(*key, *(value.get(col) for col in columns)) for key, value in values.items()],
+            columns=ENRICHMENT_KEY_COLUMNS + columns,
+        )
+
+    def _attach(self, df, key_frame, results):
+        values = self._values_frame(results["weather"], WEATHER_COLUMNS).merge(
+            self._values_frame(results["traffic"], TRAFFIC_COLUMNS), on=ENRICHMENT_KEY_COLUMNS, how="outer"
+        )
+        # left merge keeps key_frame's row order, one row per input row
+        merged = key_frame.merge(values, on=ENRICHMENT_KEY_COLUMNS, how="left")
+        df = df.drop(columns=[col for col in ENRICHMENT_COLUMNS if col in df.columns])
+        for col in ENRICHMENT_COLUMNS:
+            df[col] = merged[col].to_numpy()
+        return df
+
+    async def enrich_async(self, df):
+        key_frame = self._keys(df)
+        valid = key_frame.notna().all(axis=1)
+        unique_keys = key_frame[valid].drop_duplicates()
+        keys = [(float(lat), float(lon), int(bucket)) for lat, lon, bucket in unique_keys.itertuples(index=False)]
+        self.stats["keys"] += len(keys)
+        print(f"🌦️ {len(df):,} rows -> {len(keys):,} unique (lat, lon, {self.time_bucket}) keys")
+        results = await self.fetch_async(keys)
+        return self._attach(df, key_frame, results)
+
+    def enrich(self, df):
+        """
+        Return df with ENRICHMENT_COLUMNS added (blocking; inside a running event loop
+        await enrich_async instead).
+        """
+        enriched = asyncio.run(self.enrich_async(df))
+        print(f"✅ Enrichment done | {self.stats}")
+        return enriched
+
+    def close(self):
+        self.cache.close()
+
+
+class MockEnrichmentServer():
+    """
+    Local stand-in for the OpenWeatherMap and TomTom flow endpoints with deterministic
+    responses derived from the coordinates. Statuses listed in fail_with are returned
+    first, in order, to exercise the retry path.
+
+    Example
+    -------
+    async with MockEnrichmentServer() as server:
+        enricher = WeatherTrafficEnricher("key", "key", **server.urls())
+        df = await enricher.enrich_async(df)
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, fail_with=()):
+        self.host = host
+        self.port = port
+        self.fail_with = list(fail_with)
+        self.requests = {"weather": 0, "traffic": 0}
+        self._runner = None
+
+    async def _weather(self, request):
+        self.requests["weather"] += 1
+        if self.fail_with:
+            return web.Response(status=self.fail_with.pop(0))
+        lat, lon = float(request.query["lat"]), float(request.query["lon"])
+        return web.json_response({
+            "main": {"temp": round(10 + (lat * 100) % 15, 2), "humidity": int(40 + (lon * 100) % 50)},
+            "wind": {"speed": round((lat + lon) % 7, 2)},
+            "weather": [{"main": "Rain" if int(lat * 1000) % 3 == 0 else "Clear"}],
+        })
+
+    async def _traffic(self, request):
+        self.requests["traffic"] += 1
+        if self.fail_with:
+            return web.Response(status=self.fail_with.pop(0))
+        lat, lon = (float(value) for value in request.query["point"].split(","))
+        free_flow = 60 + int(lat * 1000) % 60
+        return web.json_response({
+            "flowSegmentData": {"currentTravelTime": free_flow + int(lon * -1000) % 90, "freeFlowTravelTime": free_flow}
+        })
+
+    def urls(self):
+        base_url = f"http://{self.host}:{self.port}"
+        return {
+            "weather_url": f"{base_url}/data/2.5/weather",
+            "traffic_url": f"{base_url}/traffic/services/4/flowSegmentData/absolute/10/json",
+        }
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get("/data/2.5/weather", self._weather)
+        app.router.add_get("/traffic/services/4/flowSegmentData/absolute/10/json", self._traffic)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._runner.cleanup()
+
+
+def _weather_time_column(weather_df):
+    for col in ["datetime", "timestamp", "date"]:
+        if col in weather_df.columns:
+            return col
+    raise ValueError("weather_df needs a datetime, timestamp or date column")
+
+
+def aggregate_weather(weather_df, freq="1h", time_column=None, location=None, location_column="location"):
+    """
+    Pre-aggregate weather observations (e.g. the weather.csv of download_GTF_data_v2,
+    after preprocessing.clean_weather_data) to the model's time granularity.
+
+    Numeric columns are averaged per period, other columns keep the period's last
+    value. Periods are labeled by their start, so an as-of join picks the period a
+    timestamp falls in.
+
+    Parameters
+    ----------
+    weather_df : weather observations
+
+    freq : pandas frequency of the model (by default "1h"); coarser observations,
+           like the daily weather.csv, simply keep one row per observation
+
+    time_column : observation time column (by default the first of datetime,
+                  timestamp, date)
+
+    location : optional value of location_column to keep (e.g. "New York")
+
+    Returns
+    -------
+    pd.DataFrame sorted by time with one row per period that has observations
+    """
+    time_column = time_column or _weather_time_column(weather_df)
+    df = weather_df
+    if location is not None:
+        df = df[df[location_column] == location]
+    df = df.dropna(subset=[time_column])
+    periods = pd.to_datetime(df[time_column]).dt.floor(freq).rename(time_column)
+
+    value_columns = [col for col in df.columns if col not in (time_column, location_column)]
+    numeric = [col for col in value_columns if pd.api.types.is_numeric_dtype(df[col])]
+    other = [col for col in value_columns if col not in numeric]
+    grouped = df[value_columns].groupby(periods, sort=True)
+    aggregated = pd.concat([grouped[numeric].mean(), grouped[other].last()], axis=1)[value_columns]
+    return aggregated.reset_index()
+
+
+def asof_join_weather(df, weather_df, time_column="timestamp", weather_time_column=None,
+                      columns=None, tolerance=None):
+    """
+    Attach to every row the latest weather period starting at or before its timestamp.
+
+    Only the weather times are sorted; row timestamps are located among them with
+    one np.searchsorted over int64 arrays, so the rows keep their order and nothing
+    is shuffled for millions of arrivals. No network access is involved.
+
+    Parameters
+    ----------
+    df : rows to enrich (e.g. realtime arrivals)
+
+    weather_df : aggregate_weather output (or any frame with a time column)
+
+    time_column : timestamp column of df (by default "timestamp")
+
+    weather_time_column : time column of weather_df (by default detected)
+
+    columns : weather columns to attach (by default all but the time column)
+
+    tolerance : optional pd.Timedelta / string; matches further back are left empty
+
+    Returns
+    -------
+    pd.DataFrame, df with the weather columns added
+    """
+    weather_time_column = weather_time_column or _weather_time_column(weather_df)
+    weather = weather_df.dropna(subset=[weather_time_column]).sort_values(weather_time_column, kind="stable")
+    columns = columns or [col for col in weather.columns if col != weather_time_column]
+
+    weather_times = pd.to_datetime(weather[weather_time_column]).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    row_times = pd.to_datetime(df[time_column]).to_numpy(dtype="datetime64[ns]")
+    missing = np.isnat(row_times)
+    row_times = row_times.astype(np.int64)
+
+    positions = np.searchsorted(weather_times, row_times, side="right") - 1
+    found = (positions >= 0) & ~missing
+    if tolerance is not None:
+        found &= row_times - weather_times[np.maximum(positions, 0)] <= pd.Timedelta(tolerance).value
+    positions = np.where(found, positions, 0)
+
+    df = df.copy()
+    for col in columns:
+        values = weather[col].take(positions) if len(weather) else pd.Series(np.nan, index=range(len(df)))
+        df[col] = values.where(found if len(weather) else False).to_numpy()
+    return df
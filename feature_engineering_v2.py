@@ -1,4 +1,47 @@
 from config import *
+from keyword_matcher import KeywordMatcher, city_matcher
+from utils import maybe_copy
+
+
+# keyword lists used by the route_long_name features (matched on the upper-cased name)
+ROUTE_CORRIDORS = ['BROADWAY', '7 AVENUE', 'LEXINGTON AVENUE', '8 AVENUE',
+                   '6 AVENUE', 'FLUSHING', '14 ST', '42 ST', 'NASSAU ST',
+                   'QUEENS BOULEVARD', 'BROOKLYN-QUEENS', 'FRANKLIN AVENUE',
+                   'ROCKAWAY', 'PELHAM', 'JAMAICA', 'CANARSIE']
+ROUTE_BOROUGHS = ['MANHATTAN', 'BROOKLYN', 'QUEENS', 'BRONX', 'STATEN ISLAND']
+ROUTE_AREAS = ['ASTORIA', 'FLUSHING', 'JAMAICA', 'CANARSIE', 'PELHAM', 'ROCKAWAY',
+               'INWOOD', 'WAKEFIELD', 'WOODLAWN', 'MIDDLE VILLAGE', 'FOREST HILLS',
+               'CONEY ISLAND', 'BRIGHTON', 'BAY RIDGE']
+
+
+ROUTE_TIME_RESTRICTION_WORDS = ['WEEKDAYS', 'WEEKENDS', 'RUSH', 'DAYTIME', 'NIGHTS']
+ROUTE_AVENUE_WORDS = ['AVENUE', 'AV', 'BOULEVARD', 'BLVD']
+ROUTE_STREET_WORDS = ['STREET', 'ST', 'PLACE', 'PL']
+ROUTE_MANHATTAN_CBD_WORDS = ['BROADWAY', 'LEXINGTON', '7 AV', '8 AV', '6 AV']
+ROUTE_TOURIST_WORDS = ['BROADWAY', 'TIMES SQUARE', '42 ST', 'CENTRAL PARK']
+ROUTE_COMMUTER_WORDS = ['EXPRESS', 'QUEENS', 'BROOKLYN', 'BRONX']
+ROUTE_SERVICE_WORDS = ['LOCAL', 'EXPRESS', 'SHUTTLE', 'CROSSTOWN']
+
+
+def _route_name_matcher():
+    # every keyword flag of route_long_name_feature_table in one matcher (upper-cased names)
+    flags = {f'corridor:{word}': [word] for word in ROUTE_CORRIDORS}
+    flags.update({f'borough:{word}': [word] for word in ROUTE_BOROUGHS})
+    flags.update({f'area:{word}': [word] for word in ROUTE_AREAS})
+    flags.update({f'service:{word}': [word] for word in ROUTE_SERVICE_WORDS})
+    flags.update({
+        'combined': ['/', '&'],
+        'time_restriction': ROUTE_TIME_RESTRICTION_WORDS,
+        'avenue': ROUTE_AVENUE_WORDS,
+        'street': ROUTE_STREET_WORDS,
+        'manhattan_cbd': ROUTE_MANHATTAN_CBD_WORDS,
+        'tourist': ROUTE_TOURIST_WORDS,
+        'commuter': ROUTE_COMMUTER_WORDS,
+    })
+    return KeywordMatcher(flags, case_sensitive=True)
+
+
+_ROUTE_NAME_MATCHER = _route_name_matcher()
 
 class FeatureEngineeringRouteDf():
    
@@ -9,8 +52,9 @@ class FeatureEngineeringRouteDf():
         Removed redundant features to reduce multicollinearity
         """
         
-        # Create a copy to avoid modifying original dataframe
-        df_eng = df.copy()
+        # Create a copy to avoid modifying original dataframe (unless in utils.pipeline_mode)
+        original_columns = set(df.columns)
+        df_eng = maybe_copy(df)
         
         # 🔤 Basic Character-Based Features (KEEP - unique structural features)
         df_eng['route_id_length'] = df_eng[route_id_column].str.len()
@@ -73,16 +117,140 @@ class FeatureEngineeringRouteDf():
                     'modern'
         )
         
-        print(f"✅ Created {len([col for col in df_eng.columns if col not in df.columns])} optimized features from {route_id_column}")
-        print(f"📊 New features: {[col for col in df_eng.columns if col not in df.columns]}")
+        print(f"✅ Created {len([col for col in df_eng.columns if col not in original_columns])} optimized features from {route_id_column}")
+        print(f"📊 New features: {[col for col in df_eng.columns if col not in original_columns]}")
         
         return df_eng
     
 
+    def route_long_name_feature_table(self, names):
+        """
+        Route name features for a set of unique route_long_name values.
+
+        All keyword flags come from one _ROUTE_NAME_MATCHER scan per unique name
+        (keyword_matcher.KeywordMatcher) instead of one str.contains pass per feature.
+
+        Parameters
+        ----------
+        names : pd.Series of unique route_long_name strings
+
+        Returns
+        -------
+        pd.DataFrame with one row per name (same order) and one column per feature
+        """
+        names = pd.Series(names, dtype=object).fillna('').astype(str).reset_index(drop=True)
+        upper = names.str.upper()
+        matched = _ROUTE_NAME_MATCHER.match(upper, dtype=bool)
+
+        def flag(name):
+            return matched[name].astype(np.int8)
+
+        def mentioned(prefix, words):
+            flags = matched[[f'{prefix}:{word}' for word in words]]
+            # bool x str dot product concatenates the names of the matched words
+            listed = flags.astype(object).dot(np.array([f'{word}, ' for word in words], dtype=object))
+            return flags.sum(axis=1).astype(np.int8), listed.str[:-2].replace('', 'none')
+
+        features = pd.DataFrame(index=names.index)
+
+        # 🗺️ Geographic & Corridor Features
+        features['main_corridor'] = np.select(
+            [matched[f'corridor:{corridor}'] for corridor in ROUTE_CORRIDORS],
+            [corridor.lower().replace(' ', '_') for corridor in ROUTE_CORRIDORS],
+            default='other'
+        )
+        features['boroughs_mentioned_count'], features['boroughs_mentioned'] = mentioned('borough', ROUTE_BOROUGHS)
+        features['areas_mentioned_count'], features['areas_mentioned'] = mentioned('area', ROUTE_AREAS)
+
+        # 🚇 Service Type & Operational Features
+        has_local, has_express = matched['service:LOCAL'], matched['service:EXPRESS']
+        has_shuttle, has_crosstown = matched['service:SHUTTLE'], matched['service:CROSSTOWN']
+        features['service_type'] = np.select(
+            [has_local, has_express, has_shuttle, has_crosstown],
+            ['local', 'express', 'shuttle', 'crosstown'],
+            default='other'
+        )
+        features['service_pattern'] = np.select(
+            [has_local & has_express, matched['combined']],
+            ['mixed', 'combined'],
+            default='simple'
+        )
+        features['has_time_restriction'] = flag('time_restriction')
+        features['is_crosstown'] = has_crosstown.astype(np.int8)
+        features['is_avenue_based'] = flag('avenue')
+        features['is_street_based'] = flag('street')
+        # the row-wise version counted 'Local' / 'Express' in the upper-cased name,
+        # so its flag was always 0
+        features['has_multiple_services'] = (
+            upper.str.count('LOCAL') + upper.str.count('EXPRESS') > 1
+        ).astype(np.int8)
+
+        # 📊 Text-Based & Complexity Features
+        word_count = names.str.split().str.len()
+        features['long_name_length'] = names.str.len().astype(np.int32)
+        features['long_name_word_count'] = word_count.astype(np.int32)
+        four_boroughs = matched[[f'borough:{borough}' for borough in ROUTE_BOROUGHS[:4]]]
+        features['contains_borough_name'] = four_boroughs.any(axis=1).astype(np.int8)
+
+        # 🎯 Advanced Derived Features
+        features['serves_manhattan_cbd'] = flag('manhattan_cbd')
+        features['name_complexity'] = np.select(
+            [word_count <= 3, word_count <= 5], ['simple', 'medium'], default='complex'
+        )
+        features['likely_tourist_route'] = flag('tourist')
+        features['likely_commuter_route'] = flag('commuter')
+
+        # 🌐 Network Position Features
+        features['network_role'] = np.select(
+            [has_shuttle, has_crosstown, has_express & has_local, has_express, has_local],
+            ['connector', 'crosstown', 'hybrid', 'trunk', 'local'],
+            default='other'
+        )
+        borough_count = four_boroughs.sum(axis=1)
+        features['coverage_breadth'] = np.select(
+            [borough_count >= 3, borough_count == 2], ['regional', 'interborough'], default='local'
+        )
+
+        return features
+
     def feature_engineering_for_route_long_name(self, df, route_long_name_column='route_long_name'):
         """
         Optimized feature engineering for MTA route_long_name column
         Removed redundant and low-value features
+
+        Features are computed once per unique route_long_name with
+        route_long_name_feature_table and joined back to the rows by categorical code,
+        so the cost does not grow with the number of rows routes were joined to.
+        """
+        
+        # Create a copy to avoid modifying original dataframe (unless in utils.pipeline_mode)
+        original_columns = set(df.columns)
+        df_eng = maybe_copy(df)
+        
+        # Ensure we're working with strings and handle NaN values
+        df_eng[route_long_name_column] = df_eng[route_long_name_column].fillna('')
+
+        codes, uniques = pd.factorize(df_eng[route_long_name_column])
+        feature_table = self.route_long_name_feature_table(pd.Series(uniques, dtype=object))
+
+        for col in feature_table.columns:
+            values = feature_table[col]
+            if values.dtype == object or pd.api.types.is_string_dtype(values):
+                value_codes, categories = pd.factorize(values)
+                df_eng[col] = pd.Categorical.from_codes(value_codes[codes], categories=categories)
+            else:
+                df_eng[col] = values.to_numpy()[codes]
+        
+        print(f"✅ Created {len([col for col in df_eng.columns if col not in original_columns])} optimized features from {route_long_name_column}")
+        print(f"📊 New features: {[col for col in df_eng.columns if col not in original_columns]}")
+        
+        return df_eng
+
+    def feature_engineering_for_route_long_name_v1(self, df, route_long_name_column='route_long_name'):
+        """
+        Row-wise version of feature_engineering_for_route_long_name, kept for
+        benchmarks.benchmark_route_long_name_features (its has_multiple_services is
+        always 0, see route_long_name_feature_table)
         """
         
         # Create a copy to avoid modifying original dataframe
@@ -286,6 +454,7 @@ class FeatureEngineeringRouteDf():
         Apply all optimized feature engineering to the routes dataframe
         """
         print("🚀 Starting optimized feature engineering for routes dataframe...")
+        original_columns = set(df.columns)
         
         # Apply route_id feature engineering
         df_with_features = self.feature_engineering_for_route_id(df)
@@ -293,12 +462,81 @@ class FeatureEngineeringRouteDf():
         # Apply route_long_name feature engineering
         df_with_features = self.feature_engineering_for_route_long_name(df_with_features)
         
-        total_new_features = len([col for col in df_with_features.columns if col not in df.columns])
+        total_new_features = len([col for col in df_with_features.columns if col not in original_columns])
         print(f"🎉 Total new features created: {total_new_features}")
         
         return df_with_features
     
 
+# trip_id pieces are separated by '-', e.g. AFA23GEN-1038-00-Sunday-00_000600_1..S03R
+# One pass of this pattern gives every field extract_trip_features and
+# extract_stop_times_features need; the lookaheads pull sub-fields out of a piece
+# without consuming it.
+_TRIP_ID_PATTERN = re.compile(r"""
+    ^[^-]*                                              # parts[0]
+    (?:-(?P<route_code>[^-]*))?                         # parts[1]
+    (?:-(?P<day_name>[^-]*))?                           # parts[2]
+    (?:-(?P<trip_info>                                  # parts[3]
+        (?=(?:[^-]*?(?P<trip_time>\d{2}_\d{6}))?)         #   e.g. 00_000600
+        (?=(?:[^-]*?(?P<direction>[NS]\d{2}R))?)          #   e.g. S03R / N27R
+        [^-]*))?
+    (?:-(?P<block_info>                                 # parts[4]
+        (?:[^_-]*_[^_-]*_                               #   skip the first two '_' fields
+           (?=(?:[^-]*?\.\.(?P<stop_direction>\w+)(?=-|$))?))?
+        [^-]*))?
+""", re.VERBOSE)
+
+
+def parse_trip_ids(trip_ids):
+    """
+    Parse a trip_id column into typed columns, evaluating every unique trip_id once.
+
+    stop_times repeats each trip_id dozens of times, so the ids are factorized first,
+    _TRIP_ID_PATTERN runs over the unique values only, and the results are broadcast
+    back to the rows through the factorized codes.
+
+    Parameters
+    ----------
+    trip_ids : pd.Series of trip_id strings
+
+    Returns
+    -------
+    pd.DataFrame aligned with trip_ids:
+        - route_code, day_name, day_type (categorical)
+        - trip_time : Int32 seconds after midnight (MTA origin time is in 1/100 minute)
+        - dir_letter, route_num (categorical)
+        - is_northbound, is_southbound : int8 flags from the direction after '..'
+    """
+    codes, uniques = pd.factorize(trip_ids)
+    parsed = pd.Series(uniques, dtype=object).astype(str).str.extract(_TRIP_ID_PATTERN)
+
+    unique_features = {
+        "route_code": parsed["route_code"],
+        "day_name": parsed["day_name"],
+        "day_type": parsed["trip_info"],
+        "dir_letter": parsed["direction"].str[0],
+        "route_num": parsed["direction"].str[1:3],
+    }
+    unique_values = {
+        "trip_time": parsed["trip_time"].str[3:].astype(float).mul(0.6).round().astype("Int32"),
+        "is_northbound": parsed["stop_direction"].str.contains("N", na=False).astype(np.int8),
+        "is_southbound": parsed["stop_direction"].str.contains("S", na=False).astype(np.int8),
+    }
+
+    # codes are -1 for missing trip_ids; a trailing "missing" entry on every unique-level
+    # array makes plain numpy indexing map them to it
+    result = {}
+    for name, values in unique_features.items():
+        value_codes, categories = pd.factorize(values)
+        row_codes = np.append(value_codes, -1)[codes]
+        result[name] = pd.Categorical.from_codes(row_codes, categories=categories)
+    result["trip_time"] = pd.array(unique_values["trip_time"].tolist() + [pd.NA], dtype="Int32")[codes]
+    for name in ["is_northbound", "is_southbound"]:
+        result[name] = np.append(unique_values[name].to_numpy(), np.int8(0))[codes]
+
+    return pd.DataFrame(result, index=trip_ids.index)
+
+
 def extract_stop_times_features(stop_times_df):
     """
     Extracts key engineered features from a GTFS stop_times DataFrame.
@@ -315,41 +553,94 @@ def extract_stop_times_features(stop_times_df):
         DataFrame with new core feature columns added.
     """
 
-    df = stop_times_df.copy()
+    df = maybe_copy(stop_times_df)
 
     
     # ---------------------------------------------------------
     # 🚌 2. Trip ID decomposition (keep core identifiers)
     # ---------------------------------------------------------
+    parsed = parse_trip_ids(df['trip_id'])
+    df['day_type'] = parsed['day_type']
+
+    # Keep only direction flags
+    df['is_northbound'] = parsed['is_northbound']
+    df['is_southbound'] = parsed['is_southbound']
+
+
+    # ---------------------------------------------------------
+    # 🧹 4. Cleanup and return
+    # ---------------------------------------------------------
+    df.replace([np.inf, -np.inf], np.nan, inplace=True)
+
+    return df
+
+def extract_stop_times_features_v1(stop_times_df):
+    """Per-row str.split / str.extract version of extract_stop_times_features, kept for comparison."""
+    df = stop_times_df.copy()
     parts = df['trip_id'].str.split('-', expand=True)
     df['day_type'] = parts[3]
 
     # Extract post-day structure (block, trip, direction)
     temp = parts[4].str.split('_', n=2, expand=True)
     df['direction'] = temp[2].str.extract(r'\.\.(\w+)$')
-
-    # Keep only direction flags
     df['is_northbound'] = df['direction'].str.contains('N', na=False).astype(int)
     df['is_southbound'] = df['direction'].str.contains('S', na=False).astype(int)
+    df.replace([np.inf, -np.inf], np.nan, inplace=True)
+    df.drop(columns=['direction'], inplace=True, errors='ignore')
+    return df
 
+def extract_stops_features(stops_df, city="nyc"):
+    """
+    Stop hierarchy, stop name and stop id features.
 
-    # ---------------------------------------------------------
-    # 🧹 4. Cleanup and return
-    # ---------------------------------------------------------
-    df.replace([np.inf, -np.inf], np.nan, inplace=True)
+    The stop name flags and the area hint come from the city's keyword dictionaries
+    (keyword_matcher.CITY_KEYWORDS), each unique cleaned name being scanned once by
+    a KeywordMatcher instead of one str.contains pass per flag.
 
-    # Drop redundant intermediate parsing columns
-    df.drop(
-        columns=[
-            'direction',  # encoded already by north/south flags
-        ],
-        inplace=True,
-        errors='ignore'
-    )
+    Parameters
+    ----------
+    stops_df : stops DataFrame ('stop_id', 'stop_name', 'location_type', 'parent_station')
+
+    city : key of keyword_matcher.CITY_KEYWORDS (by default "nyc")
 
+    Returns
+    -------
+    pd.DataFrame
+    """
+    df = maybe_copy(stops_df)
+    
+    df['hierarchy_level'] = 0 
+    # Main stations (highest level)
+    df.loc[(df['location_type'] == 1.0) & (df['parent_station'].isna()), 'hierarchy_level'] = 2
+    
+    # Platforms within stations (middle level)  
+    df.loc[(df['location_type'].isna()) & (df['parent_station'].notna()), 'hierarchy_level'] = 1
+    
+    
+    #from stop name column 
+    stop_name_clean = df['stop_name'].str.replace(r'\(.*?\)', '', regex=True).str.strip().str.lower()
+
+    flags = city_matcher(city, "stop_flags").match(stop_name_clean, dtype=int)
+    for col in flags.columns:
+        df[col] = flags[col]
+    df['borough_hint'] = city_matcher(city, "stop_areas").first_label(stop_name_clean, default='Unknown')
+
+    df['stop_freq_rank'] = df['stop_name'].map(df['stop_name'].value_counts(normalize=True))
+
+    #from stop id column 
+    df['base_stop_id'] = df['stop_id'].str.extract(r'(\d+|[A-Z]\d+)')
+    df['direction'] = df['stop_id'].str.extract(r'([NSEW])$')
+
+    df['is_northbound'] = (df['direction'] == 'N').astype(int)
+    df['is_southbound'] = (df['direction'] == 'S').astype(int)
+    df['is_eastbound'] = (df['direction'] == 'E').astype(int)
+    df['is_westbound'] = (df['direction'] == 'W').astype(int)
+
+    
     return df
 
-def extract_stops_features(stops_df):
+def extract_stops_features_v1(stops_df):
+    """One str.contains pass per stop name flag, kept for comparison with extract_stops_features."""
     df = stops_df.copy()
     
     df['hierarchy_level'] = 0 
@@ -404,12 +695,13 @@ def extract_stops_features(stops_df):
     
     return df
 
-def extract_trip_features(df: pd.DataFrame) -> pd.DataFrame:
+def extract_trip_features(df: pd.DataFrame, city: str = "nyc") -> pd.DataFrame:
     """
     Extracts structured features from the 'trip_id' column.
 
     Parameters:
         df (pd.DataFrame): DataFrame containing a 'trip_id' column.
+        city (str): key of keyword_matcher.CITY_KEYWORDS for the stop_name hints.
 
     Returns:
         pd.DataFrame: Original DataFrame with new extracted feature columns.
@@ -417,32 +709,12 @@ def extract_trip_features(df: pd.DataFrame) -> pd.DataFrame:
     if 'trip_id' not in df.columns:
         raise KeyError("The DataFrame must contain a 'trip_id' column.")
 
-    # Split trip_id by '-'
-    split_cols = df["trip_id"].str.split('-', expand=True)
-
-    # Assign meaningful column names     #
-    df["route_code"] = split_cols[1]       # e.g., 1038 / R052
-    df["day_name"] = split_cols[2]         # e.g., Sunday / Saturday
-    df["trip_info"] = split_cols[3]        # e.g., 00_000600_1..S03R
-
-    # Extract sub-features from trip_info
-    df["trip_time"] = df["trip_info"].str.extract(r"(\d{2}_\d{6})")   # e.g., 00_000600
-    df["direction"] = df["trip_info"].str.extract(r"([NS]\d{2}R)")    # e.g., S03R / N27R
-    df["dir_letter"] = df["direction"].str[0]                         # N or S
-    df["route_num"] = df["direction"].str[1:3]                        # 03 or 27
-
-    df = df.drop(columns=['route_code', 'trip_info', 'direction'])
-
-
-    #from trip_headsign column 
-    split_cols = df["trip_id"].str.split('', expand=True)
-    df["trip_info"] = split_cols[3]      # Example: 00_000600_1..S03R
-
-    # --- 2. Extract details from trip_info ---
-    df["trip_time"] = df["trip_info"].str.extract(r"(\d{2}_\d{6})")   # 00_000600
-    df["direction"] = df["trip_info"].str.extract(r"([NS]\d{2}R)")    # S03R / N27R
-    df["dir_letter"] = df["direction"].str[0]                         # N or S
-    df["route_num"] = df["direction"].str[1:3]                        # 03 or 27
+    # Parse every unique trip_id once (route_code, day_name, trip_info, direction)
+    parsed = parse_trip_ids(df["trip_id"])
+    df["day_name"] = parsed["day_name"]      # e.g., Sunday / Saturday
+    df["trip_time"] = parsed["trip_time"]    # e.g., 00_000600 -> 360 seconds
+    df["dir_letter"] = parsed["dir_letter"]  # N or S
+    df["route_num"] = parsed["route_num"]    # 03 or 27
 
     # --- 3. Convert binary direction_id to a label ---
     if "direction_id" in df.columns:
@@ -458,11 +730,9 @@ def extract_trip_features(df: pd.DataFrame) -> pd.DataFrame:
 
     # --- 5. Extract geographic hints from stop_name (station names) ---
     if "stop_name" in df.columns:
-        df["is_brooklyn"] = df["stop_name"].str.contains("Brooklyn", case=False, na=False).astype(int)
-        df["is_manhattan"] = df["stop_name"].str.contains("Manhattan|42 St|Broadway|Times Sq", case=False, na=False).astype(int)
-        df["is_queens"] = df["stop_name"].str.contains("Queens|Jamaica", case=False, na=False).astype(int)
-        df["is_bronx"] = df["stop_name"].str.contains("Bronx|Woodlawn|Wakefield", case=False, na=False).astype(int)
-        df["is_stat_island"] = df["stop_name"].str.contains("St George|Tottenville", case=False, na=False).astype(int)
+        flags = city_matcher(city, "trip_stop_flags").match(df["stop_name"], dtype=int)
+        for col in flags.columns:
+            df[col] = flags[col]
 
     # --- 6. Cleanup temporary columns ---
     df.drop(columns=["trip_info"], inplace=True, errors="ignore")
@@ -0,0 +1,197 @@
+import hashlib
+import inspect
+import json
+import shutil
+import tempfile
+import zipfile
+import pyarrow as pa
+import pyarrow.parquet as pq
+from config import *
+import data_loader
+import preprocessing
+from id_registry import IdRegistry
+
+
+GTFS_TABLES = ["stops", "routes", "stop_times", "trips"]
+
+# table name -> cleaning function applied before the table is cached
+CLEANING_FUNCTIONS = {
+    "routes": preprocessing.clean_routes_data,
+    "stop_times": preprocessing.clean_stop_times_data,
+    "stops": preprocessing.clean_stops_data,
+    "trips": preprocessing.clean_trips_data,
+}
+
+MANIFEST_NAME = "manifest.json"
+
+# shared by every entry of a cache directory, so codes stay stable across feed versions
+ID_REGISTRY_NAME = "id_registry.npz"
+
+
+def _hash_file(path, hasher, block_size=1 << 20):
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            hasher.update(block)
+
+
+def hash_gtfs_feed(source):
+    """
+    Content hash of a GTFS feed.
+
+    Parameters
+    ----------
+    source : path to the gtfs_static.zip written by download_GTF_data_v2, or to an
+             extracted feed directory (only the *.txt files are hashed)
+
+    Returns
+    -------
+    str hex digest
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.endswith(".txt"):
+                hasher.update(name.encode())
+                _hash_file(os.path.join(source, name), hasher)
+    else:
+        _hash_file(source, hasher)
+    return hasher.hexdigest()
+
+
+def cleaning_code_version():
+    """
+    Hash of the cleaning code (the clean_* functions, their helpers and the string_nan_values list),
+    so cached tables are rebuilt whenever preprocessing.py changes how they are cleaned.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(repr(preprocessing.string_nan_values).encode())
+    hasher.update(inspect.getsource(preprocessing.id_as_str).encode())
+    hasher.update(inspect.getsource(preprocessing.replace_string_nans).encode())
+    for table_name in GTFS_TABLES:
+        hasher.update(inspect.getsource(CLEANING_FUNCTIONS[table_name]).encode())
+    return hasher.hexdigest()
+
+
+def _load_raw_tables(source, typed):
+    loader = data_loader.load_GTF_static_data_v3 if typed else data_loader.load_GTF_static_data_v2
+    if os.path.isdir(source):
+        return loader(source)
+    with tempfile.TemporaryDirectory() as extract_dir:
+        with zipfile.ZipFile(source, "r") as zip_ref:
+            zip_ref.extractall(extract_dir)
+        return loader(extract_dir)
+
+
+def _read_manifest(entry_dir):
+    manifest_path = os.path.join(entry_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def _prune_stale_entries(cache_dir, source, loader_name, keep_key):
+    # only entries of the same source and loader are stale: the v2 and v3 entries of
+    # a feed live side by side instead of removing each other on every switch
+    for key in os.listdir(cache_dir):
+        entry_dir = os.path.join(cache_dir, key)
+        if key == keep_key or not os.path.isdir(entry_dir):
+            continue
+        manifest = _read_manifest(entry_dir)
+        if manifest is None or manifest["source"] != source:
+            continue
+        if manifest.get("loader", key.rsplit("-", 1)[-1]) == loader_name:
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            print(f"🧹 Removed stale cache entry {key}")
+
+
+def read_cached_table(path):
+    """Memory-map a cached parquet table back into pandas."""
+    return pq.read_table(path, memory_map=True).to_pandas()
+
+
+def load_id_registry(cache_dir="gtfs_cache"):
+    """The id_registry.IdRegistry persisted in cache_dir (empty if there is none yet)."""
+    return IdRegistry.load_or_create(os.path.join(cache_dir, ID_REGISTRY_NAME))
+
+
+def _encode_ids(tables, cache_dir):
+    registry = load_id_registry(cache_dir)
+    encoded = {table_name: registry.encode_frame(df) for table_name, df in tables.items()}
+    registry.save(os.path.join(cache_dir, ID_REGISTRY_NAME))
+    return encoded
+
+
+def load_clean_gtfs_cached(source, cache_dir="gtfs_cache", typed=True, refresh=False, encode_ids=False):
+    """
+    Load the cleaned stops, routes, stop_times and trips tables, using a parquet cache
+    keyed by the feed content hash and the cleaning code version.
+
+    On a cache miss the feed is loaded, cleaned with the preprocessing.clean_* functions
+    and written to <cache_dir>/<key>/<table>.parquet. Later calls memory-map those files
+    back instead of re-parsing and re-cleaning the raw text files. Entries for the same
+    source and loader with an older key are removed once the new entry is written.
+
+    Parameters
+    ----------
+    source : gtfs_static.zip or extracted feed directory
+
+    cache_dir : directory holding the cache entries (by default "gtfs_cache")
+
+    typed : load with load_GTF_static_data_v3 (default) instead of load_GTF_static_data_v2
+
+    refresh : ignore any existing entry and rebuild it (by default false)
+
+    encode_ids : return trip_id / stop_id / route_id / service_id as int32 <column>_code
+                 columns of the registry persisted in cache_dir (see load_id_registry;
+                 by default false)
+
+    Returns
+    -------
+    dict {table_name: pd.DataFrame}
+    """
+    source = os.path.abspath(source)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    feed_hash = hash_gtfs_feed(source)
+    code_hash = cleaning_code_version()
+    loader_name = "v3" if typed else "v2"
+    key = f"{feed_hash[:16]}-{code_hash[:16]}-{loader_name}"
+    entry_dir = os.path.join(cache_dir, key)
+
+    manifest = None if refresh else _read_manifest(entry_dir)
+    if manifest is not None:
+        print(f"✅ Loading cleaned GTFS tables from cache {key}")
+        cached = {
+            table_name: read_cached_table(os.path.join(entry_dir, f"{table_name}.parquet"))
+            for table_name in manifest["tables"]
+        }
+        return _encode_ids(cached, cache_dir) if encode_ids else cached
+
+    print(f"🔄 Cache miss for {source}, loading and cleaning feed...")
+    raw = _load_raw_tables(source, typed)
+
+    # write into a temporary directory first so a crash never leaves a half-written entry
+    tmp_dir = tempfile.mkdtemp(prefix=f".{key}-", dir=cache_dir)
+    cleaned = {}
+    for table_name in GTFS_TABLES:
+        cleaned[table_name] = CLEANING_FUNCTIONS[table_name](raw[table_name])
+        pq.write_table(
+            pa.Table.from_pandas(cleaned[table_name], preserve_index=False),
+            os.path.join(tmp_dir, f"{table_name}.parquet"),
+        )
+    with open(os.path.join(tmp_dir, MANIFEST_NAME), "w") as f:
+        json.dump({
+            "source": source,
+            "feed_hash": feed_hash,
+            "code_hash": code_hash,
+            "loader": loader_name,
+            "tables": GTFS_TABLES,
+        }, f, indent=2)
+
+    shutil.rmtree(entry_dir, ignore_errors=True)
+    os.replace(tmp_dir, entry_dir)
+    _prune_stale_entries(cache_dir, source, loader_name, key)
+    print(f"💾 Cached cleaned GTFS tables to {entry_dir}")
+
+    return _encode_ids(cleaned, cache_dir) if encode_ids else cleaned
@@ -0,0 +1,147 @@
+import pyarrow as pa
+from config import *
+
+
+# id kinds with one shared code space across static and realtime data
+ID_KINDS = ["trip_id", "stop_id", "route_id", "service_id"]
+
+# column name -> id kind, for columns holding ids of another kind's code space
+ID_COLUMN_KINDS = {kind: kind for kind in ID_KINDS}
+ID_COLUMN_KINDS["parent_station"] = "stop_id"
+
+ID_CODE_DTYPE = np.int32
+
+# encoded columns are renamed <id column><ID_CODE_SUFFIX> (trip_id -> trip_id_code), so
+# codes are never confused with ids that merely happen to be stored as int32
+ID_CODE_SUFFIX = "_code"
+
+
+def code_column(column):
+    """Name of the registry code column of an id column, e.g. trip_id -> trip_id_code."""
+    return column + ID_CODE_SUFFIX
+
+
+class IdRegistry():
+    """
+    Stable int32 codes for trip_id, stop_id, route_id and service_id.
+
+    Codes are positions in an append-only index per kind: an id keeps its code for
+    the lifetime of the registry (and across runs once saved), so static tables,
+    realtime batches and lookup indexes encoded with the same registry can be joined
+    and grouped on int32 codes instead of hashing id strings. Missing ids are -1.
+    Decode back to strings only at the output, with decode / decode_frame.
+
+    Encoded frames and tables carry the codes in <id column>_code columns (see
+    code_column); values passed to encode are always ids, whatever their dtype.
+
+    Encoding is opt-in: gtfs_cache.load_clean_gtfs_cached(encode_ids=True),
+    realtime_decoder (registry=...), static_matcher (registry=...) and
+    utils.encode_id_columns use a registry when given one. The rest of the pipeline
+    (preprocessing's id_as_str, the multi-feed loader, the other matchers) still
+    joins on string ids.
+
+    Parameters
+    ----------
+    ids : optional dict {kind: sequence of ids in code order}
+    """
+
+    def __init__(self, ids=None):
+        ids = ids or {}
+        self.ids = {kind: pd.Index(ids.get(kind, []), dtype=object) for kind in ID_KINDS}
+
+    def __len__(self):
+        return sum(len(index) for index in self.ids.values())
+
+    def encode(self, kind, values, add=True):
+        """
+        int32 codes of values; new ids are appended when add is true, otherwise they get -1.
+
+        Only the unique values are looked up, and for categoricals only the categories.
+        """
+        if kind not in self.ids:
+            raise ValueError(f"Unknown id kind {kind!r}, expected one of {ID_KINDS}")
+        values = pd.Series(values) if not isinstance(values, pd.Series) else values
+
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            inverse = values.cat.codes.to_numpy()
+            uniques = values.cat.categories
+        else:
+            inverse, uniques = pd.factorize(values)
+
+        uniques = pd.Index(uniques).astype(str)
+        unique_codes = self.ids[kind].get_indexer(uniques)
+        new = unique_codes < 0
+        if add and new.any():
+            start = len(self.ids[kind])
+            self.ids[kind] = self.ids[kind].append(pd.Index(uniques[new], dtype=object))
+            unique_codes[new] = np.arange(start, start + new.sum())
+
+        codes = np.full(len(inverse), -1, dtype=ID_CODE_DTYPE)
+        valid = inverse >= 0
+        codes[valid] = unique_codes[inverse[valid]]
+        return codes
+
+    def decode(self, kind, codes):
+        """Categorical of the ids behind codes (-1 becomes NaN); no string is copied per row."""
+        return pd.Categorical.from_codes(np.asarray(codes, dtype=ID_CODE_DTYPE), categories=self.ids[kind])
+
+    def column_codes(self, df, column, add=True):
+        """
+        Codes of the id column of df: its <column>_code column when df is already
+        encoded, otherwise the encoded ids of column.
+        """
+        if code_column(column) in df.columns:
+            return df[code_column(column)].to_numpy(dtype=ID_CODE_DTYPE)
+        return self.encode(ID_COLUMN_KINDS[column], df[column], add=add)
+
+    def encode_frame(self, df, columns=None, add=True):
+        """
+        Replace the id columns of df (by default every ID_COLUMN_KINDS column present)
+        with int32 code columns named <column>_code, in the same position.
+        """
+        columns = [col for col in (columns or ID_COLUMN_KINDS) if col in df.columns]
+        df = df.copy()
+        for col in columns:
+            df[col] = self.encode(ID_COLUMN_KINDS[col], df[col], add=add)
+        return df.rename(columns={col: code_column(col) for col in columns})
+
+    def decode_frame(self, df, columns=None):
+        """Turn the <column>_code columns of df back into categorical id columns."""
+        columns = [col for col in (columns or ID_COLUMN_KINDS) if code_column(col) in df.columns]
+        df = df.copy()
+        for col in columns:
+            df[code_column(col)] = self.decode(ID_COLUMN_KINDS[col], df[code_column(col)].to_numpy())
+        return df.rename(columns={code_column(col): col for col in columns})
+
+    def encode_arrow(self, table, add=True):
+        """
+        Same as encode_frame for a pyarrow Table: dictionary-encoded id columns are
+        mapped through their dictionary only and become int32 <column>_code columns.
+        """
+        for i, name in enumerate(table.column_names):
+            if name not in ID_COLUMN_KINDS:
+                continue
+            column = table.column(i).combine_chunks()
+            if pa.types.is_dictionary(column.type):
+                dictionary_codes = self.encode(ID_COLUMN_KINDS[name], column.dictionary.to_pandas(), add=add)
+                # null slots are masked below; filled so the indices stay integers
+                indices = column.indices.fill_null(0).to_numpy(zero_copy_only=False)
+                valid = column.is_valid().to_numpy(zero_copy_only=False)
+                codes = np.full(len(column), -1, dtype=ID_CODE_DTYPE)
+                codes[valid] = dictionary_codes[indices[valid]]
+            else:
+                codes = self.encode(ID_COLUMN_KINDS[name], column.to_pandas(), add=add)
+            table = table.set_column(i, code_column(name), pa.array(codes, type=pa.int32()))
+        return table
+
+    def save(self, path):
+        np.savez(path, **{kind: index.to_numpy(dtype=str) for kind, index in self.ids.items()})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls({kind: data[kind] for kind in data.files})
+
+    @classmethod
+    def load_or_create(cls, path):
+        return cls.load(path) if os.path.exists(path) else cls()
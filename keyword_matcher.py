@@ -0,0 +1,171 @@
+from config import *
+
+
+# keyword dictionaries per city; flags are {column: [keywords]}, areas are ordered
+# {label: [keywords]} where the first matching label wins
+CITY_KEYWORDS = {
+    "nyc": {
+        # matched on the lower-cased stop name without its parenthesized part
+        "stop_flags": {
+            "is_terminal_stop": ['college', 'park', 'bay', 'stillwell', 'tottenville', 'st george', 'beach 116'],
+            "is_interchange_stop": ['times sq', 'grand central', 'union sq', 'atlantic av', 'barclays',
+                                    'court sq', 'fulton', 'brooklyn bridge'],
+            "has_direction_in_name": ['east', 'west', 'north', 'south'],
+            "is_airport_related": ['airport', 'jfk'],
+        },
+        "stop_areas": {
+            "Bronx": ['bronx'],
+            "Brooklyn": ['brooklyn'],
+            "Queens": ['queens'],
+            "Staten Island": ['staten'],
+            "Manhattan": ['manhattan'],
+        },
+        # geographic hints of extract_trip_features, matched on the raw stop name
+        "trip_stop_flags": {
+            "is_brooklyn": ['brooklyn'],
+            "is_manhattan": ['manhattan', '42 st', 'broadway', 'times sq'],
+            "is_queens": ['queens', 'jamaica'],
+            "is_bronx": ['bronx', 'woodlawn', 'wakefield'],
+            "is_stat_island": ['st george', 'tottenville'],
+        },
+    },
+    "delhi": {
+        "stop_flags": {
+            "is_terminal_stop": ['terminal', 'isbt', 'depot', 'bus stand', 'bus terminal'],
+            "is_interchange_stop": ['metro station', 'railway station', 'isbt', 'kashmere gate',
+                                    'rajiv chowk', 'anand vihar', 'central secretariat'],
+            "has_direction_in_name": ['east', 'west', 'north', 'south'],
+            "is_airport_related": ['airport', 'igi', 'terminal 1', 'terminal 3', 'aerocity'],
+        },
+        "stop_areas": {
+            "Dwarka": ['dwarka'],
+            "Rohini": ['rohini'],
+            "Noida": ['noida'],
+            "Gurugram": ['gurugram', 'gurgaon'],
+            "Faridabad": ['faridabad'],
+        },
+        "trip_stop_flags": {
+            "is_dwarka": ['dwarka'],
+            "is_rohini": ['rohini'],
+            "is_noida": ['noida'],
+            "is_gurugram": ['gurugram', 'gurgaon'],
+        },
+    },
+}
+
+
+def city_keywords(city):
+    """Keyword dictionaries of a city in CITY_KEYWORDS (e.g. "nyc", "delhi")."""
+    if city not in CITY_KEYWORDS:
+        raise ValueError(f"Unknown city {city!r}, expected one of {list(CITY_KEYWORDS)}")
+    return CITY_KEYWORDS[city]
+
+
+class KeywordMatcher():
+    """
+    Substring keyword flags for many columns from one scan of each unique string.
+
+    All keywords of all flags go into a single compiled regex, a zero-width lookahead
+    over the alternation of the keywords (longest first), so one finditer call lists
+    the keyword starting at every position of a string, overlapping matches included.
+    Shorter keywords that start at the same position are prefixes of the longest one
+    and are resolved from a precomputed keyword x flag table. Strings are factorized
+    first, so each distinct stop or route name is scanned once whatever the number of
+    rows it was joined to. Results are the same as one str.contains per flag.
+
+    Parameters
+    ----------
+    flags : dict {flag name: list of literal keywords}
+
+    case_sensitive : match case (by default false, strings and keywords are lower-cased)
+    """
+
+    def __init__(self, flags, case_sensitive=False):
+        self.flags = list(flags)
+        self.case_sensitive = case_sensitive
+
+        keyword_flags = {}
+        for i, name in enumerate(self.flags):
+            for word in flags[name]:
+                word = self._normalize(word)
+                if word:
+                    keyword_flags.setdefault(word, set()).add(i)
+        self.keywords = sorted(keyword_flags, key=lambda word: (-len(word), word))
+        self._keyword_index = {word: i for i, word in enumerate(self.keywords)}
+
+        # a match of a keyword is also a match of every keyword that is its prefix
+        self._table = np.zeros((len(self.keywords), len(self.flags)), dtype=bool)
+        for i, word in enumerate(self.keywords):
+            for other, flag_ids in keyword_flags.items():
+                if word.startswith(other):
+                    self._table[i, list(flag_ids)] = True
+
+        alternation = '|'.join(re.escape(word) for word in self.keywords)
+        self._pattern = re.compile(f'(?=({alternation}))') if self.keywords else None
+
+    def _normalize(self, text):
+        return text if self.case_sensitive else text.lower()
+
+    def match_unique(self, strings):
+        """
+        Flags of a sequence of (unique) strings; missing values match nothing.
+
+        Returns
+        -------
+        np.ndarray of bool, shape (len(strings), number of flags)
+        """
+        result = np.zeros((len(strings), len(self.flags)), dtype=bool)
+        if self._pattern is None:
+            return result
+        for row, text in enumerate(strings):
+            if not isinstance(text, str):
+                continue
+            hits = {self._keyword_index[m.group(1)] for m in self._pattern.finditer(self._normalize(text))}
+            if hits:
+                result[row] = self._table[list(hits)].any(axis=0)
+        return result
+
+    def match(self, values, dtype=np.int8):
+        """
+        Flag columns for every value of a Series, scanning each unique value once.
+
+        Parameters
+        ----------
+        values : pd.Series of strings (object, string or categorical)
+
+        dtype : dtype of the flag columns (by default np.int8)
+
+        Returns
+        -------
+        pd.DataFrame with one column per flag, on the index of values
+        """
+        codes, uniques = pd.factorize(values)
+        unique_flags = self.match_unique(np.asarray(uniques, dtype=object))
+        row_flags = np.zeros((len(codes), len(self.flags)), dtype=bool)
+        valid = codes >= 0
+        row_flags[valid] = unique_flags[codes[valid]]
+        return pd.DataFrame(row_flags.astype(dtype), index=values.index, columns=self.flags)
+
+    def first_label(self, values, default='Unknown'):
+        """
+        Name of the first flag (in flag order) matching every value, like an np.select
+        over one str.contains per flag; default where none matches.
+        """
+        flags = self.match(values, dtype=bool).to_numpy()
+        labels = np.array(self.flags + [default], dtype=object)
+        first = np.where(flags.any(axis=1), flags.argmax(axis=1), len(self.flags))
+        return pd.Series(labels[first], index=values.index)
+
+
+_MATCHERS = {}
+
+
+def city_matcher(city, kind, case_sensitive=False):
+    """
+    KeywordMatcher over one keyword dictionary of a city (e.g. "stop_flags",
+    "stop_areas", "trip_stop_flags"), compiled once per process.
+    """
+    key = (city, kind, case_sensitive)
+    if key not in _MATCHERS:
+        _MATCHERS[key] = KeywordMatcher(city_keywords(city)[kind], case_sensitive=case_sensitive)
+    return _MATCHERS[key]
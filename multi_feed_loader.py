@@ -0,0 +1,117 @@
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+import pyarrow as pa
+from config import *
+import data_loader
+import gtfs_cache
+
+
+# columns holding feed-local ids that need a prefix when feeds are stitched together
+GTFS_ID_COLUMNS = sorted({
+    col
+    for table_schema in data_loader.GTFS_STATIC_SCHEMA.values()
+    for col, kind in table_schema.items()
+    if kind == "id"
+})
+
+
+def feed_prefix(feed_path):
+    """Default id prefix of a feed: its directory name, or the zip name without extension."""
+    name = os.path.basename(os.path.normpath(feed_path))
+    return os.path.splitext(name)[0] if name.endswith(".zip") else name
+
+
+def _prefix_ids(df, prefix):
+    for col in GTFS_ID_COLUMNS:
+        if col in df.columns:
+            if not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype("category")
+            # only the categories are rewritten, not every row
+            df[col] = df[col].cat.rename_categories(lambda value: f"{prefix}:{value}")
+    return df
+
+
+def _to_arrow(df):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # widen dictionary indices so tables from different feeds share one schema
+    schema = pa.schema([
+        field.with_type(data_loader.GTFS_ID_TYPE) if pa.types.is_dictionary(field.type) else field
+        for field in table.schema
+    ])
+    return table.cast(schema)
+
+
+def _load_clean_feed(feed_path, prefix, cache_dir):
+    if cache_dir is not None:
+        cleaned = gtfs_cache.load_clean_gtfs_cached(feed_path, cache_dir=cache_dir)
+    elif os.path.isdir(feed_path):
+        raw = data_loader.load_GTF_static_data_v3(feed_path)
+        cleaned = {name: gtfs_cache.CLEANING_FUNCTIONS[name](raw[name]) for name in gtfs_cache.GTFS_TABLES}
+    else:
+        with tempfile.TemporaryDirectory() as extract_dir:
+            with zipfile.ZipFile(feed_path, "r") as zip_ref:
+                zip_ref.extractall(extract_dir)
+            return _load_clean_feed(extract_dir, prefix, None)
+
+    return {
+        name: _to_arrow(_prefix_ids(df, prefix) if prefix else df)
+        for name, df in cleaned.items()
+    }
+
+
+def load_GTF_static_feeds_parallel(feeds, prefixes=None, prefix_ids=True, max_workers=None,
+                                   cache_dir=None, as_arrow=False):
+    """
+    Load, clean and merge several GTFS feeds (agency / borough feeds) in parallel.
+
+    Every feed is loaded with load_GTF_static_data_v3 and cleaned with the
+    preprocessing.clean_* functions in its own worker process. Ids are prefixed with
+    "<prefix>:" so ids from different feeds never collide, and the per-feed Arrow
+    tables are concatenated chunk-wise with pa.concat_tables, without copying rows.
+
+    Parameters
+    ----------
+    feeds : list of feed directories or gtfs zips
+
+    prefixes : optional list of id prefixes, one per feed (by default the feed name)
+
+    prefix_ids : prefix the *_id columns (by default true)
+
+    max_workers : number of worker processes (by default one per CPU, capped at len(feeds))
+
+    cache_dir : optional gtfs_cache directory; each worker then goes through
+                gtfs_cache.load_clean_gtfs_cached
+
+    as_arrow : return pyarrow Tables instead of pandas DataFrames (by default false)
+
+    Returns
+    -------
+    dict {table_name: merged table}
+    """
+    feeds = [os.path.abspath(feed) for feed in feeds]
+    if prefixes is None:
+        prefixes = [feed_prefix(feed) for feed in feeds]
+    if len(prefixes) != len(feeds):
+        raise ValueError("prefixes must have one entry per feed")
+    if prefix_ids and len(set(prefixes)) != len(prefixes):
+        raise ValueError(f"Feed prefixes must be unique, got {prefixes}")
+    if not prefix_ids:
+        prefixes = [None] * len(feeds)
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(feeds))
+    print(f"🚀 Loading {len(feeds)} feeds with {max_workers} worker processes...")
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        per_feed = list(pool.map(_load_clean_feed, feeds, prefixes, [cache_dir] * len(feeds)))
+
+    merged = {}
+    for table_name in gtfs_cache.GTFS_TABLES:
+        # permissive promotion fills columns missing from a feed with nulls
+        table = pa.concat_tables(
+            [tables[table_name] for tables in per_feed], promote_options="permissive"
+        )
+        merged[table_name] = table if as_arrow else table.to_pandas(types_mapper=data_loader.GTFS_PANDAS_TYPES.get)
+        print(f"✅ {table_name}: {table.num_rows:,} rows from {len(feeds)} feeds")
+
+    return merged
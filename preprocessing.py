@@ -1,4 +1,9 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 from config import *
+from utils import maybe_copy, replace_string_nans
 
 
 string_nan_values = [
@@ -31,9 +36,19 @@ string_nan_values = [
 ]
 
 
+def id_as_str(series):
+    """
+    String ids; categorical ids (load_GTF_static_data_v3) only get their categories
+    cast, instead of being expanded into one Python string per row.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.rename_categories(series.cat.categories.astype(str))
+    return series.astype(str)
+
+
 # 1️⃣ Routes --done
 def clean_routes_data(df):
-    df = df.copy()
+    df = maybe_copy(df)
 
     def map_colors_in_route_color(df):
         # Simple conversion: HEX code to Color Name
@@ -59,9 +74,9 @@ def clean_routes_data(df):
             
         return color_names_series
     
-    df = df.replace(string_nan_values, pd.NA)
+    df = replace_string_nans(df, string_nan_values)
     df = df.drop_duplicates(subset=["route_id"])
-    df["route_id"] = df["route_id"].astype(str)
+    df["route_id"] = id_as_str(df["route_id"])
     df["route_short_name"] = df["route_short_name"].str.strip().str.upper()
     df["route_long_name"] = df["route_long_name"].str.strip().str.title()
     valid_types = [0, 1, 2, 3, 4, 5, 6, 7]
@@ -76,11 +91,14 @@ def clean_routes_data(df):
 
 # 2️⃣ Stop Times
 def clean_stop_times_data(df):
-    df = df.copy()
-    df = df.replace(string_nan_values, pd.NA)
-    # Convert times to timedelta (HH:MM:SS)
+    df = maybe_copy(df)
+    df = replace_string_nans(df, string_nan_values)
+    # Convert times to timedelta (HH:MM:SS, or int seconds from load_GTF_static_data_v3)
     for col in ["arrival_time", "departure_time"]:
-        df[col] = pd.to_timedelta(df[col], errors="coerce")
+        if pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = pd.to_timedelta(df[col], unit="s")
+        else:
+            df[col] = pd.to_timedelta(df[col], errors="coerce")
     df = df.dropna(subset=["trip_id", "stop_id"])
     df["stop_sequence"] = df["stop_sequence"].astype(int)
 
@@ -93,10 +111,10 @@ def clean_stop_times_data(df):
 
 # 3️⃣ Stops
 def clean_stops_data(df):
-    df = df.copy()
-    df = df.replace(string_nan_values, pd.NA)
+    df = maybe_copy(df)
+    df = replace_string_nans(df, string_nan_values)
     df = df.drop_duplicates(subset=["stop_id"])
-    df["stop_id"] = df["stop_id"].astype(str)
+    df["stop_id"] = id_as_str(df["stop_id"])
     df = df.dropna(subset=["stop_lat", "stop_lon"])
     df = df[(df["stop_lat"].between(-90, 90)) & (df["stop_lon"].between(-180, 180))]
     
@@ -104,10 +122,222 @@ def clean_stops_data(df):
 
 
 # 4️⃣ Taxi / Mobility Data
+TAXI_STRING_NAN_VALUES = ["", " ", "NA", "NaN", "nan", "None", "null", "NULL"]
+TAXI_DATETIME_COLUMNS = ["tpep_pickup_datetime", "tpep_dropoff_datetime"]
+TAXI_CATEGORICAL_COLUMNS = ["VendorID", "store_and_fwd_flag", "payment_type", "RatecodeID"]
+TAXI_ZONE_COLUMNS = ["PULocationID", "DOLocationID"]
+
+# column -> (low, high, low is valid); values outside the range become NaN
+TAXI_VALID_RANGES = {
+    "passenger_count": (0, 6, False),
+    "trip_distance": (0, 100, False),
+    "fare_amount": (0, 1000, True),
+    "total_amount": (0, 2000, True),
+}
+TAXI_MAX_DURATION_MIN = 180
+
+
+def _clean_taxi_batch(df, categorical=True):
+    # validity rules of clean_taxi_data as whole-column masks, on a frame the caller owns
+    df = replace_string_nans(df, TAXI_STRING_NAN_VALUES, np.nan)
+
+    for col in TAXI_DATETIME_COLUMNS:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+    valid_times = df["tpep_pickup_datetime"].notna().to_numpy() & df["tpep_dropoff_datetime"].notna().to_numpy()
+    if not valid_times.all():
+        df = df[valid_times]
+
+    for col, (low, high, low_is_valid) in TAXI_VALID_RANGES.items():
+        if col not in df.columns:
+            continue
+        values = df[col] if pd.api.types.is_numeric_dtype(df[col]) else pd.to_numeric(df[col], errors="coerce")
+        values = values.to_numpy(dtype=np.float64, na_value=np.nan)
+        too_low = values < low if low_is_valid else values <= low
+        df[col] = np.where(too_low | (values > high), np.nan, values)
+
+    if categorical:
+        for col in TAXI_CATEGORICAL_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].astype("category")
+
+    pickup = df["tpep_pickup_datetime"].to_numpy(dtype="datetime64[ns]")
+    dropoff = df["tpep_dropoff_datetime"].to_numpy(dtype="datetime64[ns]")
+    duration = (dropoff - pickup) / np.timedelta64(1, "s") / 60
+    df["trip_duration_min"] = np.where((duration <= 0) | (duration > TAXI_MAX_DURATION_MIN), np.nan, duration)
+
+    for col in TAXI_ZONE_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
+
+    keep = np.ones(len(df), dtype=bool)
+    if "trip_distance" in df.columns:
+        keep = df["trip_distance"].notna().to_numpy() | df["trip_duration_min"].notna().to_numpy()
+    if not keep.all():
+        df = df[keep]
+    return df.reset_index(drop=True)
+
+
 def clean_taxi_data(df: pd.DataFrame) -> pd.DataFrame:
     """
     Clean NYC Taxi dataset for anomaly detection tasks.
     Keeps all columns but fixes invalid values, types, and timestamps.
+
+    Same rules as clean_taxi_data_v1, applied as vectorized masks: the string
+    missing values are only looked for in text columns, and the frame is copied
+    once instead of at every step (not at all inside utils.pipeline_mode).
+    """
+    return _clean_taxi_batch(maybe_copy(df))
+
+
+def _taxi_pushdown_filter(schema, start=None, end=None):
+    # rows clean_taxi_data would drop, as a reader filter: missing timestamps, and
+    # neither a valid distance nor a valid duration; plus an optional pickup window
+    pickup, dropoff = (pc.field(col) for col in TAXI_DATETIME_COLUMNS)
+    expression = pickup.is_valid() & dropoff.is_valid()
+    if start is not None:
+        expression &= pickup >= pa.scalar(pd.Timestamp(start).to_pydatetime())
+    if end is not None:
+        expression &= pickup < pa.scalar(pd.Timestamp(end).to_pydatetime())
+
+    if all(pa.types.is_timestamp(schema.field(col).type) for col in TAXI_DATETIME_COLUMNS):
+        unit = schema.field(TAXI_DATETIME_COLUMNS[0]).type.unit
+        duration = dropoff - pickup
+        valid_duration = ((duration > pa.scalar(datetime.timedelta(0), pa.duration(unit)))
+                          & (duration <= pa.scalar(datetime.timedelta(minutes=TAXI_MAX_DURATION_MIN), pa.duration(unit))))
+        if "trip_distance" in schema.names and pa.types.is_floating(schema.field("trip_distance").type):
+            low, high, _ = TAXI_VALID_RANGES["trip_distance"]
+            valid_distance = (pc.field("trip_distance") > low) & (pc.field("trip_distance") <= high)
+            expression &= valid_distance | valid_duration
+    return expression
+
+
+def clean_taxi_parquet(path, start=None, end=None, columns=None, batch_size=1_000_000, output_path=None):
+    """
+    Clean a yellow_tripdata parquet file row group by row group.
+
+    The timestamp checks, the optional pickup window and the distance / duration
+    rule that drops rows are pushed down to the parquet reader, so those rows are
+    never converted to pandas; the remaining rules run on each batch with the
+    vectorized masks of clean_taxi_data.
+
+    Parameters
+    ----------
+    path : taxi parquet file
+
+    start, end : optional pickup window [start, end), e.g. the month of the file
+
+    columns : optional columns to read (by default all)
+
+    batch_size : maximum rows per batch (by default 1,000,000)
+
+    output_path : optional parquet path; batches are then written as they are
+                  cleaned and only the number of rows is returned
+
+    Returns
+    -------
+    pd.DataFrame, or the number of rows written when output_path is given
+    """
+    dataset = ds.dataset(path, format="parquet")
+    expression = _taxi_pushdown_filter(dataset.schema, start, end)
+    batches = dataset.to_batches(columns=columns, filter=expression, batch_size=batch_size)
+
+    if output_path is None:
+        frames = [_clean_taxi_batch(batch.to_pandas(), categorical=False) for batch in batches if batch.num_rows]
+        if not frames:
+            return clean_taxi_data(dataset.schema.empty_table().to_pandas())
+        df = pd.concat(frames, ignore_index=True)
+        for col in TAXI_CATEGORICAL_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].astype("category")
+        return df
+
+    writer = None
+    n_rows = 0
+    try:
+        for batch in batches:
+            if not batch.num_rows:
+                continue
+            table = pa.Table.from_pandas(_clean_taxi_batch(batch.to_pandas(), categorical=False), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path + ".tmp", table.schema)
+            writer.write_table(table.cast(writer.schema))
+            n_rows += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is not None:
+        os.replace(output_path + ".tmp", output_path)
+    return n_rows
+
+
+def _file_month(path):
+    found = re.search(r"(\d{4})-(\d{2})", os.path.basename(path))
+    if found is None:
+        return None, None
+    start = pd.Timestamp(year=int(found.group(1)), month=int(found.group(2)), day=1)
+    return start, start + pd.offsets.MonthBegin(1)
+
+
+def _clean_taxi_file(path, output_dir, restrict_to_month, batch_size):
+    start, end = _file_month(path) if restrict_to_month else (None, None)
+    output_path = os.path.join(output_dir, os.path.basename(path))
+    n_rows = clean_taxi_parquet(path, start=start, end=end, batch_size=batch_size, output_path=output_path)
+    return output_path, n_rows
+
+
+def clean_taxi_files(paths, output_dir, max_workers=None, restrict_to_month=True, batch_size=1_000_000):
+    """
+    Clean monthly taxi parquet files (e.g. a year of yellow_tripdata_YYYY-MM.parquet)
+    into <output_dir>/<same file name>, one file per worker process.
+
+    Each worker streams its file batch by batch into the output parquet, so memory
+    stays flat whatever the number of months.
+
+    Parameters
+    ----------
+    paths : taxi parquet paths
+
+    output_dir : directory of the cleaned files
+
+    max_workers : number of processes (by default one per CPU, at most one per file)
+
+    restrict_to_month : drop pickups outside the YYYY-MM of the file name (by default true)
+
+    batch_size : maximum rows per batch (by default 1,000,000)
+
+    Returns
+    -------
+    dict {output path: number of rows}
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = sorted(paths)
+    max_workers = max(1, min(max_workers or os.cpu_count() or 1, len(paths)))
+    results = {}
+    if max_workers == 1:
+        for path in paths:
+            output_path, n_rows = _clean_taxi_file(path, output_dir, restrict_to_month, batch_size)
+            results[output_path] = n_rows
+            print(f"💾 {os.path.basename(path)}: {n_rows:,} clean rows")
+        return results
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_clean_taxi_file, path, output_dir, restrict_to_month, batch_size) for path in paths]
+        for path, future in zip(paths, futures):
+            output_path, n_rows = future.result()
+            results[output_path] = n_rows
+            print(f"💾 {os.path.basename(path)}: {n_rows:,} clean rows")
+    return results
+
+
+def clean_taxi_data_v1(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Clean NYC Taxi dataset for anomaly detection tasks.
+    Keeps all columns but fixes invalid values, types, and timestamps.
+
+    Step-by-step version of clean_taxi_data, kept for comparison.
     """
 
     df = df.copy()
@@ -177,12 +407,12 @@ def clean_taxi_data(df: pd.DataFrame) -> pd.DataFrame:
 
 # 5️⃣ Trips
 def clean_trips_data(df):
-    df = df.copy()
-    df = df.replace(string_nan_values, pd.NA)
+    df = maybe_copy(df)
+    df = replace_string_nans(df, string_nan_values)
     df = df.dropna(subset=["route_id", "trip_id"])
-    df["trip_id"] = df["trip_id"].astype(str)
-    df["route_id"] = df["route_id"].astype(str)
-    df["service_id"] = df["service_id"].astype(str)
+    df["trip_id"] = id_as_str(df["trip_id"])
+    df["route_id"] = id_as_str(df["route_id"])
+    df["service_id"] = id_as_str(df["service_id"])
     df = df.drop_duplicates(subset=["trip_id"])
     df["direction_id"] = df["direction_id"].fillna(0).astype(int)
 
@@ -191,8 +421,8 @@ def clean_trips_data(df):
 
 # 6️⃣ Weather
 def clean_weather_data(df):
-    df = df.copy()
-    df = df.replace(string_nan_values, pd.NA)
+    df = maybe_copy(df)
+    df = replace_string_nans(df, string_nan_values)
     # Convert datetime column
     datetime_col = None
     for col in ["datetime", "timestamp", "date"]:
@@ -210,7 +440,7 @@ def clean_weather_data(df):
 
     # Fill missing numerical values (temperature, humidity, etc.)
     num_cols = df.select_dtypes(include=[np.number]).columns
-    df[num_cols] = df[num_cols].fillna(method="ffill").fillna(method="bfill")
+    df[num_cols] = df[num_cols].ffill().bfill()
     # Drop duplicates
     df = df.drop_duplicates()
     return df
@@ -0,0 +1,207 @@
+from concurrent.futures import ProcessPoolExecutor
+import pyarrow as pa
+from google.transit import gtfs_realtime_pb2
+from config import *
+
+
+class TripUpdateDecoder():
+    """
+    Decodes GTFS-rt tripUpdates snapshots straight into typed column buffers.
+
+    Per snapshot the stop_time_updates are counted first, then written into
+    preallocated numpy arrays: ids as int32 codes into interned dictionaries
+    (shared by every snapshot decoded with the same decoder), times as int64
+    epoch seconds and delays as int32, each with a validity mask. Nothing is built
+    per record except the codes themselves.
+
+    Example
+    -------
+    decoder = TripUpdateDecoder()
+    for path in paths:
+        decoder.decode_file(path)
+    table = decoder.to_arrow()
+    """
+
+    def __init__(self):
+        self.trip_codes = {}
+        self.route_codes = {}
+        self.stop_codes = {}
+        self._batches = []
+
+    @staticmethod
+    def _intern(codes, value):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+        return code
+
+    def decode(self, content, snapshot_time=None):
+        """
+        Decode one serialized FeedMessage and keep its columns.
+
+        snapshot_time defaults to the feed header timestamp. Returns the number of
+        stop_time_updates decoded.
+        """
+        feed = gtfs_realtime_pb2.FeedMessage()
+        feed.ParseFromString(content)
+
+        trip_updates = [entity.trip_update for entity in feed.entity if entity.HasField("trip_update")]
+        n = sum(len(trip_update.stop_time_update) for trip_update in trip_updates)
+
+        trip_idx = np.empty(n, dtype=np.int32)
+        route_idx = np.empty(n, dtype=np.int32)
+        stop_idx = np.empty(n, dtype=np.int32)
+        arrival_time = np.zeros(n, dtype=np.int64)
+        departure_time = np.zeros(n, dtype=np.int64)
+        arrival_delay = np.zeros(n, dtype=np.int32)
+        departure_delay = np.zeros(n, dtype=np.int32)
+        has_arrival = np.zeros(n, dtype=bool)
+        has_departure = np.zeros(n, dtype=bool)
+        has_arrival_delay = np.zeros(n, dtype=bool)
+        has_departure_delay = np.zeros(n, dtype=bool)
+
+        intern, stop_codes = self._intern, self.stop_codes
+        i = 0
+        for trip_update in trip_updates:
+            updates = trip_update.stop_time_update
+            end = i + len(updates)
+            # trip and route are the same for every update of the entity: one slice fill
+            trip_idx[i:end] = intern(self.trip_codes, trip_update.trip.trip_id)
+            route_idx[i:end] = intern(self.route_codes, trip_update.trip.route_id)
+
+            stops = []
+            for j, stu in enumerate(updates, start=i):
+                stop_id = stu.stop_id
+                code = stop_codes.get(stop_id)
+                if code is None:
+                    code = stop_codes[stop_id] = len(stop_codes)
+                stops.append(code)
+                if stu.HasField("arrival"):
+                    arrival = stu.arrival
+                    has_arrival[j] = True
+                    arrival_time[j] = arrival.time
+                    if arrival.HasField("delay"):
+                        has_arrival_delay[j] = True
+                        arrival_delay[j] = arrival.delay
+                if stu.HasField("departure"):
+                    departure = stu.departure
+                    has_departure[j] = True
+                    departure_time[j] = departure.time
+                    if departure.HasField("delay"):
+                        has_departure_delay[j] = True
+                        departure_delay[j] = departure.delay
+            stop_idx[i:end] = stops
+            i = end
+
+        if snapshot_time is None:
+            snapshot_time = feed.header.timestamp
+        self._batches.append({
+            "timestamp": np.full(n, snapshot_time, dtype=np.int64),
+            "trip_id": trip_idx,
+            "route_id": route_idx,
+            "stop_id": stop_idx,
+            "arrival_time": (arrival_time, has_arrival),
+            "departure_time": (departure_time, has_departure),
+            "arrival_delay": (arrival_delay, has_arrival_delay),
+            "departure_delay": (departure_delay, has_departure_delay),
+        })
+        return n
+
+    def decode_file(self, path, snapshot_time=None):
+        with open(path, "rb") as f:
+            return self.decode(f.read(), snapshot_time)
+
+    @staticmethod
+    def _dictionary(codes):
+        # dict preserves insertion order, so position == code
+        return pa.array(list(codes), type=pa.string())
+
+    def to_arrow(self, include_timestamp=False, dictionary_ids=True):
+        """
+        All decoded snapshots as one pyarrow Table with dictionary<int32, string> ids
+        (plain strings with dictionary_ids=False), int64 epoch-second times and int32
+        delays (nulls where the field was absent).
+        """
+        def column(name):
+            return np.concatenate([batch[name] for batch in self._batches]) if self._batches else np.empty(0, np.int64)
+
+        def masked(name, type):
+            if not self._batches:
+                return pa.array([], type=type)
+            values = np.concatenate([batch[name][0] for batch in self._batches])
+            valid = np.concatenate([batch[name][1] for batch in self._batches])
+            return pa.array(values, type=type, mask=~valid)
+
+        arrays = {}
+        if include_timestamp:
+            arrays["timestamp"] = pa.array(column("timestamp"), type=pa.timestamp("s"))
+        for name, codes in [("trip_id", self.trip_codes), ("route_id", self.route_codes), ("stop_id", self.stop_codes)]:
+            indices = pa.array(column(name).astype(np.int32, copy=False), type=pa.int32())
+            arrays[name] = pa.DictionaryArray.from_arrays(indices, self._dictionary(codes))
+            if not dictionary_ids:
+                arrays[name] = arrays[name].dictionary_decode()
+        arrays["arrival_time"] = masked("arrival_time", pa.int64())
+        arrays["departure_time"] = masked("departure_time", pa.int64())
+        arrays["arrival_delay"] = masked("arrival_delay", pa.int32())
+        arrays["departure_delay"] = masked("departure_delay", pa.int32())
+        return pa.table(arrays)
+
+
+def snapshot_files(snapshot_dir, feed_name="tripUpdates"):
+    """
+    Sorted .pb files of a snapshot directory: either the directory itself or, for the
+    SnapshotWriter layout, its <feed_name> sub-directory.
+    """
+    feed_dir = os.path.join(snapshot_dir, feed_name)
+    if os.path.isdir(feed_dir):
+        snapshot_dir = feed_dir
+    return [os.path.join(snapshot_dir, f) for f in sorted(os.listdir(snapshot_dir)) if f.endswith(".pb")]
+
+
+def _decode_files(paths, include_timestamp):
+    decoder = TripUpdateDecoder()
+    for path in paths:
+        decoder.decode_file(path)
+    return decoder.to_arrow(include_timestamp=include_timestamp)
+
+
+def decode_trip_update_files(paths, include_timestamp=True, max_workers=1, registry=None):
+    """
+    Decode many tripUpdates snapshots into one pyarrow Table.
+
+    With max_workers > 1 the files are split into contiguous chunks decoded in
+    separate processes; the per-chunk dictionaries are unified afterwards, so the
+    result has the same single dictionary per id column either way.
+
+    Parameters
+    ----------
+    paths : list of .pb files
+
+    include_timestamp : add the feed header timestamp of each snapshot (by default true)
+
+    max_workers : number of worker processes (by default 1, decode in this process)
+
+    registry : optional id_registry.IdRegistry; trip_id / route_id / stop_id are then
+               returned as its int32 codes in trip_id_code / route_id_code /
+               stop_id_code (mapped through the dictionaries only)
+
+    Returns
+    -------
+    pa.Table
+    """
+    paths = list(paths)
+    max_workers = max(1, min(max_workers or os.cpu_count() or 1, len(paths)))
+    if max_workers == 1:
+        table = _decode_files(paths, include_timestamp)
+    else:
+        chunk_size = -(-len(paths) // max_workers)
+        chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            tables = list(pool.map(_decode_files, chunks, [include_timestamp] * len(chunks)))
+        table = pa.concat_tables(tables).unify_dictionaries().combine_chunks()
+    return table if registry is None else registry.encode_arrow(table)
+
+
+def trip_updates_to_df(table):
+    """pyarrow Table from TripUpdateDecoder to pandas: categorical ids, Int64 times, Int32 delays."""
+    return table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype(), pa.int32(): pd.Int32Dtype()}.get)
@@ -0,0 +1,267 @@
+import asyncio
+import random
+import aiohttp
+from aiohttp import web
+from realtime_decoder import TripUpdateDecoder, trip_updates_to_df
+from config import *
+
+
+def obanyc_feeds(api_key):
+    """The three MTA bus GTFS-rt endpoints (tripUpdates, vehiclePositions, alerts)."""
+    base_url = "https://gtfsrt.prod.obanyc.com"
+    return {
+        name: f"{base_url}/{name}?key={api_key}"
+        for name in ["tripUpdates", "vehiclePositions", "alerts"]
+    }
+
+
+def backoff_delay(failures, base_seconds=2.0, max_seconds=120.0):
+    """Exponential backoff with +/-50% jitter so failing feeds do not retry in lockstep."""
+    delay = min(max_seconds, base_seconds * 2 ** (failures - 1))
+    return delay * random.uniform(0.5, 1.5)
+
+
+async def poll_feed(session, name, url, on_snapshot, interval_seconds=30, stop_event=None,
+                    timeout_seconds=20, max_backoff_seconds=120.0):
+    """
+    Poll one GTFS-rt endpoint until stop_event is set or the task is cancelled.
+
+    Successful polls are aligned to the interval; failed polls retry after a jittered
+    exponential backoff instead of a fixed sleep. Each response body is handed to
+    on_snapshot(name, content, fetched_at), which may be a plain or an async function.
+    A plain handler (protobuf decoding, parquet writes) runs in a worker thread so it
+    does not stall the polling of the other feeds; handlers of different feeds may
+    therefore run concurrently. A handler error is reported and the poll still counts
+    as successful: only fetch errors trigger the backoff.
+
+    Returns
+    -------
+    dict with polls, errors, handler_errors and bytes counters for the feed
+    """
+    stop_event = stop_event or asyncio.Event()
+    stats = {"polls": 0, "errors": 0, "handler_errors": 0, "bytes": 0}
+    is_async_handler = asyncio.iscoroutinefunction(on_snapshot) or \
+        asyncio.iscoroutinefunction(getattr(on_snapshot, "__call__", None))
+    failures = 0
+    timeout = aiohttp.ClientTimeout(total=timeout_seconds)
+
+    while not stop_event.is_set():
+        try:
+            async with session.get(url, timeout=timeout) as response:
+                response.raise_for_status()
+                content = await response.read()
+            fetched_at = datetime.datetime.now()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            failures += 1
+            stats["errors"] += 1
+            delay = backoff_delay(failures, max_seconds=max_backoff_seconds)
+            print(f"🔴 {name}: {type(e).__name__}: {e} | retrying in {delay:.1f}s")
+        else:
+            stats["polls"] += 1
+            stats["bytes"] += len(content)
+            failures = 0
+            try:
+                if is_async_handler:
+                    await on_snapshot(name, content, fetched_at)
+                else:
+                    await asyncio.to_thread(on_snapshot, name, content, fetched_at)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                stats["handler_errors"] += 1
+                print(f"⚠️ {name}: handler failed on the {fetched_at:%H:%M:%S} snapshot: {type(e).__name__}: {e}")
+            delay = interval_seconds - (time.time() % interval_seconds)
+
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    return stats
+
+
+async def collect_realtime_feeds_async(feeds, on_snapshot, duration_minutes=10, interval_seconds=30,
+                                       stop_event=None, max_connections=10, **poll_kwargs):
+    """
+    Poll several GTFS-rt feeds concurrently over one pooled keep-alive session.
+
+    Parameters
+    ----------
+    feeds : dict {feed_name: url}, e.g. obanyc_feeds(api_key)
+
+    on_snapshot : callable(feed_name, content, fetched_at), plain (run in a worker
+                  thread) or async
+
+    duration_minutes : stop after this many minutes (None polls until stop_event is set)
+
+    interval_seconds : time between polls of each feed (by default 30)
+
+    stop_event : optional asyncio.Event to stop the collection early
+
+    max_connections : size of the shared connection pool
+
+    Returns
+    -------
+    dict {feed_name: stats}
+    """
+    stop_event = stop_event or asyncio.Event()
+    connector = aiohttp.TCPConnector(limit=max_connections, keepalive_timeout=2 * interval_seconds)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        tasks = {
+            name: asyncio.create_task(
+                poll_feed(session, name, url, on_snapshot, interval_seconds, stop_event, **poll_kwargs)
+            )
+            for name, url in feeds.items()
+        }
+        try:
+            if duration_minutes is None:
+                await stop_event.wait()
+            else:
+                try:
+                    await asyncio.wait_for(stop_event.wait(), timeout=duration_minutes * 60)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            stop_event.set()
+            stats = {}
+            for name, task in tasks.items():
+                try:
+                    stats[name] = await asyncio.wait_for(task, timeout=poll_kwargs.get("timeout_seconds", 20) + 5)
+                except (asyncio.TimeoutError, asyncio.CancelledError):
+                    task.cancel()
+                    stats[name] = None
+
+    for name, feed_stats in stats.items():
+        print(f"📡 {name}: {feed_stats}")
+    return stats
+
+
+class TripUpdateCollector():
+    """
+    on_snapshot handler that decodes tripUpdates snapshots with
+    realtime_decoder.TripUpdateDecoder.
+
+    Batches have the decoder's schema, the same as convert_GTF_realtime_data_to_df:
+    timestamp (the poll time, naive UTC like the epoch times), string trip_id / route_id / stop_id, arrival_time and
+    departure_time as Int64 epoch seconds and arrival_delay / departure_delay as Int32.
+
+    With a store (snapshot_store.SnapshotStore) every batch is flushed to it instead
+    of being kept in memory.
+    """
+
+    def __init__(self, feed_name="tripUpdates", store=None):
+        self.feed_name = feed_name
+        self.store = store
+        self.frames = []
+        self.n_records = 0
+
+    def __call__(self, name, content, fetched_at):
+        if name != self.feed_name:
+            return
+        # one decoder per snapshot: its id dictionaries only live as long as the batch
+        decoder = TripUpdateDecoder()
+        n_records = decoder.decode(content, snapshot_time=int(fetched_at.timestamp()))
+
+        if n_records:
+            batch = trip_updates_to_df(decoder.to_arrow(include_timestamp=True, dictionary_ids=False))
+            if self.store is not None:
+                self.store.append(batch)
+            else:
+                self.frames.append(batch)
+            self.n_records += n_records
+            print(f"✅ Fetched {n_records:,} records | Total: {self.n_records:,}")
+        else:
+            print(f"⚠️  No records in current batch")
+
+    def to_df(self):
+        if not self.frames:
+            return pd.DataFrame()
+        return pd.concat(self.frames, ignore_index=True)
+
+
+class SnapshotWriter():
+    """on_snapshot handler that saves every raw response as <output_dir>/<feed_name>/<timestamp>.pb"""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+
+    def __call__(self, name, content, fetched_at):
+        feed_dir = os.path.join(self.output_dir, name)
+        os.makedirs(feed_dir, exist_ok=True)
+        with open(os.path.join(feed_dir, f"{fetched_at.strftime('%Y-%m-%d_%H-%M-%S_%f')}.pb"), "wb") as f:
+            f.write(content)
+
+
+def run_realtime_poller(feeds, on_snapshot, duration_minutes=10, interval_seconds=30, **kwargs):
+    """Blocking wrapper around collect_realtime_feeds_async for scripts and notebooks without a running loop."""
+    return asyncio.run(collect_realtime_feeds_async(
+        feeds, on_snapshot, duration_minutes=duration_minutes, interval_seconds=interval_seconds, **kwargs
+    ))
+
+
+class RecordedFeedServer():
+    """
+    Local HTTP stand-in for GTFS-rt endpoints, serving recorded .pb snapshots.
+
+    snapshot_dir holds one sub-directory per feed (the layout SnapshotWriter writes);
+    GET /<feed_name> returns that feed's snapshots one after the other, looping
+    around at the end. Statuses listed in fail_with are returned first, in order,
+    to exercise the backoff path.
+
+    Example
+    -------
+    async with RecordedFeedServer("snapshots") as server:
+        feeds = server.feeds()
+        await collect_realtime_feeds_async(feeds, handler, duration_minutes=0.1, interval_seconds=1)
+    """
+
+    def __init__(self, snapshot_dir, host="127.0.0.1", port=0, fail_with=()):
+        self.snapshot_dir = snapshot_dir
+        self.host = host
+        self.port = port
+        self.fail_with = list(fail_with)
+        self.requests = 0
+        self._snapshots = {}
+        self._positions = {}
+        self._runner = None
+
+    def _load_snapshots(self):
+        for name in sorted(os.listdir(self.snapshot_dir)):
+            feed_dir = os.path.join(self.snapshot_dir, name)
+            if os.path.isdir(feed_dir):
+                files = sorted(f for f in os.listdir(feed_dir) if f.endswith(".pb"))
+                self._snapshots[name] = [os.path.join(feed_dir, f) for f in files]
+                self._positions[name] = 0
+
+    async def _handle(self, request):
+        self.requests += 1
+        if self.fail_with:
+            return web.Response(status=self.fail_with.pop(0))
+        name = request.match_info["feed_name"]
+        snapshots = self._snapshots.get(name)
+        if not snapshots:
+            return web.Response(status=404)
+        position = self._positions[name]
+        self._positions[name] = (position + 1) % len(snapshots)
+        with open(snapshots[position], "rb") as f:
+            return web.Response(body=f.read(), content_type="application/x-protobuf")
+
+    def feeds(self):
+        return {name: f"http://{self.host}:{self.port}/{name}" for name in self._snapshots}
+
+    async def __aenter__(self):
+        self._load_snapshots()
+        app = web.Application()
+        app.router.add_get("/{feed_name}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._runner.cleanup()
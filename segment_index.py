@@ -0,0 +1,142 @@
+from config import *
+from feature_engineering_v1 import DISTANCE_METHODS
+
+
+class StopPairDistanceIndex():
+    """
+    Distance of every directed (stop_id -> next stop_id) segment of a feed.
+
+    The same segment shows up in thousands of trips, so distances are computed once per
+    unique pair and stored in compact sorted arrays keyed by
+    from_code * n_stops + to_code, where the codes are positions in `stop_ids`.
+    Feature code looks distances up with `lookup` instead of recomputing them per row.
+    `method` is the DISTANCE_METHODS kernel the distances were computed with.
+    """
+
+    def __init__(self, stop_ids, keys, distance_km, path_length=None, method="vincenty"):
+        self.method = method
+        self.stop_ids = pd.Index(stop_ids)
+        self.keys = np.asarray(keys, dtype=np.int64)
+        self.distance_km = np.asarray(distance_km, dtype=np.float32)
+        self.path_length = None if path_length is None else np.asarray(path_length, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def build(cls, stops_df, stop_times_df, method="vincenty"):
+        """
+        Build the index from a cleaned stops table and the stop_times sequences.
+
+        Parameters
+        ----------
+        stops_df : cleaned stops DataFrame ('stop_id', 'stop_lat', 'stop_lon')
+
+        stop_times_df : stop_times DataFrame ('trip_id', 'stop_id', 'stop_sequence'),
+                        optionally with 'shape_dist_traveled' for shape-based path lengths
+
+        method : distance kernel from feature_engineering_v1.DISTANCE_METHODS (by
+                 default "vincenty", the calculate_ets default)
+
+        Returns
+        -------
+        StopPairDistanceIndex
+        """
+        if method not in DISTANCE_METHODS:
+            raise ValueError(f"Unknown distance method: {method}")
+        stops = stops_df.drop_duplicates(subset=["stop_id"])
+        stop_ids = pd.Index(stops["stop_id"].astype(str))
+        n_stops = len(stop_ids)
+
+        columns = ["trip_id", "stop_id", "stop_sequence"]
+        has_shape = "shape_dist_traveled" in stop_times_df.columns
+        if has_shape:
+            columns.append("shape_dist_traveled")
+        st = stop_times_df[columns].sort_values(["trip_id", "stop_sequence"])
+
+        codes = stop_ids.get_indexer(st["stop_id"].astype(str))
+        trip_codes = pd.factorize(st["trip_id"])[0]
+        # rows without a trip_id (code -1) are not chained into a trip
+        valid = (trip_codes[1:] == trip_codes[:-1]) & (trip_codes[1:] >= 0) & (codes[:-1] >= 0) & (codes[1:] >= 0)
+        pair_keys = codes[:-1][valid].astype(np.int64) * n_stops + codes[1:][valid]
+
+        keys = np.unique(pair_keys)
+        lat = stops["stop_lat"].to_numpy(dtype=np.float64)
+        lon = stops["stop_lon"].to_numpy(dtype=np.float64)
+        from_codes, to_codes = keys // n_stops, keys % n_stops
+        distance_km = DISTANCE_METHODS[method](lat[from_codes], lon[from_codes], lat[to_codes], lon[to_codes])
+
+        path_length = None
+        if has_shape:
+            shape_dist = st["shape_dist_traveled"].to_numpy(dtype=np.float64)
+            segment_lengths = (shape_dist[1:] - shape_dist[:-1])[valid]
+            # trips can disagree slightly on the same segment, keep the median
+            path_length = (
+                pd.Series(segment_lengths).groupby(pair_keys).median().reindex(keys).to_numpy()
+            )
+
+        print(f"✅ Built stop-pair index: {len(keys):,} unique segments from {valid.sum():,} consecutive stop pairs")
+        return cls(stop_ids, keys, distance_km, path_length, method=method)
+
+    def _positions(self, from_stop_ids, to_stop_ids):
+        n_stops = len(self.stop_ids)
+        from_codes = self.stop_ids.get_indexer(pd.Index(from_stop_ids).astype(str))
+        to_codes = self.stop_ids.get_indexer(pd.Index(to_stop_ids).astype(str))
+        query = from_codes.astype(np.int64) * n_stops + to_codes
+
+        if len(self.keys) == 0:
+            return np.zeros(len(query), dtype=np.int64), np.zeros(len(query), dtype=bool)
+        positions = np.minimum(np.searchsorted(self.keys, query), len(self.keys) - 1)
+        found = (from_codes >= 0) & (to_codes >= 0) & (self.keys[positions] == query)
+        return positions, found
+
+    def lookup(self, from_stop_ids, to_stop_ids, column="distance_km"):
+        """
+        Vectorized lookup of segment values; pairs not in the index come back as NaN.
+
+        Parameters
+        ----------
+        from_stop_ids, to_stop_ids : array-likes of stop ids of equal length
+
+        column : 'distance_km' (default) or 'path_length'
+
+        Returns
+        -------
+        np.ndarray of float64
+        """
+        values = getattr(self, column)
+        if values is None:
+            raise ValueError(f"The index was built without {column}")
+        positions, found = self._positions(from_stop_ids, to_stop_ids)
+        result = np.full(len(positions), np.nan)
+        result[found] = values[positions[found]]
+        return result
+
+    def to_frame(self):
+        """The index as a DataFrame with one row per directed stop pair."""
+        n_stops = len(self.stop_ids)
+        df = pd.DataFrame({
+            "from_stop_id": self.stop_ids[self.keys // n_stops],
+            "to_stop_id": self.stop_ids[self.keys % n_stops],
+            "distance_km": self.distance_km,
+        })
+        if self.path_length is not None:
+            df["path_length"] = self.path_length
+        return df
+
+    def save(self, path):
+        arrays = {"stop_ids": self.stop_ids.to_numpy(dtype=str), "keys": self.keys,
+                  "distance_km": self.distance_km, "method": np.array(self.method)}
+        if self.path_length is not None:
+            arrays["path_length"] = self.path_length
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                data["stop_ids"], data["keys"], data["distance_km"],
+                data["path_length"] if "path_length" in data.files else None,
+                # indexes saved before the method was recorded were built with haversine
+                method=str(data["method"]) if "method" in data.files else "haversine",
+            )
@@ -0,0 +1,256 @@
+import glob
+import json
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from config import *
+
+
+SNAPSHOT_FILE_PATTERN = "gtfs_data_*.csv"
+SNAPSHOT_TIME_FORMAT = "%Y-%m-%d_%H-%M"
+MANIFEST_NAME = "_manifest.json"
+
+# types of the collector CSVs; ids stay strings (stop_id would otherwise be read as int)
+SNAPSHOT_CSV_TYPES = {
+    "timestamp": pa.timestamp("us"),
+    "trip_id": pa.string(),
+    "route_id": pa.string(),
+    "stop_id": pa.string(),
+    "arrival_time": pa.timestamp("us"),
+    "departure_time": pa.timestamp("us"),
+    "arrival_delay": pa.float64(),
+    "departure_delay": pa.float64(),
+}
+
+# collector CSVs written since TripUpdateCollector decodes with realtime_decoder hold
+# epoch seconds in these columns; they are read as int64 and cast to the types above
+SNAPSHOT_EPOCH_COLUMNS = ["arrival_time", "departure_time"]
+
+INGEST_PARTITIONING = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+
+
+def parse_snapshot_timestamp(path):
+    """Snapshot time encoded in the file name, e.g. gtfs_data_2025-11-07_12-43.csv"""
+    stamp = os.path.basename(path).split("gtfs_data_")[-1].replace(".csv", "")
+    return datetime.datetime.strptime(stamp, SNAPSHOT_TIME_FORMAT)
+
+
+def read_snapshot_csv(path):
+    """
+    Read one collector CSV with declared column types and add its snapshot_timestamp.
+    Arrival and departure times may be timestamps or epoch seconds.
+
+    Returns
+    -------
+    pa.Table
+    """
+    try:
+        table = pacsv.read_csv(path, convert_options=pacsv.ConvertOptions(column_types=SNAPSHOT_CSV_TYPES))
+    except pa.ArrowInvalid:
+        epoch_types = {**SNAPSHOT_CSV_TYPES, **{name: pa.int64() for name in SNAPSHOT_EPOCH_COLUMNS}}
+        table = pacsv.read_csv(path, convert_options=pacsv.ConvertOptions(column_types=epoch_types))
+        for name in SNAPSHOT_EPOCH_COLUMNS:
+            if name in table.column_names:
+                times = table[name].cast(pa.timestamp("s")).cast(SNAPSHOT_CSV_TYPES[name])
+                table = table.set_column(table.column_names.index(name), name, times)
+    # index column written by to_csv without index=False
+    keep = [name for name in table.column_names if name and not name.startswith("Unnamed")]
+    table = table.select(keep)
+    snapshot_timestamp = np.full(table.num_rows, np.datetime64(parse_snapshot_timestamp(path), "us"))
+    return table.append_column("snapshot_timestamp", pa.array(snapshot_timestamp))
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def _read_manifest(store_dir):
+    manifest_path = os.path.join(store_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {"files": {}}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def _write_manifest(store_dir, manifest):
+    tmp_path = os.path.join(store_dir, MANIFEST_NAME + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(store_dir, MANIFEST_NAME))
+
+
+def find_new_snapshot_files(folder, store_dir, pattern=SNAPSHOT_FILE_PATTERN):
+    """Snapshot files in folder that are not in the manifest yet, or changed since they were ingested."""
+    processed = _read_manifest(store_dir)["files"]
+    new_files = []
+    for path in sorted(glob.glob(os.path.join(folder, pattern))):
+        name = os.path.basename(path)
+        if processed.get(name, {}).get("signature") != _file_signature(path):
+            new_files.append(path)
+    return new_files
+
+
+def _dedup(df, dedup_keys):
+    df = df.sort_values("snapshot_timestamp", kind="stable")
+    if dedup_keys is None:
+        return df.drop_duplicates(keep="last")
+    return df.drop_duplicates(list(dedup_keys), keep="last")
+
+
+def _partition_segments(store_dir, date):
+    date_dir = os.path.join(store_dir, f"date={date}")
+    return sorted(glob.glob(os.path.join(date_dir, "part-*.parquet")))
+
+
+def _write_segment(table, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # '.'-prefixed, so a file left by a crash is skipped by ds.dataset
+    tmp_fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=os.path.dirname(path))
+    os.close(tmp_fd)
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _merge_into_partition(store_dir, date, part, dedup_keys):
+    """
+    Add the new rows of one date to its partition, keeping one row per key (the latest
+    snapshot) across all the segment files of the date.
+
+    Only the key columns of the existing segments are read; a segment is rewritten
+    only when some of its rows are superseded by the new rows, and the surviving new
+    rows go to a new segment file.
+
+    Returns
+    -------
+    (rows written to the new segment, number of existing segments rewritten)
+    """
+    part = _dedup(part, dedup_keys).reset_index(drop=True)
+    key_columns = list(part.columns) if dedup_keys is None else list(dedup_keys)
+    read_columns = list(dict.fromkeys(key_columns + ["snapshot_timestamp"]))
+    new_keys = part[key_columns].assign(_new_row=np.arange(len(part)),
+                                        _new_time=part["snapshot_timestamp"])
+    keep_new = np.ones(len(part), dtype=bool)
+
+    rewritten = 0
+    for path in _partition_segments(store_dir, date):
+        existing = pq.read_table(path, columns=read_columns).to_pandas()
+        matches = existing[key_columns].assign(
+            _old_row=np.arange(len(existing)), _old_time=existing["snapshot_timestamp"]
+        ).merge(new_keys, on=key_columns)
+        if matches.empty:
+            continue
+
+        # ties go to the new rows, as keep="last" of the full-partition dedup did
+        newer = (matches["_new_time"] >= matches["_old_time"]).to_numpy()
+        keep_new[matches["_new_row"].to_numpy()[~newer]] = False
+        superseded = matches["_old_row"].to_numpy()[newer]
+        if len(superseded) == 0:
+            continue
+
+        keep_old = np.ones(len(existing), dtype=bool)
+        keep_old[superseded] = False
+        if keep_old.any():
+            _write_segment(pq.read_table(path).filter(pa.array(keep_old)), path)
+        else:
+            os.remove(path)
+        rewritten += 1
+
+    new_part = part[keep_new]
+    if not new_part.empty:
+        path = os.path.join(store_dir, f"date={date}", f"part-{uuid.uuid4().hex}.parquet")
+        _write_segment(pa.Table.from_pandas(new_part, preserve_index=False), path)
+    return len(new_part), rewritten
+
+
+def ingest_snapshot_csvs(folder, store_dir="gtfs_snapshots", dedup_keys=("trip_id", "stop_id"),
+                         max_workers=None, pattern=SNAPSHOT_FILE_PATTERN):
+    """
+    Incrementally ingest the collector's gtfs_data_*.csv snapshots into a deduplicated
+    parquet store partitioned by snapshot date.
+
+    Files listed in the store manifest (same name, size and mtime) are skipped; only
+    new files are parsed, in parallel. Every date partition is a set of segment files
+    holding at most one row per key: the new rows of a date are written as a new
+    segment, and an existing segment is rewritten (without the rows the new ones
+    supersede) only if it shares keys with them. Only the key columns of the other
+    segments are read, so a refresh costs time proportional to the new data plus
+    the keys of the touched dates, not to the full history or to full partitions.
+    A date gets one segment per run that adds rows to it. Files are replaced
+    atomically and the manifest is written last, so an interrupted run is simply
+    redone by the next one.
+
+    Parameters
+    ----------
+    folder : directory holding the snapshot CSVs
+
+    store_dir : output directory (by default "gtfs_snapshots")
+
+    dedup_keys : within a day keep the latest snapshot of every key (by default
+                 trip_id, stop_id); None drops only exact duplicate rows
+
+    max_workers : processes used to parse the new files (by default one per CPU)
+
+    pattern : glob of the snapshot files
+
+    Returns
+    -------
+    dict with the number of new files, rows read and new rows stored
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    manifest = _read_manifest(store_dir)
+    new_files = find_new_snapshot_files(folder, store_dir, pattern)
+    if not new_files:
+        print("✅ No new snapshot files")
+        return {"new_files": 0, "rows_read": 0, "rows_stored": 0}
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(new_files))
+    print(f"🚀 Ingesting {len(new_files):,} new snapshot files with {max_workers} worker processes...")
+    if max_workers == 1:
+        tables = [read_snapshot_csv(path) for path in new_files]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            tables = list(pool.map(read_snapshot_csv, new_files))
+
+    new_rows = pa.concat_tables(tables, promote_options="permissive").to_pandas()
+    dates = new_rows["snapshot_timestamp"].dt.strftime("%Y-%m-%d")
+
+    rows_stored = 0
+    for date, part in new_rows.groupby(dates, sort=True):
+        written, rewritten = _merge_into_partition(store_dir, date, part, dedup_keys)
+        rows_stored += written
+        print(f"💾 date={date}: {written:,} new rows | {rewritten:,} segments rewritten")
+
+    for path, table in zip(new_files, tables):
+        manifest["files"][os.path.basename(path)] = {
+            "signature": _file_signature(path),
+            "rows": table.num_rows,
+        }
+    manifest["dedup_keys"] = None if dedup_keys is None else list(dedup_keys)
+    _write_manifest(store_dir, manifest)
+
+    print(f"✅ Ingested {len(new_rows):,} rows from {len(new_files):,} files")
+    return {"new_files": len(new_files), "rows_read": len(new_rows), "rows_stored": rows_stored}
+
+
+def read_ingested_snapshots(store_dir, start=None, end=None, columns=None):
+    """
+    Read the deduplicated snapshots of an ingest_snapshot_csvs store, optionally only
+    the days between start and end (inclusive, partition pruned).
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    dataset = ds.dataset(store_dir, format="parquet", partitioning=INGEST_PARTITIONING)
+    row_filter = None
+    if start is not None:
+        row_filter = ds.field("date") >= pd.Timestamp(start).strftime("%Y-%m-%d")
+    if end is not None:
+        end_filter = ds.field("date") <= pd.Timestamp(end).strftime("%Y-%m-%d")
+        row_filter = end_filter if row_filter is None else row_filter & end_filter
+    return dataset.to_table(columns=columns, filter=row_filter).to_pandas()
@@ -0,0 +1,320 @@
+import uuid
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from config import *
+
+
+# hive layout: <root>/date=YYYY-MM-DD/hour=HH/part-*.parquet
+SNAPSHOT_PARTITIONING = ds.partitioning(
+    pa.schema([("date", pa.string()), ("hour", pa.int8())]), flavor="hive"
+)
+
+# column types of the whole store, kept up to date by SnapshotStore
+# (files starting with '_' are skipped by pyarrow datasets)
+SCHEMA_FILE = "_common_metadata"
+
+
+class SnapshotStore():
+    """
+    Append-only, time-partitioned parquet store for realtime snapshots.
+
+    Every flushed batch becomes new part files under date=/hour= partitions of its
+    timestamp column, so memory stays bounded by one batch (or buffer_rows rows) no
+    matter how long the collection runs, and a crash loses at most the rows not
+    flushed yet. Files are never rewritten.
+
+    Parameters
+    ----------
+    root : directory of the dataset
+
+    timestamp_column : column used to pick the partition (by default "timestamp")
+
+    buffer_rows : rows kept in memory before a flush; 0 (default) flushes every append
+    """
+
+    def __init__(self, root, timestamp_column="timestamp", buffer_rows=0):
+        self.root = root
+        self.timestamp_column = timestamp_column
+        self.buffer_rows = buffer_rows
+        self.schema = None
+        self.rows_written = 0
+        self._buffer = []
+        self._buffered_rows = 0
+        os.makedirs(root, exist_ok=True)
+
+        schema_path = os.path.join(root, SCHEMA_FILE)
+        if os.path.exists(schema_path):
+            self.schema = pq.read_schema(schema_path)
+
+    def _table(self, df):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        batch_schema = table.schema.remove_metadata()
+
+        if self.schema is None:
+            merged = batch_schema
+        else:
+            # columns that were all-null so far take the first real type they show up with
+            merged = pa.schema([
+                batch_schema.field(field.name)
+                if pa.types.is_null(field.type) and field.name in batch_schema.names
+                and not pa.types.is_null(batch_schema.field(field.name).type)
+                else field
+                for field in self.schema
+            ] + [field for field in batch_schema if field.name not in self.schema.names])
+
+        if not merged.equals(self.schema or pa.schema([])):
+            self.schema = merged
+            pq.write_metadata(self.schema, os.path.join(self.root, SCHEMA_FILE))
+
+        for field in self.schema:
+            if field.name not in table.column_names:
+                table = table.append_column(field.name, pa.nulls(len(table), field.type))
+        return table.select(self.schema.names).cast(self.schema)
+
+    def append(self, df):
+        """Add a batch of rows; writes once buffer_rows is reached."""
+        if df is None or df.empty:
+            return
+        self._buffer.append(df)
+        self._buffered_rows += len(df)
+        if self._buffered_rows >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows as new part files, one per date/hour partition."""
+        if not self._buffer:
+            return
+        df = pd.concat(self._buffer, ignore_index=True) if len(self._buffer) > 1 else self._buffer[0]
+        self._buffer = []
+        self._buffered_rows = 0
+
+        timestamps = pd.to_datetime(df[self.timestamp_column])
+        partition_keys = timestamps.dt.strftime("date=%Y-%m-%d/hour=%H")
+        for partition, part in df.groupby(partition_keys, sort=False):
+            partition_dir = os.path.join(self.root, partition)
+            os.makedirs(partition_dir, exist_ok=True)
+            name = f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+            path = os.path.join(partition_dir, name)
+            # write under a '.'-prefixed temporary name, which pyarrow datasets skip, so
+            # readers (and a resume after a crash) never see a half-written file
+            tmp_path = os.path.join(partition_dir, f".{name}.tmp")
+            pq.write_table(self._table(part), tmp_path)
+            os.replace(tmp_path, path)
+        self.rows_written += len(df)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_snapshots(root, start=None, end=None, columns=None, timestamp_column="timestamp"):
+    """
+    Read the rows of a SnapshotStore between start and end (inclusive).
+
+    Only the date=/hour= partitions overlapping the range are opened; rows are then
+    filtered on timestamp_column.
+
+    Parameters
+    ----------
+    root : SnapshotStore directory
+
+    start, end : optional datetimes / strings bounding timestamp_column
+
+    columns : optional list of columns to read
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    schema = None
+    schema_path = os.path.join(root, SCHEMA_FILE)
+    if os.path.exists(schema_path):
+        file_schema = pq.read_schema(schema_path)
+        schema = pa.schema(list(file_schema) + [
+            field for field in SNAPSHOT_PARTITIONING.schema if field.name not in file_schema.names
+        ])
+    dataset = ds.dataset(root, schema=schema, format="parquet", partitioning=SNAPSHOT_PARTITIONING)
+
+    filters = []
+    if start is not None:
+        start = pd.Timestamp(start)
+        filters.append(ds.field("date") >= start.strftime("%Y-%m-%d"))
+        filters.append(ds.field(timestamp_column) >= pa.scalar(start.to_pydatetime()))
+    if end is not None:
+        end = pd.Timestamp(end)
+        filters.append(ds.field("date") <= end.strftime("%Y-%m-%d"))
+        filters.append(ds.field(timestamp_column) <= pa.scalar(end.to_pydatetime()))
+
+    row_filter = None
+    for expression in filters:
+        row_filter = expression if row_filter is None else row_filter & expression
+
+    return dataset.to_table(columns=columns, filter=row_filter).to_pandas()
+
+
+def _changed_rows(current, previous):
+    # NaN / None on both sides counts as unchanged, on one side only as changed
+    # (a nullable Int64 comparison against NA is NA, not True)
+    current_na, previous_na = current.isna(), previous.isna()
+    differs = (current.ne(previous) | (current_na != previous_na)) & ~(current_na & previous_na)
+    return differs.any(axis=1).to_numpy(dtype=bool)
+
+
+class DeltaSnapshotStore():
+    """
+    SnapshotStore front that persists only new and changed predictions.
+
+    Every poll returns the full set of live predictions, most of them unchanged since
+    the previous poll. The store keeps the latest values of every key in memory and
+    writes a row only when its key is new or one of its value columns changed; the
+    row's timestamp is the version of that value. read_latest_predictions rebuilds the
+    last known table (or the table as of any time) from these versions.
+
+    Has the same append / flush / close interface as SnapshotStore, so it can be
+    passed wherever a store is accepted (e.g. TripUpdateCollector).
+
+    Parameters
+    ----------
+    root : directory of the underlying SnapshotStore
+
+    key_columns : columns identifying one prediction (by default trip_id, stop_id)
+
+    timestamp_column : snapshot time column, used as version (by default "timestamp")
+
+    resume : rebuild the in-memory state from the rows already in root, so a restarted
+             collection does not write every prediction again (by default true)
+
+    state_horizon : keys whose latest version is older than this (relative to the
+                    newest appended timestamp) are evicted on every append, and resume
+                    only reads this window, so memory stays bounded over multi-day
+                    collections (by default "6h"; None keeps every key)
+    """
+
+    def __init__(self, root, key_columns=("trip_id", "stop_id"), timestamp_column="timestamp",
+                 buffer_rows=0, resume=True, state_horizon="6h"):
+        self.key_columns = list(key_columns)
+        self.timestamp_column = timestamp_column
+        self.state_horizon = None if state_horizon is None else pd.Timedelta(state_horizon)
+        self.store = SnapshotStore(root, timestamp_column=timestamp_column, buffer_rows=buffer_rows)
+        self.rows_seen = 0
+        self.rows_kept = 0
+        self._state = None
+
+        if resume and self.store.schema is not None:
+            start = None
+            latest_partition = _latest_partition_time(root)
+            if self.state_horizon is not None and latest_partition is not None:
+                start = latest_partition - self.state_horizon
+            latest = read_latest_predictions(root, start=start, key_columns=self.key_columns,
+                                             timestamp_column=timestamp_column)
+            if not latest.empty:
+                self._state = latest.drop(columns=["date", "hour"], errors="ignore").set_index(self.key_columns)
+
+    def _value_columns(self, df):
+        return [col for col in df.columns if col not in self.key_columns and col != self.timestamp_column]
+
+    def append(self, df):
+        """Write the rows of df whose key is new or whose values changed; returns the number written."""
+        if df is None or df.empty:
+            return 0
+        self.rows_seen += len(df)
+        batch = df.drop_duplicates(self.key_columns, keep="last").set_index(self.key_columns)
+
+        if self._state is None:
+            changed = batch
+        else:
+            value_columns = self._value_columns(df)
+            known = batch.index.isin(self._state.index)
+            is_changed = ~known
+            if known.any():
+                previous = self._state.reindex(batch.index[known])[value_columns]
+                is_changed[known] = _changed_rows(batch.loc[known, value_columns], previous)
+            changed = batch[is_changed]
+
+        if not changed.empty:
+            if self._state is None:
+                self._state = changed.copy()
+            else:
+                self._state = pd.concat([self._state[~self._state.index.isin(changed.index)], changed])
+            self.store.append(changed.reset_index()[df.columns])
+            self.rows_kept += len(changed)
+
+        if self.state_horizon is not None and self._state is not None:
+            newest = pd.to_datetime(df[self.timestamp_column]).max()
+            if pd.notna(newest):
+                self.evict_before(newest - self.state_horizon)
+        return len(changed)
+
+    @property
+    def rows_written(self):
+        return self.store.rows_written
+
+    def evict_before(self, timestamp):
+        """Forget keys whose latest version is older than timestamp (e.g. finished trips)."""
+        if self._state is not None:
+            self._state = self._state[self._state[self.timestamp_column] >= pd.Timestamp(timestamp)]
+
+    def flush(self):
+        self.store.flush()
+
+    def close(self):
+        self.store.close()
+        if self.rows_seen:
+            print(f"💾 Stored {self.rows_kept:,} of {self.rows_seen:,} rows ({self.rows_kept / self.rows_seen:.1%}) as deltas")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _latest_partition_time(root):
+    # start of the newest date=/hour= partition in root, None for an empty store
+    latest = None
+    for date_dir in os.listdir(root):
+        if not date_dir.startswith("date="):
+            continue
+        for hour_dir in os.listdir(os.path.join(root, date_dir)):
+            if hour_dir.startswith("hour="):
+                partition = pd.Timestamp(date_dir[len("date="):]) + pd.Timedelta(hours=int(hour_dir[len("hour="):]))
+                latest = partition if latest is None else max(latest, partition)
+    return latest
+
+
+def read_latest_predictions(root, as_of=None, key_columns=("trip_id", "stop_id"), columns=None,
+                            timestamp_column="timestamp", start=None):
+    """
+    Last known value of every key from a DeltaSnapshotStore, as of now or as of a point in time.
+
+    Parameters
+    ----------
+    root : DeltaSnapshotStore directory
+
+    as_of : optional datetime; only versions written up to then are considered
+
+    key_columns : key of the store (by default trip_id, stop_id)
+
+    columns : optional list of columns to read (keys and timestamp are always read)
+
+    start : optional datetime; versions written before it are not read (keys whose
+            last version is older are left out)
+
+    Returns
+    -------
+    pd.DataFrame with one row per key, timestamp being the version of its values
+    """
+    if columns is not None:
+        columns = list(dict.fromkeys(list(key_columns) + [timestamp_column] + list(columns)))
+    versions = read_snapshots(root, start=start, end=as_of, columns=columns, timestamp_column=timestamp_column)
+    if versions.empty:
+        return versions
+    return (versions.sort_values(timestamp_column, kind="stable")
+            .drop_duplicates(list(key_columns), keep="last")
+            .reset_index(drop=True))
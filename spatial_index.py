@@ -0,0 +1,186 @@
+from sklearn.neighbors import BallTree
+from config import *
+
+
+EARTH_RADIUS_M = 6_371_008.8
+
+
+class StopSpatialIndex():
+    """
+    Ball tree over stop coordinates on the haversine metric, built once per feed.
+
+    Answers "which stops are within 300 m of these points", "nearest stop of every
+    vehicle position" and bounding-box queries for whole batches of points in
+    O(log n_stops) per point, instead of a cross join of points and stops in pandas.
+    Distances are great-circle distances in meters.
+
+    Parameters
+    ----------
+    stop_ids : stop ids, in the order of the coordinates
+
+    stop_lat, stop_lon : stop coordinates in degrees
+
+    leaf_size : BallTree leaf size (by default 40)
+    """
+
+    def __init__(self, stop_ids, stop_lat, stop_lon, leaf_size=40):
+        self.stop_ids = pd.Index(stop_ids)
+        self.stop_lat = np.asarray(stop_lat, dtype=np.float64)
+        self.stop_lon = np.asarray(stop_lon, dtype=np.float64)
+        self.leaf_size = leaf_size
+        self.tree = BallTree(np.radians(np.column_stack([self.stop_lat, self.stop_lon])),
+                             leaf_size=leaf_size, metric="haversine")
+        # stops sorted by latitude, for bounding-box queries
+        self._lat_order = np.argsort(self.stop_lat, kind="stable")
+        self._sorted_lat = self.stop_lat[self._lat_order]
+
+    def __len__(self):
+        return len(self.stop_ids)
+
+    @classmethod
+    def from_stops(cls, stops_df, id_column="stop_id", lat_column="stop_lat", lon_column="stop_lon", leaf_size=40):
+        """
+        Build the index from a stops DataFrame (e.g. clean_stops_data output); stops
+        without coordinates are skipped.
+
+        Returns
+        -------
+        StopSpatialIndex
+        """
+        stops = stops_df.dropna(subset=[lat_column, lon_column])
+        index = cls(stops[id_column].to_numpy(), stops[lat_column].to_numpy(),
+                    stops[lon_column].to_numpy(), leaf_size=leaf_size)
+        print(f"✅ Built stop spatial index over {len(index):,} stops")
+        return index
+
+    @staticmethod
+    def _points(lat, lon):
+        points = np.radians(np.column_stack([np.atleast_1d(np.asarray(lat, dtype=np.float64)),
+                                             np.atleast_1d(np.asarray(lon, dtype=np.float64))]))
+        valid = np.isfinite(points).all(axis=1)
+        return points, valid
+
+    def nearest(self, lat, lon, k=1, max_distance_m=None):
+        """
+        k nearest stops of every point.
+
+        Parameters
+        ----------
+        lat, lon : point coordinates in degrees (scalars or arrays)
+
+        k : number of stops per point (by default 1)
+
+        max_distance_m : optional; farther stops are reported as -1 / NaN
+
+        Returns
+        -------
+        (np.ndarray (n_points, k) of stop positions, -1 when none,
+         np.ndarray (n_points, k) of distances in meters, NaN when none)
+        """
+        points, valid = self._points(lat, lon)
+        k_stops = min(k, len(self))
+        positions = np.full((len(points), k), -1, dtype=np.int64)
+        distances = np.full((len(points), k), np.nan)
+        if k_stops and valid.any():
+            dist, ind = self.tree.query(points[valid], k=k_stops)
+            positions[valid, :k_stops] = ind
+            distances[valid, :k_stops] = dist * EARTH_RADIUS_M
+        if max_distance_m is not None:
+            too_far = ~(distances <= max_distance_m)
+            positions[too_far] = -1
+            distances[too_far] = np.nan
+        return positions, distances
+
+    def within_radius(self, lat, lon, radius_m, sort=True):
+        """
+        Stops within radius_m of every point, as flat (point, stop) pairs.
+
+        Parameters
+        ----------
+        lat, lon : point coordinates in degrees (scalars or arrays)
+
+        radius_m : radius in meters, scalar or one per point
+
+        sort : order the stops of each point by distance (by default true)
+
+        Returns
+        -------
+        (point positions, stop positions, distances in meters), three aligned np.ndarrays
+        """
+        points, valid = self._points(lat, lon)
+        radius = np.broadcast_to(np.asarray(radius_m, dtype=np.float64), len(points))[valid] / EARTH_RADIUS_M
+        if not valid.any() or not len(self):
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([])
+
+        ind, dist = self.tree.query_radius(points[valid], r=radius, return_distance=True, sort_results=sort)
+        counts = np.fromiter((len(i) for i in ind), dtype=np.int64, count=len(ind))
+        point_positions = np.repeat(np.flatnonzero(valid), counts)
+        stop_positions = np.concatenate(ind).astype(np.int64) if counts.sum() else np.array([], dtype=np.int64)
+        distances = np.concatenate(dist) * EARTH_RADIUS_M if counts.sum() else np.array([])
+        return point_positions, stop_positions, distances
+
+    def within_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """
+        Stops inside every bounding box (boxes crossing the antimeridian are not supported).
+
+        The latitude range is located with np.searchsorted on the latitude-sorted stops
+        and only that slice is filtered on longitude.
+
+        Parameters
+        ----------
+        min_lat, min_lon, max_lat, max_lon : box bounds in degrees (scalars or arrays)
+
+        Returns
+        -------
+        (box positions, stop positions), two aligned np.ndarrays
+        """
+        bounds = np.broadcast_arrays(*(np.atleast_1d(np.asarray(b, dtype=np.float64))
+                                       for b in (min_lat, min_lon, max_lat, max_lon)))
+        starts = np.searchsorted(self._sorted_lat, bounds[0], side="left")
+        ends = np.searchsorted(self._sorted_lat, bounds[2], side="right")
+
+        box_positions, stop_positions = [], []
+        for box, (start, end) in enumerate(zip(starts, ends)):
+            candidates = self._lat_order[start:end]
+            lon = self.stop_lon[candidates]
+            inside = candidates[(lon >= bounds[1][box]) & (lon <= bounds[3][box])]
+            box_positions.append(np.full(len(inside), box, dtype=np.int64))
+            stop_positions.append(inside)
+        if not box_positions:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        return np.concatenate(box_positions), np.concatenate(stop_positions).astype(np.int64)
+
+    def snap(self, df, lat_column, lon_column, max_distance_m=None, prefix="nearest_"):
+        """
+        Nearest stop of every row of df (taxi pickups, vehicle positions, weather stations...).
+
+        Parameters
+        ----------
+        df : DataFrame with point coordinates
+
+        lat_column, lon_column : coordinate columns of df
+
+        max_distance_m : optional; rows farther from every stop get no stop
+
+        prefix : prefix of the added columns (by default "nearest_")
+
+        Returns
+        -------
+        pd.DataFrame, df with <prefix>stop_id and <prefix>stop_distance_m
+        """
+        positions, distances = self.nearest(df[lat_column].to_numpy(), df[lon_column].to_numpy(),
+                                            k=1, max_distance_m=max_distance_m)
+        df = df.copy()
+        df[f"{prefix}stop_id"] = self.stop_ids.take(np.maximum(positions[:, 0], 0)).where(positions[:, 0] >= 0)
+        df[f"{prefix}stop_distance_m"] = distances[:, 0]
+        return df
+
+    def save(self, path):
+        """Save the stop ids and coordinates; the tree is rebuilt on load."""
+        np.savez(path, stop_ids=self.stop_ids.to_numpy(dtype=str),
+                 stop_lat=self.stop_lat, stop_lon=self.stop_lon)
+
+    @classmethod
+    def load(cls, path, leaf_size=40):
+        with np.load(path) as data:
+            return cls(data["stop_ids"], data["stop_lat"], data["stop_lon"], leaf_size=leaf_size)
@@ -0,0 +1,185 @@
+import glob
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+from config import *
+
+
+STATIC_JOIN_TABLES = ["stop_times", "stops", "trips", "routes"]
+
+# route feature columns carried into static_merged_df when the routes parquet has them
+# (e.g. written after FeatureEngineeringRouteDf)
+STATIC_ROUTE_COLUMNS = ["is_express", "corridor_count"]
+
+
+def write_static_parquet(tables, output_dir):
+    """
+    Write stop_times / stops / trips / routes DataFrames (cleaned, with route features)
+    to <output_dir>/<table>.parquet for StaticJoinEngine.
+
+    Returns
+    -------
+    dict {table_name: parquet path}
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {}
+    for table_name in STATIC_JOIN_TABLES:
+        paths[table_name] = os.path.join(output_dir, f"{table_name}.parquet")
+        pq.write_table(pa.Table.from_pandas(tables[table_name], preserve_index=False), paths[table_name])
+    return paths
+
+
+def _sql_string(value):
+    # SQL string literal: single quotes are doubled, so any path can be embedded
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class StaticJoinEngine():
+    """
+    Builds static_merged_df (stop_times ⋈ stops ⋈ trips ⋈ routes, with the next stop
+    as destination) inside DuckDB, straight from Parquet files.
+
+    The joins, the LEAD() window over each trip's stop_sequence for dest_lat /
+    dest_lon, the is_last_stop flag and the last-stop fill all run in DuckDB, which
+    spills to disk when needed; the result is handed out as Arrow record batches so
+    the wide table never has to exist as one pandas object.
+
+    Parameters
+    ----------
+    parquet_paths : dict {table_name: parquet path or glob} for stop_times, stops,
+                    trips and routes, e.g. a gtfs_cache entry or write_static_parquet
+
+    route_columns : extra routes columns to carry (by default STATIC_ROUTE_COLUMNS,
+                    the ones missing from the routes file are skipped)
+
+    memory_limit : optional DuckDB memory limit, e.g. "2GB"
+
+    threads : optional number of DuckDB threads
+
+    Example
+    -------
+    with StaticJoinEngine(paths) as engine:
+        for batch in engine.record_batches():
+            ...
+    """
+
+    def __init__(self, parquet_paths, route_columns=STATIC_ROUTE_COLUMNS, memory_limit=None, threads=None):
+        missing = [name for name in STATIC_JOIN_TABLES if name not in parquet_paths]
+        if missing:
+            raise ValueError(f"Missing parquet paths for {missing}")
+        self.parquet_paths = {name: parquet_paths[name] for name in STATIC_JOIN_TABLES}
+        self.con = duckdb.connect()
+        if memory_limit is not None:
+            self.con.execute(f"SET memory_limit = {_sql_string(memory_limit)}")
+        if threads is not None:
+            self.con.execute(f"SET threads = {int(threads)}")
+
+        routes_columns = self._columns("routes")
+        self.route_columns = [col for col in route_columns if col in routes_columns]
+        self._source_types = {
+            field.name: field.type
+            for name in STATIC_JOIN_TABLES
+            for field in pq.read_schema(sorted(glob.glob(self.parquet_paths[name]))[0])
+        }
+
+    def _relation(self, table_name):
+        return f"read_parquet({_sql_string(self.parquet_paths[table_name])})"
+
+    def _columns(self, table_name):
+        return self.con.execute(f"SELECT * FROM {self._relation(table_name)} LIMIT 0").arrow().schema.names
+
+    def sql(self):
+        """
+        The DuckDB query building static_merged_df.
+
+        trip_id is taken from stop_times (st.trip_id) where the notebook selected
+        t.trip_id: the two are equal wherever the trips join matches, and stop_times
+        rows whose trip is missing from trips keep their trip_id (and their LEAD()
+        partition) instead of getting NULL.
+
+        is_last_stop follows the notebook's dest_lat.isna() rule, taken before the
+        last-stop fill: it is also 1 on a stop whose next stop has no coordinates.
+        """
+        route_select = "".join(f",\n                r.{col}" for col in self.route_columns)
+        return f"""
+            WITH joined AS (
+                SELECT
+                    st.stop_id,
+                    st.stop_sequence,
+                    st.arrival_time,
+                    st.departure_time,
+                    st.trip_id,
+                    t.route_id,
+                    t.direction_id,
+                    s.stop_lat,
+                    s.stop_lon{route_select}
+                FROM {self._relation("stop_times")} st
+                LEFT JOIN {self._relation("stops")} s ON st.stop_id = s.stop_id
+                LEFT JOIN {self._relation("trips")} t ON st.trip_id = t.trip_id
+                LEFT JOIN {self._relation("routes")} r ON t.route_id = r.route_id
+            )
+            SELECT
+                *,
+                -- next stop of the trip; the last stop keeps its own coordinates
+                COALESCE(LEAD(stop_lat) OVER trip, LAST_VALUE(stop_lat IGNORE NULLS) OVER whole_trip) AS dest_lat,
+                COALESCE(LEAD(stop_lon) OVER trip, LAST_VALUE(stop_lon IGNORE NULLS) OVER whole_trip) AS dest_lon,
+                CAST(LEAD(stop_lat) OVER trip IS NULL AS TINYINT) AS is_last_stop
+            FROM joined
+            WINDOW
+                trip AS (PARTITION BY trip_id ORDER BY stop_sequence),
+                whole_trip AS (PARTITION BY trip_id ORDER BY stop_sequence
+                               ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+            ORDER BY trip_id, stop_sequence
+        """
+
+    def _restore_types(self, batch):
+        # DuckDB hands parquet durations (cleaned arrival/departure times) back as BIGINT
+        arrays, fields = [], []
+        for field, array in zip(batch.schema, batch.columns):
+            source_type = self._source_types.get(field.name)
+            if source_type is not None and pa.types.is_duration(source_type) and not pa.types.is_duration(field.type):
+                array = array.cast(source_type)
+                field = field.with_type(source_type)
+            arrays.append(array)
+            fields.append(field)
+        return pa.RecordBatch.from_arrays(arrays, schema=pa.schema(fields))
+
+    def record_batches(self, batch_size=1_000_000):
+        """Stream static_merged_df as pyarrow RecordBatches of at most batch_size rows."""
+        reader = self.con.execute(self.sql()).fetch_record_batch(batch_size)
+        for batch in reader:
+            yield self._restore_types(batch)
+
+    def to_parquet(self, output_path, batch_size=1_000_000):
+        """Write static_merged_df to a parquet file batch by batch; returns the number of rows."""
+        writer = None
+        n_rows = 0
+        try:
+            for batch in self.record_batches(batch_size):
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, batch.schema)
+                writer.write_batch(batch)
+                n_rows += batch.num_rows
+        finally:
+            if writer is not None:
+                writer.close()
+        print(f"💾 static_merged_df: {n_rows:,} rows written to {output_path}")
+        return n_rows
+
+    def to_arrow(self, batch_size=1_000_000):
+        batches = list(self.record_batches(batch_size))
+        if not batches:
+            return self.con.execute(self.sql()).arrow()
+        return pa.Table.from_batches(batches)
+
+    def to_pandas(self, batch_size=1_000_000):
+        return self.to_arrow(batch_size).to_pandas()
+
+    def close(self):
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,201 @@
+from config import *
+
+
+class StaticRealtimeMatcher():
+    """
+    Prebuilt lookup from realtime (trip_id, stop_id) pairs to rows of static_merged_df.
+
+    trip_id and stop_id are encoded once as positions in sorted id indexes and combined
+    into one int64 key, trip_code * n_stops + stop_code, kept sorted next to the static
+    row offset it belongs to. A realtime batch is then matched with two hash lookups
+    (get_indexer) and one np.searchsorted, all vectorized and O(batch), instead of a
+    pd.merge of the whole static table on string keys. Rows whose static route_id
+    differs from the realtime one are not matched, as in the notebook's
+    merge on ['trip_id', 'route_id', 'stop_id'].
+
+    Parameters
+    ----------
+    static_df : static_merged_df (StaticJoinEngine output or the notebook frame)
+
+    trip_ids, stop_ids, route_ids : sorted id indexes used for the codes
+
+    keys : sorted int64 (trip, stop) keys
+
+    rows : static row offset of every key
+
+    row_route_codes : route code of every static row (-1 when missing)
+
+    registry : optional id_registry.IdRegistry; the codes are then the registry's
+               codes and batches may come in already encoded (trip_id_code /
+               stop_id_code / route_id_code columns instead of the ids)
+    """
+
+    def __init__(self, static_df, trip_ids, stop_ids, route_ids, keys, rows, row_route_codes, registry=None):
+        self.static_df = static_df.reset_index(drop=True)
+        self.trip_ids = pd.Index(trip_ids)
+        self.stop_ids = pd.Index(stop_ids)
+        self.route_ids = pd.Index(route_ids)
+        self.keys = np.asarray(keys, dtype=np.int64)
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.row_route_codes = np.asarray(row_route_codes, dtype=np.int32)
+        self.registry = registry
+
+    def _codes(self, df, column, ids):
+        if self.registry is None:
+            return ids.get_indexer(pd.Series(df[column]).astype(str))
+        codes = self.registry.column_codes(df, column, add=False)
+        # ids registered after the matcher was built are not in the static table
+        return np.where(codes < len(ids), codes, -1)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def build(cls, static_df, registry=None):
+        """
+        Build the matcher from static_merged_df ('trip_id', 'stop_id', 'route_id').
+
+        (trip_id, stop_id) pairs visited twice by a trip keep their first row. With a
+        registry the static ids are registered in it and its codes are used, so the
+        frame may already be encoded (<id>_code columns, IdRegistry.encode_frame).
+
+        Returns
+        -------
+        StaticRealtimeMatcher
+        """
+        static_df = static_df.reset_index(drop=True)
+        if registry is not None:
+            trip_codes = registry.column_codes(static_df, "trip_id")
+            stop_codes = registry.column_codes(static_df, "stop_id")
+            row_route_codes = registry.column_codes(static_df, "route_id")
+            trip_ids, stop_ids, route_ids = (registry.ids[kind] for kind in ["trip_id", "stop_id", "route_id"])
+        else:
+            trip_ids = pd.Index(np.sort(static_df["trip_id"].dropna().astype(str).unique()))
+            stop_ids = pd.Index(np.sort(static_df["stop_id"].dropna().astype(str).unique()))
+            route_ids = pd.Index(np.sort(static_df["route_id"].dropna().astype(str).unique()))
+            trip_codes = trip_ids.get_indexer(static_df["trip_id"].astype(str))
+            stop_codes = stop_ids.get_indexer(static_df["stop_id"].astype(str))
+            row_route_codes = route_ids.get_indexer(static_df["route_id"].astype(str))
+
+        valid = np.flatnonzero((trip_codes >= 0) & (stop_codes >= 0))
+        row_keys = trip_codes[valid].astype(np.int64) * len(stop_ids) + stop_codes[valid]
+        keys, first = np.unique(row_keys, return_index=True)
+        rows = valid[first]
+
+        print(f"✅ Built static matcher: {len(keys):,} (trip, stop) keys from {len(static_df):,} static rows")
+        return cls(static_df, trip_ids, stop_ids, route_ids, keys, rows, row_route_codes, registry)
+
+    def match(self, realtime_df):
+        """
+        Static row offset of every realtime row, -1 where there is no match.
+
+        Parameters
+        ----------
+        realtime_df : DataFrame with 'trip_id', 'stop_id' and 'route_id' (or, with a
+                      registry, their <id>_code columns)
+
+        Returns
+        -------
+        (np.ndarray of int64 row offsets, dict of match stats)
+        """
+        trip_codes = self._codes(realtime_df, "trip_id", self.trip_ids)
+        stop_codes = self._codes(realtime_df, "stop_id", self.stop_ids)
+        route_codes = self._codes(realtime_df, "route_id", self.route_ids)
+        query = trip_codes.astype(np.int64) * len(self.stop_ids) + stop_codes
+
+        known = (trip_codes >= 0) & (stop_codes >= 0)
+        found = np.zeros(len(query), dtype=bool)
+        rows = np.full(len(query), -1, dtype=np.int64)
+        if len(self.keys):
+            positions = np.minimum(np.searchsorted(self.keys, query), len(self.keys) - 1)
+            found = known & (self.keys[positions] == query)
+            rows[found] = self.rows[positions[found]]
+
+        same_route = np.zeros(len(query), dtype=bool)
+        same_route[found] = self.row_route_codes[rows[found]] == route_codes[found]
+        rows[found & ~same_route] = -1
+
+        n = max(len(query), 1)
+        stats = {
+            "rows": len(query),
+            "trip_id_coverage": 100 * (trip_codes >= 0).sum() / n,
+            "stop_id_coverage": 100 * (stop_codes >= 0).sum() / n,
+            "route_id_coverage": 100 * (route_codes >= 0).sum() / n,
+            "trip_stop_coverage": 100 * found.sum() / n,
+            "route_mismatches": int((found & ~same_route).sum()),
+            "matched": int((rows >= 0).sum()),
+            "match_coverage": 100 * (rows >= 0).sum() / n,
+        }
+        return rows, stats
+
+    def merge(self, realtime_df, columns=None, how="inner", suffixes=("_real", "_static"), report=False):
+        """
+        Attach static columns to realtime rows through match(), like
+        realtime_df.merge(static_df, on=['trip_id', 'route_id', 'stop_id']).
+
+        Parameters
+        ----------
+        realtime_df : realtime batch
+
+        columns : static columns to attach (by default all of them)
+
+        how : "inner" (default) drops unmatched rows, "left" keeps them with nulls
+
+        suffixes : suffixes for columns present on both sides
+
+        report : print the compatibility report of the batch (by default false)
+
+        Returns
+        -------
+        pd.DataFrame
+        """
+        rows, stats = self.match(realtime_df)
+        if report:
+            print_match_report(stats)
+
+        keys = ["trip_id", "route_id", "stop_id"]
+        columns = [col for col in (columns or self.static_df.columns) if col not in keys]
+        if how == "inner":
+            keep = rows >= 0
+            realtime_df, rows = realtime_df[keep], rows[keep]
+        elif how != "left":
+            raise ValueError(f"how must be 'inner' or 'left', got {how!r}")
+
+        static_part = self.static_df[columns].take(np.maximum(rows, 0)).reset_index(drop=True)
+        if how == "left" and (rows < 0).any():
+            static_part = static_part.where(np.repeat((rows >= 0)[:, None], len(columns), axis=1))
+
+        real_part = realtime_df.reset_index(drop=True)
+        overlap = set(columns) & set(real_part.columns)
+        real_part = real_part.rename(columns={col: col + suffixes[0] for col in overlap})
+        static_part = static_part.rename(columns={col: col + suffixes[1] for col in overlap})
+        return pd.concat([real_part, static_part], axis=1)
+
+    def save(self, path):
+        """Save the index arrays (not static_df, which lives in its own parquet file)."""
+        np.savez(
+            path,
+            trip_ids=self.trip_ids.to_numpy(dtype=str),
+            stop_ids=self.stop_ids.to_numpy(dtype=str),
+            route_ids=self.route_ids.to_numpy(dtype=str),
+            keys=self.keys, rows=self.rows, row_route_codes=self.row_route_codes,
+        )
+
+    @classmethod
+    def load(cls, path, static_df, registry=None):
+        with np.load(path) as data:
+            return cls(
+                static_df, data["trip_ids"], data["stop_ids"], data["route_ids"],
+                data["keys"], data["rows"], data["row_route_codes"], registry,
+            )
+
+
+def print_match_report(stats):
+    """Compatibility report of a match() call, as in the notebook."""
+    print("\n=== COMPATIBILITY REPORT ===")
+    print(f"Trip ID match coverage: {stats['trip_id_coverage']:.2f}%")
+    print(f"Stop ID match coverage: {stats['stop_id_coverage']:.2f}%")
+    print(f"route ID match coverage: {stats['route_id_coverage']:.2f}%")
+    print(f"(trip, stop) match coverage: {stats['trip_stop_coverage']:.2f}%")
+    print(f"Route mismatches: {stats['route_mismatches']:,}")
+    print(f"Matched rows: {stats['matched']:,} ({stats['match_coverage']:.2f}%)")
@@ -0,0 +1,128 @@
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+from config import *
+import data_loader
+from preprocessing import clean_stop_times_data
+from feature_engineering_v2 import extract_stop_times_features
+
+
+def iter_trip_aligned_chunks(path, block_size=64 << 20):
+    """
+    Stream stop_times.txt as pandas chunks without ever splitting a trip across chunks.
+
+    The file is read in blocks of roughly block_size bytes with the declared GTFS
+    schema (ids as plain strings, times as int32 seconds). The rows of the last trip of
+    every block are held back and prepended to the next block, so each yielded chunk
+    holds complete trips only. GTFS feeds keep the rows of a trip together; a trip_id
+    that shows up again after its rows were already yielded raises a ValueError.
+
+    Parameters
+    ----------
+    path : path to stop_times.txt
+
+    block_size : approximate number of bytes read per block (by default 64 MB)
+
+    Yields
+    ------
+    pd.DataFrame
+    """
+    convert_options, time_columns = data_loader.gtfs_csv_convert_options(
+        path, "stop_times", id_type=pa.string()
+    )
+    reader = pacsv.open_csv(
+        path,
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        convert_options=convert_options,
+    )
+
+    finished_trips = set()
+    carry = None
+    for batch in reader:
+        table = data_loader.parse_gtfs_time_columns(pa.Table.from_batches([batch]), time_columns)
+        chunk = table.to_pandas(types_mapper=data_loader.GTFS_PANDAS_TYPES.get)
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        if chunk.empty:
+            continue
+
+        last_trip = chunk["trip_id"].iloc[-1]
+        if pd.isna(last_trip):
+            carry = None
+            complete = chunk
+        else:
+            # rows of the last trip, which may continue in the next block
+            tail_start = len(chunk)
+            trip_ids = chunk["trip_id"].to_numpy()
+            while tail_start > 0 and trip_ids[tail_start - 1] == last_trip:
+                tail_start -= 1
+            carry = chunk.iloc[tail_start:]
+            complete = chunk.iloc[:tail_start]
+
+        chunk_trips = complete["trip_id"].dropna().unique()
+        if not finished_trips.isdisjoint(chunk_trips):
+            raise ValueError(f"{path} is not grouped by trip_id, sort it by trip_id before streaming")
+        finished_trips.update(chunk_trips)
+
+        if not complete.empty:
+            yield complete
+
+    if carry is not None and not carry.empty:
+        if last_trip in finished_trips:
+            raise ValueError(f"{path} is not grouped by trip_id, sort it by trip_id before streaming")
+        yield carry
+
+
+def stream_stop_times_to_parquet(path, output_path, block_size=64 << 20, extract_features=True):
+    """
+    Out-of-core version of clean_stop_times_data (+ extract_stop_times_features).
+
+    stop_times.txt is processed in trip-aligned chunks (see iter_trip_aligned_chunks)
+    and every processed chunk is appended to one parquet file, so peak memory is
+    bounded by the block size instead of the size of the table. Because no trip is
+    split across chunks, the per-trip dedup of clean_stop_times_data gives the same
+    rows as running it on the whole table.
+
+    Parameters
+    ----------
+    path : path to stop_times.txt
+
+    output_path : parquet file to write
+
+    block_size : approximate number of bytes read per chunk (by default 64 MB)
+
+    extract_features : also run extract_stop_times_features on each chunk (by default true)
+
+    Returns
+    -------
+    int number of rows written
+    """
+    writer = None
+    schema = None
+    rows_written = 0
+    n_chunks = 0
+    try:
+        for chunk in iter_trip_aligned_chunks(path, block_size=block_size):
+            chunk = clean_stop_times_data(chunk)
+            if extract_features:
+                chunk = extract_stop_times_features(chunk)
+
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                # all-null columns of the first chunk have no real type yet
+                schema = pa.schema([
+                    field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                    for field in table.schema
+                ]).remove_metadata()
+                writer = pq.ParquetWriter(output_path, schema)
+            writer.write_table(table.cast(schema))
+
+            rows_written += len(chunk)
+            n_chunks += 1
+            print(f"✅ Chunk {n_chunks}: {len(chunk):,} rows | Total: {rows_written:,}")
+    finally:
+        if writer is not None:
+            writer.close()
+
+    print(f"💾 Saved {rows_written:,} stop_times rows to {output_path}")
+    return rows_written
@@ -0,0 +1,250 @@
+import pyarrow.parquet as pq
+from spatial_index import StopSpatialIndex
+from config import *
+
+
+# NYC TLC taxi zones are LocationID 1..265, so codes index the zone axis directly
+TAXI_ZONE_COUNT = 266
+TAXI_BUCKET_MINUTES = 15
+TAXI_TIMEZONE = "America/New_York"
+TAXI_CUBE_COLUMNS = ["tpep_pickup_datetime", "tpep_dropoff_datetime", "PULocationID", "DOLocationID"]
+TAXI_FILE_MONTH_PATTERN = re.compile(r"(\d{4})-(\d{2})")
+
+
+def _local_times(times):
+    # taxi timestamps are naive New York local times; aware times are converted to match
+    times = pd.to_datetime(pd.Series(times).reset_index(drop=True))
+    if times.dt.tz is not None:
+        times = times.dt.tz_convert(TAXI_TIMEZONE).dt.tz_localize(None)
+    return times.to_numpy(dtype="datetime64[ns]")
+
+
+def demand_cube_path(cube_dir, month):
+    """<cube_dir>/taxi_demand_<YYYY-MM>.npz, the file of one month of demand counts."""
+    return os.path.join(cube_dir, f"taxi_demand_{pd.Timestamp(month):%Y-%m}.npz")
+
+
+class TaxiDemandCube():
+    """
+    Taxi pickups and dropoffs of one month counted per (time bucket, taxi zone).
+
+    The counts are dense int32 arrays of shape (buckets in the month, TAXI_ZONE_COUNT),
+    filled with one np.bincount over bucket * n_zones + zone, so a feature lookup for
+    any batch of (zone, time) pairs is plain array indexing.
+
+    Parameters
+    ----------
+    month : first day of the month
+
+    bucket_minutes : bucket width in minutes (by default TAXI_BUCKET_MINUTES)
+
+    pickups, dropoffs : count arrays (n_buckets, n_zones)
+    """
+
+    def __init__(self, month, bucket_minutes, pickups, dropoffs):
+        self.month = pd.Timestamp(month).to_period("M").to_timestamp()
+        self.bucket_minutes = int(bucket_minutes)
+        self.pickups = np.asarray(pickups, dtype=np.int32)
+        self.dropoffs = np.asarray(dropoffs, dtype=np.int32)
+
+    @property
+    def n_buckets(self):
+        return self.pickups.shape[0]
+
+    @property
+    def n_zones(self):
+        return self.pickups.shape[1]
+
+    @staticmethod
+    def buckets_in_month(month, bucket_minutes=TAXI_BUCKET_MINUTES):
+        month = pd.Timestamp(month).to_period("M")
+        return month.days_in_month * 24 * 60 // bucket_minutes
+
+    def bucket_index(self, times):
+        """Bucket of every time within the month, -1 for times outside it (or NaT)."""
+        times = np.asarray(times, dtype="datetime64[ns]")
+        offsets = (times - np.datetime64(self.month, "ns")) // np.timedelta64(self.bucket_minutes, "m")
+        offsets = offsets.astype(np.int64)
+        inside = ~np.isnat(times) & (offsets >= 0) & (offsets < self.n_buckets)
+        return np.where(inside, offsets, -1)
+
+    @classmethod
+    def build(cls, taxi_df, month, bucket_minutes=TAXI_BUCKET_MINUTES, n_zones=TAXI_ZONE_COUNT):
+        """
+        Count the pickups and dropoffs of one month of taxi trips (clean_taxi_data
+        output or the raw columns of TAXI_CUBE_COLUMNS). Pickups are placed by pickup
+        time and zone, dropoffs by dropoff time and zone; trips outside the month or
+        without a valid zone are left out.
+
+        Returns
+        -------
+        TaxiDemandCube
+        """
+        n_buckets = cls.buckets_in_month(month, bucket_minutes)
+        cube = cls(month, bucket_minutes, np.zeros((n_buckets, n_zones)), np.zeros((n_buckets, n_zones)))
+
+        def count(time_column, zone_column):
+            buckets = cube.bucket_index(_local_times(taxi_df[time_column]))
+            zones = pd.to_numeric(taxi_df[zone_column], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            valid = (buckets >= 0) & (zones >= 0) & (zones < n_zones)
+            cells = buckets[valid] * n_zones + zones[valid].astype(np.int64)
+            return np.bincount(cells, minlength=n_buckets * n_zones).reshape(n_buckets, n_zones).astype(np.int32)
+
+        cube.pickups = count("tpep_pickup_datetime", "PULocationID")
+        cube.dropoffs = count("tpep_dropoff_datetime", "DOLocationID")
+        return cube
+
+    def lookup(self, zones, times):
+        """
+        Pickup and dropoff counts at every (zone, time) pair.
+
+        Parameters
+        ----------
+        zones : taxi zone ids (-1 / NaN for none)
+
+        times : times (naive New York local time or tz-aware)
+
+        Returns
+        -------
+        (pickups, dropoffs) float arrays, NaN where the zone or time is outside the cube
+        """
+        zones = np.asarray(pd.to_numeric(pd.Series(zones), errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan))
+        buckets = self.bucket_index(_local_times(times))
+        valid = (buckets >= 0) & (zones >= 0) & (zones < self.n_zones)
+        zone_codes = np.where(valid, zones, 0).astype(np.int64)
+        bucket_codes = np.maximum(buckets, 0)
+        pickups = np.where(valid, self.pickups[bucket_codes, zone_codes], np.nan)
+        dropoffs = np.where(valid, self.dropoffs[bucket_codes, zone_codes], np.nan)
+        return pickups, dropoffs
+
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(tmp_path, month=np.array(str(self.month.date())), bucket_minutes=self.bucket_minutes,
+                            pickups=self.pickups, dropoffs=self.dropoffs)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(str(data["month"]), int(data["bucket_minutes"]), data["pickups"], data["dropoffs"])
+
+
+def write_monthly_demand_cubes(taxi_paths, cube_dir, bucket_minutes=TAXI_BUCKET_MINUTES, overwrite=False):
+    """
+    Precompute the demand cube of every monthly taxi parquet file (e.g.
+    yellow_tripdata_2024-01.parquet), once: months whose cube already exists are
+    skipped unless overwrite is true. Only TAXI_CUBE_COLUMNS are read.
+
+    Parameters
+    ----------
+    taxi_paths : monthly taxi parquet paths, the month taken from the YYYY-MM in the file name
+
+    cube_dir : output directory of the .npz cubes
+
+    bucket_minutes : bucket width in minutes (by default TAXI_BUCKET_MINUTES)
+
+    overwrite : rebuild existing cubes (by default false)
+
+    Returns
+    -------
+    list of cube paths
+    """
+    os.makedirs(cube_dir, exist_ok=True)
+    cube_paths = []
+    for taxi_path in sorted(taxi_paths):
+        found = TAXI_FILE_MONTH_PATTERN.search(os.path.basename(taxi_path))
+        if found is None:
+            print(f"⚠️ No YYYY-MM month in {taxi_path}, skipped")
+            continue
+        month = pd.Timestamp(year=int(found.group(1)), month=int(found.group(2)), day=1)
+        cube_path = demand_cube_path(cube_dir, month)
+        cube_paths.append(cube_path)
+        if os.path.exists(cube_path) and not overwrite:
+            print(f"✅ Demand cube for {month:%Y-%m} already exists")
+            continue
+
+        taxi_df = pq.read_table(taxi_path, columns=TAXI_CUBE_COLUMNS).to_pandas()
+        cube = TaxiDemandCube.build(taxi_df, month, bucket_minutes=bucket_minutes)
+        cube.save(cube_path)
+        print(f"💾 Demand cube for {month:%Y-%m}: {int(cube.pickups.sum()):,} pickups, "
+              f"{int(cube.dropoffs.sum()):,} dropoffs -> {cube_path}")
+    return cube_paths
+
+
+def stop_taxi_zones(stops_df, zone_centroids, max_distance_m=None, zone_column="LocationID",
+                    lat_column="lat", lon_column="lon"):
+    """
+    Taxi zone of every stop, the zone with the nearest centroid.
+
+    Parameters
+    ----------
+    stops_df : stops DataFrame ('stop_id', 'stop_lat', 'stop_lon')
+
+    zone_centroids : DataFrame of zone ids and centroid coordinates (e.g. computed
+                     from the TLC taxi_zones shapefile)
+
+    max_distance_m : optional; stops farther from every centroid get no zone
+
+    zone_column, lat_column, lon_column : columns of zone_centroids
+
+    Returns
+    -------
+    pd.Series of Int32 zone ids indexed by stop_id
+    """
+    zones = StopSpatialIndex(zone_centroids[zone_column].to_numpy(), zone_centroids[lat_column].to_numpy(),
+                             zone_centroids[lon_column].to_numpy())
+    positions, _ = zones.nearest(stops_df["stop_lat"].to_numpy(), stops_df["stop_lon"].to_numpy(),
+                                 k=1, max_distance_m=max_distance_m)
+    zone_ids = pd.array(zones.stop_ids.to_numpy()[np.maximum(positions[:, 0], 0)], dtype="Int32")
+    zone_ids[positions[:, 0] < 0] = pd.NA
+    return pd.Series(zone_ids, index=pd.Index(stops_df["stop_id"], name="stop_id"), name="taxi_zone")
+
+
+def add_taxi_demand_features(df, cube_dir, stop_zones, time_column="arrival_time_real",
+                             stop_column="stop_id", prefix="taxi_"):
+    """
+    Add the taxi pickups / dropoffs of the stop's zone in the row's time bucket.
+
+    Every month present in df is loaded once from its precomputed cube and its rows
+    are filled by array indexing; rows of months without a cube, or of stops without
+    a zone, are left NaN.
+
+    Parameters
+    ----------
+    df : rows with a stop and a time (e.g. realtime arrivals)
+
+    cube_dir : directory of write_monthly_demand_cubes
+
+    stop_zones : stop_taxi_zones output
+
+    time_column : time column of df (by default "arrival_time_real")
+
+    stop_column : stop id column of df (by default "stop_id")
+
+    prefix : prefix of the added columns (by default "taxi_")
+
+    Returns
+    -------
+    pd.DataFrame, df with <prefix>pickups and <prefix>dropoffs
+    """
+    positions = stop_zones.index.get_indexer(df[stop_column].astype(str))
+    zone_values = stop_zones.to_numpy(dtype=np.float64, na_value=np.nan)
+    zones = np.where(positions >= 0, zone_values[np.maximum(positions, 0)], np.nan)
+    times = _local_times(df[time_column])
+
+    pickups = np.full(len(df), np.nan)
+    dropoffs = np.full(len(df), np.nan)
+    months = times.astype("datetime64[M]")
+    for month in np.unique(months[~np.isnat(months)]):
+        cube_path = demand_cube_path(cube_dir, pd.Timestamp(month))
+        if not os.path.exists(cube_path):
+            print(f"⚠️ No taxi demand cube for {pd.Timestamp(month):%Y-%m}")
+            continue
+        rows = np.flatnonzero(months == month)
+        cube = TaxiDemandCube.load(cube_path)
+        pickups[rows], dropoffs[rows] = cube.lookup(zones[rows], times[rows])
+
+    df = df.copy()
+    df[f"{prefix}pickups"] = pickups
+    df[f"{prefix}dropoffs"] = dropoffs
+    return df
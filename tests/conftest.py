@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+# the pipeline modules are flat modules at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+GTFS_FIXTURE = {
+    "stops.txt": """stop_id,stop_name,stop_lat,stop_lon,location_type,parent_station
+101N,Times Sq - 42 St (Manhattan),40.7553,-73.9869,,101
+102S,Brooklyn Bridge,40.7131,-74.0041,,
+103N,Jamaica Center (Queens),40.7021,-73.8011,,
+104S,Stillwell Av,40.5773,-73.9813,1,
+""",
+    "routes.txt": """agency_id,route_id,route_short_name,route_long_name,route_desc,route_type,route_color
+MTA,1,1,Broadway - 7 Avenue Local,via Broadway,1,EE352E
+MTA,A,A,8 Avenue Express,Express service,1,0039A6
+MTA,B63,B63,Bay Ridge - Cobble Hill,,3,
+""",
+    "trips.txt": """route_id,service_id,trip_id,trip_headsign,direction_id,shape_id
+1,WKD,AFA23GEN-1000-00-Weekday-00_000000_1..N00R,Uptown,0,SH0
+A,SUN,AFA23GEN-1001-00-Sunday-00_000600_A..S01R,Downtown,1,SH1
+""",
+    "stop_times.txt": """trip_id,arrival_time,departure_time,stop_id,stop_sequence
+AFA23GEN-1000-00-Weekday-00_000000_1..N00R,06:00:00,06:00:30,101N,1
+AFA23GEN-1000-00-Weekday-00_000000_1..N00R,06:02:00, 06:02:30 ,102S,2
+AFA23GEN-1000-00-Weekday-00_000000_1..N00R,,06:05:00,103N,3
+AFA23GEN-1001-00-Sunday-00_000600_A..S01R,25:10:00,25:10:30,104S,1
+AFA23GEN-1001-00-Sunday-00_000600_A..S01R,bad,12:30,101N,2
+""",
+}
+
+
+@pytest.fixture
+def gtfs_dir(tmp_path):
+    """A tiny GTFS feed with a blank and malformed times."""
+    for name, content in GTFS_FIXTURE.items():
+        (tmp_path / name).write_text(content)
+    return str(tmp_path)
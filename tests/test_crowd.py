@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from crowd import compute_crowd, compute_crowd_v1
+
+
+@pytest.fixture
+def arrivals_df():
+    rng = np.random.default_rng(7)
+    rows = []
+    # groups of 2 to 60 arrivals, so some never reach min_periods and some fill the window
+    for group, n in enumerate([60, 35, 3, 12, 1, 25]):
+        start = pd.Timestamp("2025-11-07 06:00") + pd.Timedelta(minutes=group)
+        gaps = rng.integers(60, 900, size=n).cumsum()
+        for gap in gaps:
+            rows.append({"route_id": "ABC"[group % 3], "stop_id": f"{100 + group}N",
+                         "arrival_time_real": start + pd.Timedelta(seconds=int(gap))})
+    df = pd.DataFrame(rows).sample(frac=1, random_state=3).reset_index(drop=True)
+    # rows with a missing key fall out of the per-group headways
+    df.loc[[5, 17], "route_id"] = None
+    df.loc[[40], "stop_id"] = np.nan
+    # two buses at the same time
+    df.loc[50, ["route_id", "stop_id", "arrival_time_real"]] = df.loc[51, ["route_id", "stop_id", "arrival_time_real"]]
+    return df
+
+
+def test_compute_crowd_matches_v1(arrivals_df):
+    expected = compute_crowd_v1(arrivals_df)
+    actual = compute_crowd(arrivals_df)
+
+    assert actual.index.tolist() == expected.index.tolist()
+    for col in ["actual_headway_sec", "scheduled_headway_sec", "crowd_score"]:
+        np.testing.assert_allclose(actual[col].to_numpy(), expected[col].to_numpy(), rtol=1e-12, err_msg=col)
+    assert actual["crowd"].tolist() == expected["crowd"].tolist()
+    assert set(actual["crowd"]) == {0, 1, 2}
+
+
+def test_compute_crowd_accepts_epoch_seconds(arrivals_df):
+    epoch = arrivals_df.assign(
+        arrival_time_real=arrivals_df["arrival_time_real"].astype("datetime64[ns]").astype(np.int64) // 10**9
+    )
+    expected = compute_crowd(arrivals_df)
+    actual = compute_crowd(epoch)
+    np.testing.assert_allclose(actual["crowd_score"].to_numpy(), expected["crowd_score"].to_numpy())
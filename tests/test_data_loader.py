@@ -0,0 +1,74 @@
+import numpy as np
+import pyarrow as pa
+import pytest
+
+import data_loader
+
+
+def test_gtfs_time_to_seconds_nulls_malformed_values():
+    times = pa.array(["06:00:00", " 25:10:30 ", "", None, "bad", "12:30", "12:xx:00"])
+    result = data_loader.gtfs_time_to_seconds(times).to_pylist()
+    assert result == [21600, 90630, None, None, None, None, None]
+
+
+@pytest.mark.parametrize("backend", ["pyarrow", "duckdb"])
+def test_v3_times_match_v2_and_null_bad_rows(gtfs_dir, backend):
+    v2 = data_loader.load_GTF_static_data_v2(gtfs_dir)["stop_times"]
+    v3 = data_loader.load_GTF_static_data_v3(gtfs_dir, backend=backend)["stop_times"]
+
+    assert len(v3) == len(v2)
+    for col in ["arrival_time", "departure_time"]:
+        # v2 strings coerced the way the notebook did, to seconds of the service day
+        parts = v2[col].astype("string").str.strip().str.extract(r"^(\d+):(\d{1,2}):(\d{1,2})$").astype(float)
+        expected = parts[0] * 3600 + parts[1] * 60 + parts[2]
+        actual = v3[col].astype("Float64").to_numpy(dtype=float, na_value=np.nan)
+        np.testing.assert_array_equal(actual, expected.to_numpy())
+    assert v3["arrival_time"].isna().sum() == 2
+    assert v3["stop_sequence"].tolist() == v2["stop_sequence"].tolist()
+    assert v3["trip_id"].astype(str).tolist() == v2["trip_id"].astype(str).tolist()
+
+
+def _trip_updates_feed(t0=1700000000):
+    gtfs_realtime_pb2 = pytest.importorskip("google.transit.gtfs_realtime_pb2")
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = "2.0"
+    feed.header.timestamp = t0
+    for i, trip_id in enumerate(["T1", "T2", ""]):
+        entity = feed.entity.add()
+        entity.id = str(i)
+        entity.trip_update.trip.trip_id = trip_id
+        if trip_id != "T2":
+            entity.trip_update.trip.route_id = "A"
+        for k in range(4):
+            update = entity.trip_update.stop_time_update.add()
+            update.stop_id = f"{101 + k}N"
+            if k != 1:
+                update.arrival.time = t0 + 60 * k
+            if k == 2:
+                update.arrival.delay = -30
+            if k != 3:
+                update.departure.time = t0 + 60 * k + 20
+    # a vehicle entity adds no rows
+    entity = feed.entity.add()
+    entity.id = "vehicle"
+    entity.vehicle.trip.trip_id = "T1"
+    return feed.SerializeToString()
+
+
+def test_realtime_decoder_matches_v1(tmp_path):
+    path = tmp_path / "2025-01-01_00-00-00_000000.pb"
+    path.write_bytes(_trip_updates_feed())
+
+    expected = data_loader.convert_GTF_realtime_data_to_df_v1(str(path))
+    actual = data_loader.convert_GTF_realtime_data_to_df(str(path))
+
+    assert len(actual) == len(expected) == 12
+    for col in ["trip_id", "route_id", "stop_id"]:
+        assert actual[col].astype(str).tolist() == expected[col].astype(str).tolist()
+    for col, v1_col in [("arrival_time", "arrival_time"), ("departure_time", "departure_time"),
+                        ("arrival_delay", "delay")]:
+        np.testing.assert_array_equal(
+            actual[col].to_numpy(dtype=float, na_value=np.nan),
+            expected[v1_col].to_numpy(dtype=float, na_value=np.nan),
+            err_msg=col,
+        )
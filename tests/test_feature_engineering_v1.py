@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("geopy")
+
+from feature_engineering_v1 import calculate_ets, calculate_ets_v1
+from segment_index import StopPairDistanceIndex
+
+
+@pytest.fixture
+def trips_df():
+    rng = np.random.default_rng(7)
+    rows = []
+    start = pd.Timestamp("2025-01-06 07:00")
+    for trip in range(6):
+        lat = 40.70 + np.cumsum(rng.normal(0, 0.01, 8))
+        lon = -73.95 + np.cumsum(rng.normal(0, 0.01, 8))
+        arrivals = start + pd.to_timedelta(np.cumsum(rng.integers(40, 240, 8)), unit="s")
+        for seq in range(8):
+            rows.append({
+                "trip_id": f"T{trip}", "stop_id": f"S{trip}_{seq}", "stop_sequence": seq + 1,
+                "arrival_time_real": arrivals[seq],
+                "departure_time_real": arrivals[seq] + pd.Timedelta(seconds=int(rng.integers(0, 40))),
+                "stop_lat": lat[seq], "stop_lon": lon[seq],
+            })
+    df = pd.DataFrame(rows)
+    # a zero travel time, a missing arrival and two rows without a trip
+    df.loc[3, "arrival_time_real"] = df.loc[2, "departure_time_real"]
+    df.loc[10, "arrival_time_real"] = pd.NaT
+    df.loc[[20, 21], "trip_id"] = np.nan
+    return df.sample(frac=1, random_state=3).reset_index(drop=True)
+
+
+def _sorted(df):
+    return df.sort_values(["trip_id", "stop_sequence"]).reset_index(drop=True)
+
+
+def test_default_matches_v1(trips_df):
+    expected = _sorted(calculate_ets_v1(trips_df))
+    result = _sorted(calculate_ets(trips_df))
+
+    np.testing.assert_array_equal(result["travel_time_seconds"], expected["travel_time_seconds"])
+    np.testing.assert_allclose(result["distance_km"], expected["distance_km"], rtol=1e-6, atol=1e-9)
+    np.testing.assert_allclose(result["speed_kmh"], expected["speed_kmh"], rtol=1e-6, atol=1e-9)
+
+
+def test_rows_without_trip_are_not_chained(trips_df):
+    result = calculate_ets(trips_df)
+    no_trip = result[result["trip_id"].isna()]
+    assert len(no_trip) == 2
+    assert (no_trip[["travel_time_seconds", "distance_km", "speed_kmh"]] == 0).all().all()
+
+
+def test_haversine_within_tolerance(trips_df):
+    expected = _sorted(calculate_ets_v1(trips_df))
+    result = _sorted(calculate_ets(trips_df, method="haversine"))
+    np.testing.assert_allclose(result["distance_km"], expected["distance_km"], rtol=0.006)
+
+
+def test_segment_index_matches_direct(trips_df):
+    stops = trips_df.drop_duplicates("stop_id")[["stop_id", "stop_lat", "stop_lon"]]
+    index = StopPairDistanceIndex.build(stops, trips_df.dropna(subset=["trip_id"]))
+    direct = calculate_ets(trips_df)
+    indexed = calculate_ets(trips_df, segment_index=index)
+    # the index stores float32 distances
+    np.testing.assert_allclose(indexed["distance_km"], direct["distance_km"], rtol=1e-6)
+    with pytest.raises(ValueError):
+        calculate_ets(trips_df, method="haversine", segment_index=index)
+
+
+def test_segment_index_skips_rows_without_trip():
+    stops = pd.DataFrame({"stop_id": ["a", "b", "c"], "stop_lat": [40.70, 40.71, 40.72],
+                          "stop_lon": [-73.90, -73.91, -73.92]})
+    stop_times = pd.DataFrame({"trip_id": ["T1", "T1", np.nan, np.nan], "stop_id": ["a", "b", "b", "c"],
+                               "stop_sequence": [1, 2, 1, 2]})
+    index = StopPairDistanceIndex.build(stops, stop_times)
+    assert len(index) == 1
+    assert np.isnan(index.lookup(["b"], ["c"])[0])
@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_engineering_v2 import (
+    FeatureEngineeringRouteDf,
+    extract_stop_times_features,
+    extract_stop_times_features_v1,
+    extract_stops_features,
+    extract_stops_features_v1,
+    extract_trip_features,
+    parse_trip_ids,
+)
+
+
+TRIP_IDS = [
+    "AFA23GEN-1038-Sunday-00_000600_1..S03R",
+    "AFA23GEN-1038-00-Sunday-00_000600_1..S03R",
+    "AFA23GEN-1038-00-Sunday-00_000600_1..S03R",
+    "AFA23GEN-2044-00-Weekday-00_043150_A..N27R",
+    "BFA23GEN-R052-Saturday-01_084500_R..N05R-00_000100_R..S05R",
+    "AFA23GEN-1038-00-Sunday-00_000600",
+    "AFA23GEN-1038-00-Sunday-00_000600_1.S03R",
+    "AFA23GEN-1038",
+    "garbage",
+    "",
+    None,
+    np.nan,
+]
+
+
+@pytest.fixture
+def stop_times_df():
+    return pd.DataFrame({
+        "trip_id": pd.Series(TRIP_IDS, dtype=object),
+        "stop_id": [f"{i}N" for i in range(len(TRIP_IDS))],
+        "stop_sequence": range(1, len(TRIP_IDS) + 1),
+    })
+
+
+def _split_reference(trip_ids):
+    # the per-row str.split parsing extract_trip_features used before parse_trip_ids
+    split_cols = trip_ids.str.split('-', expand=True)
+    trip_info = split_cols[3]
+    direction = trip_info.str.extract(r"([NS]\d{2}R)")[0]
+    return pd.DataFrame({
+        "day_name": split_cols[2],
+        "trip_time": trip_info.str.extract(r"(\d{2}_\d{6})")[0],
+        "dir_letter": direction.str[0],
+        "route_num": direction.str[1:3],
+    })
+
+
+def _as_object(values):
+    return pd.Series(values, dtype=object).where(pd.notna(values), None).tolist()
+
+
+def test_stop_times_features_match_v1(stop_times_df):
+    expected = extract_stop_times_features_v1(stop_times_df)
+    actual = extract_stop_times_features(stop_times_df)
+
+    assert list(actual.columns) == list(expected.columns)
+    assert _as_object(actual["day_type"]) == _as_object(expected["day_type"])
+    for col in ["is_northbound", "is_southbound"]:
+        assert actual[col].tolist() == expected[col].tolist()
+    assert actual["is_northbound"].tolist()[:5] == [0, 0, 0, 1, 0]
+    assert actual["is_southbound"].tolist()[:5] == [0, 1, 1, 0, 1]
+
+
+def test_parse_trip_ids_matches_split(stop_times_df):
+    expected = _split_reference(stop_times_df["trip_id"])
+    parsed = parse_trip_ids(stop_times_df["trip_id"])
+
+    for col in ["day_name", "dir_letter", "route_num"]:
+        assert _as_object(parsed[col]) == _as_object(expected[col])
+    # "00_000600" is 600 hundredths of a minute after midnight -> 360 s
+    trip_time = expected["trip_time"].str[3:].astype(float).mul(0.6).round()
+    np.testing.assert_array_equal(
+        parsed["trip_time"].to_numpy(dtype=float, na_value=np.nan), trip_time.to_numpy()
+    )
+    assert parsed["trip_time"].iloc[0] == 360
+    assert parsed["dir_letter"].iloc[0] == "S" and parsed["route_num"].iloc[0] == "03"
+
+
+def test_parse_trip_ids_keeps_index():
+    trip_ids = pd.Series(["AFA23GEN-1038-Sunday-00_000600_1..S03R", None], index=[10, 3])
+    parsed = parse_trip_ids(trip_ids)
+    assert parsed.index.tolist() == [10, 3]
+    assert parsed["day_name"].tolist()[0] == "Sunday"
+    assert parsed["trip_time"].isna().tolist() == [False, True]
+
+
+def test_extract_trip_features_missing_column():
+    with pytest.raises(KeyError):
+        extract_trip_features(pd.DataFrame({"route_id": ["1"]}))
+
+
+ROUTE_LONG_NAMES = [
+    "Broadway - 7 Avenue Local",
+    "8 Avenue Express",
+    "Lexington Avenue Express / Local",
+    "Queens Boulevard Express & Local Weekdays",
+    "Franklin Avenue Shuttle",
+    "Brooklyn-Queens Crosstown",
+    "Times Square - Grand Central Shuttle",
+    "Manhattan Bronx Brooklyn Queens via 42 St Pl",
+    "Bay Ridge - Forest Hills Local Local",
+    "",
+    None,
+    np.nan,
+]
+
+
+@pytest.fixture
+def routes_df():
+    names = pd.Series(ROUTE_LONG_NAMES * 3, dtype=object)
+    return pd.DataFrame({"route_id": [str(i) for i in range(len(names))], "route_long_name": names})
+
+
+def test_route_long_name_features_match_v1(routes_df):
+    engine = FeatureEngineeringRouteDf()
+    expected = engine.feature_engineering_for_route_long_name_v1(routes_df)
+    actual = engine.feature_engineering_for_route_long_name(routes_df)
+
+    assert list(actual.columns) == list(expected.columns)
+    for col in expected.columns:
+        if col == "has_multiple_services":
+            continue
+        assert _as_object(actual[col]) == _as_object(expected[col]), col
+
+
+def test_has_multiple_services_counts_upper_cased_words(routes_df):
+    actual = FeatureEngineeringRouteDf().feature_engineering_for_route_long_name(routes_df)
+    flags = dict(zip(routes_df["route_long_name"].fillna(""), actual["has_multiple_services"]))
+    assert flags["Lexington Avenue Express / Local"] == 1
+    assert flags["Queens Boulevard Express & Local Weekdays"] == 1
+    assert flags["Bay Ridge - Forest Hills Local Local"] == 1
+    assert flags["8 Avenue Express"] == 0
+    assert flags[""] == 0
+
+
+STOP_NAMES = [
+    "Times Sq - 42 St", "Grand Central - 42 St", "Brooklyn Bridge - City Hall",
+    "Stillwell Av (Coney Island)", "Howard Beach - JFK Airport", "East 180 St",
+    "Bronx Park East", "Queens Plaza", "St George", "Court Sq - 23 St",
+    "Times Sq - 42 St", "", "Jamaica Center (Parsons / Archer)",
+]
+
+
+@pytest.fixture
+def stops_df():
+    n = len(STOP_NAMES)
+    return pd.DataFrame({
+        "stop_id": ["101", "101N", "101S", "R01", "H39E", "A12W", "B1", "Q01N", "S31", "719", "902N", "X", "G05S"],
+        "stop_name": STOP_NAMES,
+        "location_type": [1.0, np.nan, np.nan, 1.0, np.nan, 1.0, np.nan, np.nan, 1.0, np.nan, np.nan, np.nan, 1.0],
+        "parent_station": [None, "101", "101", None, None, "A12", None, "Q01", None, "719", "902", None, "G05"],
+        "stop_lat": np.linspace(40.5, 40.9, n),
+        "stop_lon": np.linspace(-74.1, -73.7, n),
+    })
+
+
+def test_extract_stops_features_matches_v1(stops_df):
+    expected = extract_stops_features_v1(stops_df)
+    actual = extract_stops_features(stops_df)
+
+    assert sorted(actual.columns) == sorted(expected.columns)
+    pd.testing.assert_frame_equal(
+        actual[expected.columns].astype(object), expected.astype(object), check_dtype=False
+    )
+
+
+def test_extract_stops_features_missing_names(stops_df):
+    stops_df.loc[[2, 7], "stop_name"] = [None, np.nan]
+    actual = extract_stops_features(stops_df)
+
+    named = stops_df["stop_name"].notna()
+    expected = extract_stops_features_v1(stops_df[named])
+    for col in ["is_terminal_stop", "is_interchange_stop", "borough_hint", "hierarchy_level", "stop_freq_rank"]:
+        assert actual.loc[named, col].tolist() == expected[col].tolist(), col
+    assert actual.loc[~named, "is_terminal_stop"].tolist() == [0, 0]
+    assert actual.loc[~named, "borough_hint"].tolist() == ["Unknown", "Unknown"]
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from id_registry import IdRegistry
+
+
+def test_codes_are_stable_and_missing_ids_are_minus_one(tmp_path):
+    registry = IdRegistry()
+    first = registry.encode("stop_id", pd.Series(["101N", "102S", None, "101N", np.nan]))
+    assert first.tolist() == [0, 1, -1, 0, -1]
+
+    # categorical, int and unknown ids share the same code space
+    again = registry.encode("stop_id", pd.Series(["102S", "103N", "101N"], dtype="category"))
+    assert again.tolist() == [1, 2, 0]
+    assert registry.encode("stop_id", pd.Series([101, 104]), add=False).tolist() == [-1, -1]
+
+    path = str(tmp_path / "registry.npz")
+    registry.save(path)
+    loaded = IdRegistry.load(path)
+    assert loaded.encode("stop_id", ["103N", "101N"], add=False).tolist() == [2, 0]
+
+
+def test_frame_and_arrow_round_trip():
+    df = pd.DataFrame({
+        "trip_id": ["T1", "T1", None, "T2"],
+        "stop_id": ["101N", "", "102S", "101N"],
+        "parent_station": ["101", None, "102", "101"],
+        "stop_sequence": [1, 2, 1, 1],
+    })
+    registry = IdRegistry()
+    encoded = registry.encode_frame(df)
+    assert list(encoded.columns) == ["trip_id_code", "stop_id_code", "parent_station_code", "stop_sequence"]
+    assert encoded["trip_id_code"].tolist() == [0, 0, -1, 1]
+
+    decoded = registry.decode_frame(encoded)
+    assert decoded.astype(object).where(decoded.notna(), None).values.tolist() == \
+        df.astype(object).where(df.notna(), None).values.tolist()
+
+    table = pa.Table.from_pandas(df).drop_columns(["parent_station"])
+    table = table.set_column(0, "trip_id", table.column("trip_id").dictionary_encode())
+    arrow_codes = registry.encode_arrow(table, add=False)
+    assert arrow_codes.column("trip_id_code").to_pylist() == [0, 0, -1, 1]
+    assert arrow_codes.column("stop_id_code").to_pylist() == encoded["stop_id_code"].tolist()
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from preprocessing import clean_taxi_data, clean_taxi_data_v1, clean_taxi_parquet
+
+
+@pytest.fixture
+def raw_taxi_df():
+    # text columns as read from a CSV: placeholders, malformed numbers and timestamps
+    return pd.DataFrame({
+        "VendorID": ["1", "2", "NA", "1", "2", "1", "2", "1", "None", "2"],
+        "tpep_pickup_datetime": ["2024-01-01 08:00:00", "2024-01-01 09:00:00", "", "2024-01-01 10:00:00",
+                                 "not a date", "2024-01-01 11:00:00", "2024-01-01 12:00:00",
+                                 "2024-01-01 13:00:00", "2024-01-01 14:00:00", "2024-01-01 15:00:00"],
+        "tpep_dropoff_datetime": ["2024-01-01 08:20:00", "2024-01-01 08:50:00", "2024-01-01 09:30:00",
+                                  "2024-01-01 14:00:00", "2024-01-01 12:10:00", "2024-01-01 11:15:00",
+                                  "2024-01-01 12:30:00", "nan", "2024-01-01 14:12:00", "2024-01-01 15:20:00"],
+        "passenger_count": ["1", "0", "2", "7", "3", "abc", "NaN", "1", "2", " "],
+        "trip_distance": ["2.5", "-1", "3", "150", "1.2", "0", "null", "4", "2.2", "1e1"],
+        "fare_amount": ["10", "-5", "12", "2000", "8", "0", "9", "11", "NULL", "30"],
+        "total_amount": ["12", "3000", "15", "20", "9", "0", "10", "13", "12", "-1"],
+        "store_and_fwd_flag": ["N", "Y", "N", "", "N", "N", "None", "N", "Y", "N"],
+        "payment_type": ["1", "2", "1", "1", "3", "1", "2", "nan", "1", "1"],
+        "RatecodeID": ["1", "1", "1", "5", "1", "1", "1", "1", "99", "1"],
+        "PULocationID": ["132", "x", "", "48", "161", "237", "NA", "13", "265", "142"],
+        "DOLocationID": ["236", "48", "1", "", "230", "236", "79", "164", "1", "24"],
+    })
+
+
+@pytest.fixture
+def typed_taxi_df():
+    # the dtypes of the monthly yellow_tripdata parquet files
+    n = 200
+    rng = np.random.default_rng(11)
+    pickup = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 30 * 86400, n), unit="s")
+    df = pd.DataFrame({
+        "VendorID": rng.integers(1, 3, n).astype(np.int32),
+        "tpep_pickup_datetime": pickup,
+        "tpep_dropoff_datetime": pickup + pd.to_timedelta(rng.integers(-600, 4 * 3600, n), unit="s"),
+        "passenger_count": rng.choice([0.0, 1.0, 2.0, 7.0, np.nan], n),
+        "trip_distance": rng.choice([-1.0, 0.0, 1.5, 12.0, 250.0, np.nan], n),
+        "RatecodeID": rng.choice([1.0, 2.0, 99.0, np.nan], n),
+        "store_and_fwd_flag": rng.choice(["N", "Y", None], n),
+        "PULocationID": rng.integers(1, 266, n).astype(np.int32),
+        "DOLocationID": rng.integers(1, 266, n).astype(np.int32),
+        "payment_type": rng.integers(0, 5, n).astype(np.int64),
+        "fare_amount": rng.normal(15, 30, n),
+        "total_amount": rng.normal(20, 40, n),
+    })
+    df.loc[[3, 40], "tpep_pickup_datetime"] = pd.NaT
+    return df
+
+
+def _assert_same_clean_frame(actual, expected):
+    assert list(actual.columns) == list(expected.columns)
+    assert len(actual) == len(expected)
+    for col in expected.columns:
+        a, e = actual[col], expected[col]
+        if isinstance(e.dtype, pd.CategoricalDtype):
+            assert a.astype(object).where(a.notna(), None).tolist() == \
+                e.astype(object).where(e.notna(), None).tolist(), col
+        else:
+            pd.testing.assert_series_equal(a, e, check_dtype=False, obj=col)
+
+
+@pytest.mark.parametrize("frame", ["raw_taxi_df", "typed_taxi_df"])
+def test_clean_taxi_data_matches_v1(frame, request):
+    df = request.getfixturevalue(frame)
+    original = df.copy()
+    _assert_same_clean_frame(clean_taxi_data(df), clean_taxi_data_v1(df))
+    pd.testing.assert_frame_equal(df, original)
+
+
+def test_clean_taxi_parquet_matches_clean_taxi_data(typed_taxi_df, tmp_path):
+    path = str(tmp_path / "yellow_tripdata_2024-01.parquet")
+    pq.write_table(pa.Table.from_pandas(typed_taxi_df, preserve_index=False), path, row_group_size=50)
+
+    expected = clean_taxi_data(typed_taxi_df)
+    _assert_same_clean_frame(clean_taxi_parquet(path, batch_size=30), expected)
+
+    output_path = str(tmp_path / "clean.parquet")
+    assert clean_taxi_parquet(path, batch_size=30, output_path=output_path) == len(expected)
@@ -0,0 +1,77 @@
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from snapshot_ingest import _dedup, ingest_snapshot_csvs, read_ingested_snapshots, read_snapshot_csv
+
+
+SNAPSHOT_HEADER = "timestamp,trip_id,route_id,stop_id,arrival_time,departure_time,arrival_delay,departure_delay"
+
+# snapshot time -> rows (trip_id, stop_id, delay); the same trips are polled again
+# and again, a late file is older than ones already ingested and two keys are missing
+SNAPSHOTS = {
+    "2025-11-07_12-43": [("T1", "101N", 0), ("T1", "102N", 30), ("T2", "201S", 0)],
+    "2025-11-07_12-44": [("T1", "102N", 60), ("T2", "201S", 10), ("", "301N", 5)],
+    "2025-11-07_23-59": [("T3", "301N", 0), ("T2", "", 0)],
+    "2025-11-08_00-01": [("T3", "301N", 20), ("T4", "401N", 0)],
+    "2025-11-08_00-02": [("T3", "301N", 40), ("T4", "401N", 0), ("", "301N", 7)],
+    "2025-11-07_12-40": [("T1", "101N", 99), ("T5", "501N", 0)],
+}
+
+
+def _write_snapshot(folder, stamp, rows):
+    lines = [SNAPSHOT_HEADER]
+    for trip_id, stop_id, delay in rows:
+        lines.append(f"2025-11-07 12:00:00,{trip_id},1,{stop_id},2025-11-07 12:10:00,"
+                     f"2025-11-07 12:10:30,{delay},{delay}")
+    path = os.path.join(folder, f"gtfs_data_{stamp}.csv")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+
+def _full_dedup(paths, dedup_keys):
+    # the old behaviour: every touched partition deduped as a whole
+    rows = pa.concat_tables([read_snapshot_csv(path) for path in paths]).to_pandas()
+    dates = rows["snapshot_timestamp"].dt.strftime("%Y-%m-%d")
+    return pd.concat([_dedup(part, dedup_keys) for _, part in rows.groupby(dates)])
+
+
+def _sorted(df):
+    df = df[["trip_id", "stop_id", "snapshot_timestamp", "arrival_delay"]].astype(
+        {"trip_id": object, "stop_id": object}
+    )
+    return df.sort_values(list(df.columns), na_position="first").reset_index(drop=True)
+
+
+@pytest.mark.parametrize("dedup_keys", [("trip_id", "stop_id"), None])
+def test_incremental_ingest_matches_full_dedup(tmp_path, dedup_keys):
+    folder, store_dir = tmp_path / "csv", str(tmp_path / "store")
+    folder.mkdir()
+
+    paths = []
+    for stamp, rows in SNAPSHOTS.items():
+        paths.append(_write_snapshot(folder, stamp, rows))
+        result = ingest_snapshot_csvs(str(folder), store_dir, dedup_keys=dedup_keys, max_workers=1)
+        assert result["new_files"] == 1
+
+        stored = read_ingested_snapshots(store_dir)
+        pd.testing.assert_frame_equal(_sorted(stored), _sorted(_full_dedup(paths, dedup_keys)))
+
+    assert ingest_snapshot_csvs(str(folder), store_dir, dedup_keys=dedup_keys)["new_files"] == 0
+
+
+def test_late_snapshot_does_not_replace_newer_rows(tmp_path):
+    folder, store_dir = tmp_path / "csv", str(tmp_path / "store")
+    folder.mkdir()
+    _write_snapshot(folder, "2025-11-07_12-44", [("T1", "101N", 60)])
+    ingest_snapshot_csvs(str(folder), store_dir, max_workers=1)
+    _write_snapshot(folder, "2025-11-07_12-43", [("T1", "101N", 30), ("T9", "901N", 0)])
+    result = ingest_snapshot_csvs(str(folder), store_dir, max_workers=1)
+
+    assert result["rows_stored"] == 1
+    stored = read_ingested_snapshots(store_dir).set_index("trip_id")
+    assert stored.loc["T1", "arrival_delay"] == 60
+    assert len(stored) == 2
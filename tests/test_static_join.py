@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from static_join import StaticJoinEngine, write_static_parquet
+
+
+@pytest.fixture
+def static_tables():
+    stop_times = pd.DataFrame({
+        "trip_id": ["T1"] * 4 + ["T2"] * 3 + ["T3"] * 2,
+        "stop_id": ["101N", "102N", "999N", "103N", "103N", "102N", "101N", "101N", "999N"],
+        "stop_sequence": [1, 2, 3, 4, 3, 1, 2, 1, 2],
+        "arrival_time": pd.to_timedelta(np.arange(9) * 90, unit="s"),
+        "departure_time": pd.to_timedelta(np.arange(9) * 90 + 30, unit="s"),
+    })
+    # 999N has no stop row, so no coordinates; T3 is missing from trips
+    stops = pd.DataFrame({
+        "stop_id": ["101N", "102N", "103N"],
+        "stop_lat": [40.75, 40.71, 40.70],
+        "stop_lon": [-73.98, -74.00, -73.80],
+    })
+    trips = pd.DataFrame({"trip_id": ["T1", "T2"], "route_id": ["1", "A"], "direction_id": [0, 1]})
+    routes = pd.DataFrame({"route_id": ["1", "A"], "is_express": [0, 1], "corridor_count": [2, 1]})
+    return {"stop_times": stop_times, "stops": stops, "trips": trips, "routes": routes}
+
+
+def _notebook_static_merged_df(tables):
+    # the notebook: pandas joins, groupby shift(-1), is_last_stop from dest_lat.isna()
+    df = (tables["stop_times"]
+          .merge(tables["stops"], on="stop_id", how="left")
+          .merge(tables["trips"], on="trip_id", how="left")
+          .merge(tables["routes"], on="route_id", how="left"))
+    df = df.sort_values(["trip_id", "stop_sequence"]).reset_index(drop=True)
+    df["dest_lat"] = df.groupby("trip_id")["stop_lat"].shift(-1)
+    df["dest_lon"] = df.groupby("trip_id")["stop_lon"].shift(-1)
+    df["is_last_stop"] = df["dest_lat"].isna().astype(int)
+    df["dest_lat"] = df["dest_lat"].fillna(df.groupby("trip_id")["stop_lat"].transform("last"))
+    df["dest_lon"] = df["dest_lon"].fillna(df.groupby("trip_id")["stop_lon"].transform("last"))
+    return df
+
+
+def test_static_join_matches_notebook(static_tables, tmp_path):
+    paths = write_static_parquet(static_tables, str(tmp_path))
+    with StaticJoinEngine(paths) as engine:
+        actual = engine.to_pandas(batch_size=4)
+    expected = _notebook_static_merged_df(static_tables)
+
+    assert len(actual) == len(expected)
+    for col in ["trip_id", "stop_id", "stop_sequence", "arrival_time", "route_id",
+                "stop_lat", "dest_lat", "dest_lon", "is_last_stop", "is_express"]:
+        pd.testing.assert_series_equal(
+            actual[col].astype(object), expected[col].astype(object), check_dtype=False
+        )
+    # the stop before 999N counts as a last stop, as in the notebook
+    assert actual["is_last_stop"].tolist() == [0, 1, 0, 1, 0, 0, 1, 1, 1]
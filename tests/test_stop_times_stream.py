@@ -0,0 +1,68 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+import pytest
+
+import data_loader
+from feature_engineering_v2 import extract_stop_times_features
+from preprocessing import clean_stop_times_data
+from stop_times_stream import iter_trip_aligned_chunks, stream_stop_times_to_parquet
+
+
+@pytest.fixture
+def stop_times_path(tmp_path):
+    """40 trips of 12 stops, with a duplicated stop, blank times and a row without a trip_id."""
+    lines = ["trip_id,arrival_time,departure_time,stop_id,stop_sequence"]
+    for trip in range(40):
+        trip_id = f"AFA23GEN-{1000 + trip}-00-Weekday-00_{trip * 600:06d}_1..{'NS'[trip % 2]}0{trip % 10}R"
+        for seq in range(12):
+            t = 6 * 3600 + trip * 600 + seq * 90
+            arrival = f"{t // 3600:02d}:{t // 60 % 60:02d}:{t % 60:02d}"
+            if (trip, seq) == (3, 5):
+                arrival = ""
+            lines.append(f"{trip_id},{arrival},{arrival},{trip}{seq:02d}N,{seq + 1}")
+        if trip == 7:
+            lines.append(lines[-1])
+        if trip == 20:
+            lines.append(f",07:00:00,07:00:00,999N,1")
+    path = tmp_path / "stop_times.txt"
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def _read_whole(path):
+    convert_options, time_columns = data_loader.gtfs_csv_convert_options(
+        path, "stop_times", id_type=pa.string()
+    )
+    table = data_loader.parse_gtfs_time_columns(
+        pacsv.read_csv(path, convert_options=convert_options), time_columns
+    )
+    return table.to_pandas(types_mapper=data_loader.GTFS_PANDAS_TYPES.get)
+
+
+def test_chunks_keep_trips_whole(stop_times_path):
+    chunks = list(iter_trip_aligned_chunks(stop_times_path, block_size=1 << 10))
+    assert len(chunks) > 5
+    seen = set()
+    for chunk in chunks:
+        trips = set(chunk["trip_id"].dropna())
+        assert seen.isdisjoint(trips)
+        seen |= trips
+    assert sum(len(chunk) for chunk in chunks) == len(_read_whole(stop_times_path))
+
+
+def test_stream_matches_in_memory(stop_times_path, tmp_path):
+    output_path = str(tmp_path / "stop_times.parquet")
+    rows = stream_stop_times_to_parquet(stop_times_path, output_path, block_size=1 << 10)
+
+    expected = extract_stop_times_features(clean_stop_times_data(_read_whole(stop_times_path)))
+    streamed = pq.read_table(output_path).to_pandas()
+
+    assert rows == len(expected) == 40 * 12
+    pd.testing.assert_frame_equal(
+        streamed.reset_index(drop=True),
+        expected.reset_index(drop=True),
+        check_dtype=False,
+        check_categorical=False,
+    )
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from preprocessing import string_nan_values
+from utils import replace_string_nans
+
+
+def _frame():
+    return pd.DataFrame({
+        "stop_id": pd.Categorical(["101N", "nan", "102S", "", "101N", None]),
+        "route_id": pd.Categorical([1, 2, 3, 1, 2, 3]),
+        "stop_name": ["Times Sq", "n/a", "none", "Fulton", " ", None],
+        "stop_desc": pd.array(["a", "unknown", "b", "c", "null", None], dtype="string"),
+        "stop_lat": [40.7, np.nan, 40.6, 40.5, 40.4, 40.3],
+    })
+
+
+def _as_object(df):
+    return df.astype(object).where(df.notna(), None).values.tolist()
+
+
+def test_replace_string_nans_matches_replace():
+    df = _frame()
+    expected = df.astype(object).replace(string_nan_values, None)
+    actual = replace_string_nans(_frame(), string_nan_values)
+
+    assert _as_object(actual) == _as_object(expected)
+    assert actual["stop_id"].cat.categories.tolist() == ["101N", "102S"]
+    assert actual["route_id"].dtype == df["route_id"].dtype
+
+
+def test_replace_string_nans_non_missing_replacement():
+    actual = replace_string_nans(_frame(), ["nan", "", "n/a"], "MISSING")
+    assert actual["stop_id"].astype(object).tolist()[:4] == ["101N", "MISSING", "102S", "MISSING"]
+    assert actual["stop_name"].tolist()[1] == "MISSING"
@@ -1,6 +1,97 @@
+import contextlib
 from config import *
 import pandas as pd
 
+
+# pandas 3 always copies on write; older versions need the option
+_COPY_ON_WRITE_OPTION = int(pd.__version__.split(".")[0]) < 3
+_PIPELINE_STATE = {"inplace": False}
+
+
+@contextlib.contextmanager
+def pipeline_mode(inplace=True):
+    """
+    Copy-free mode for the preprocessing / feature functions (opt-in).
+
+    Inside the block, functions that start from maybe_copy(df) work on the frame they
+    are given instead of a full copy, and copy-on-write is switched on, so chaining
+    clean_* and extract_* functions no longer keeps several copies of each table.
+    The input frames may be modified: pass frames you don't need afterwards.
+
+    Parameters
+    ----------
+    inplace : skip the defensive copies (by default true)
+
+    Example
+    -------
+    with pipeline_mode():
+        stops_df = extract_stops_features(clean_stops_data(stops_df))
+    """
+    previous = _PIPELINE_STATE["inplace"]
+    previous_cow = pd.options.mode.copy_on_write if _COPY_ON_WRITE_OPTION else None
+    _PIPELINE_STATE["inplace"] = inplace
+    if _COPY_ON_WRITE_OPTION and inplace:
+        pd.options.mode.copy_on_write = True
+    try:
+        yield
+    finally:
+        _PIPELINE_STATE["inplace"] = previous
+        if _COPY_ON_WRITE_OPTION:
+            pd.options.mode.copy_on_write = previous_cow
+
+
+def maybe_copy(df):
+    """df itself inside pipeline_mode(), otherwise a copy of it."""
+    return df if _PIPELINE_STATE["inplace"] else df.copy()
+
+
+def _remove_placeholder_categories(series, values, na_value):
+    categories = series.cat.categories
+    placeholders = categories[categories.isin(values)]
+    if len(placeholders) == 0:
+        return series
+    was_placeholder = series.isin(placeholders)
+    series = series.cat.remove_categories(placeholders)
+    if not pd.isna(na_value):
+        if na_value not in series.cat.categories:
+            series = series.cat.add_categories([na_value])
+        series = series.mask(was_placeholder, na_value)
+    return series
+
+
+def replace_string_nans(df, values, na_value=pd.NA):
+    """
+    Replace the placeholder strings in values (e.g. preprocessing.string_nan_values)
+    by na_value, like df.replace(values, na_value), but only text columns are
+    scanned, each with one isin set lookup, and only columns that contain a
+    placeholder are rewritten. In categorical columns (load_GTF_static_data_v3) only
+    the categories are looked up: placeholder categories are removed, so their rows
+    become missing (or na_value when it is not a missing value).
+
+    Parameters
+    ----------
+    df : pd.DataFrame, modified in place
+
+    values : placeholder strings
+
+    na_value : replacement (by default pd.NA)
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    values = list(set(values))
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = _remove_placeholder_categories(df[col], values, na_value)
+            continue
+        if df[col].dtype != object and not isinstance(df[col].dtype, pd.StringDtype):
+            continue
+        placeholders = df[col].isin(values)
+        if placeholders.any():
+            df[col] = df[col].mask(placeholders, na_value)
+    return df
+
 def convert_cols_to_datatime(df, col_names:list, time_delta=False):
     """
 
@@ -17,7 +108,7 @@ def convert_cols_to_datatime(df, col_names:list, time_delta=False):
     pd.Dataframe 
 
     """
-    df = df.copy()
+    df = maybe_copy(df)
 
     for col in col_names:
         if col in df.columns : 
@@ -52,7 +143,7 @@ def convert_id_columns_to_str(df: pd.DataFrame) -> pd.DataFrame:
     pd.DataFrame
         A copy of the DataFrame with all '_id' columns converted to strings.
     """
-    df = df.copy()
+    df = maybe_copy(df)
     id_cols = [col for col in df.columns if col.lower().endswith('_id')]
 
     for col in id_cols:
@@ -60,6 +151,37 @@ def convert_id_columns_to_str(df: pd.DataFrame) -> pd.DataFrame:
     
     return df
 
+def encode_id_columns(df: pd.DataFrame, registry, add=True) -> pd.DataFrame:
+    """
+    Replaces the trip_id / stop_id / route_id / service_id (and parent_station) columns
+    with stable int32 codes from an id_registry.IdRegistry, instead of the object strings
+    of convert_id_columns_to_str. The code columns are named <column>_code (trip_id_code,
+    ...). Joins and groupbys then run on int32 keys; decode with decode_id_columns at
+    the output.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+
+    registry : id_registry.IdRegistry shared by every frame that will be joined
+
+    add : register ids the registry has not seen yet (by default true); otherwise they become -1
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    return registry.encode_frame(df, add=add)
+
+
+def decode_id_columns(df: pd.DataFrame, registry) -> pd.DataFrame:
+    """
+    Turns the <column>_code columns written by encode_id_columns back into
+    (categorical) id columns.
+    """
+    return registry.decode_frame(df)
+
+
 def drop_id_cols(df): 
     """
     drops all the columns that ends with '_id' in the given df 
@@ -68,7 +190,7 @@ def drop_id_cols(df):
     ----------
     df : the dataframe 
     """
-    df_copy = df.copy()
+    df_copy = maybe_copy(df)
     for col in df_copy.columns :
         if col.endswith('_id'):
             df_copy = df_copy.drop(columns=[f'{col}_id'])